@@ -0,0 +1,279 @@
+"""
+Offline check of the chaos agent fast path against an in-process SQS queue
+and DynamoDB table stand-in.
+
+  python benchmarks/agent_standin.py
+
+Runs chaos_agent.run() on a thread, exactly as the systemd service runs it on
+an instance, and drives the scenario handlers through it. The agent's
+allow-list has the real scenario names but stand-in commands (echo and
+exit), so nothing touches the local disk or CPU. Checks that:
+
+  - fill_disk, reset_disk (immutable file) and kill_and_restart go through
+    the agent ("via": "agent") with the same responses as over SSM
+  - a scenario outside the allow-list is rejected by the agent
+  - a stale heartbeat makes the handler use SSM straight away
+  - an agent that never picks a request up makes the handler take it back
+    and use SSM, and the agent skips the request when it does get to it
+
+SSM is a stub that answers every command with Success. Exits 1 on any
+mismatch.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+from botocore.exceptions import ClientError
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAYER_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda_functions', 'shared', 'python')
+
+INSTANCE_ID = 'i-0standin000000000'
+QUEUE_PREFIX = 'https://sqs.us-east-1.amazonaws.com/123456789012/workshop-agent-'
+INSTANCE_ARN_PREFIX = 'arn:aws:ec2:us-east-1:123456789012:instance/'
+TABLE = 'workshop-chaos-agent'
+
+# Scenario -> stand-in command, and the fields its response must carry
+CASES = {
+    'fill_disk': (
+        "echo '/dev/nvme0n1p1   30G   27G  3.0G  90% /'",
+        {'success': True, 'via': 'agent', 'disk_status': '/dev/nvme0n1p1   30G   27G  3.0G  90% /\n'}
+    ),
+    'reset_disk': (
+        "echo \"rm: cannot remove '/var/tmp/filler_corrupt.dat': Operation not permitted\"",
+        {'success': False, 'via': 'agent', 'requires_escalation': True}
+    ),
+    'kill_and_restart': (
+        "printf 'cpu_busy_percent=2\\nstress_ng_running=0\\n'",
+        {'success': True, 'via': 'agent', 'rung': 'kill', 'recovered': True}
+    )
+}
+
+
+def client_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class QueueStandin:
+    """The SQS calls the agent and chaos_runner make, on in-memory queues."""
+
+    def __init__(self):
+        self.queues = {}
+        self.condition = threading.Condition()
+
+    def create_queue(self, QueueName, Attributes=None):
+        url = QUEUE_PREFIX.rsplit('/', 1)[0] + '/' + QueueName
+        with self.condition:
+            self.queues.setdefault(url, deque())
+        return {'QueueUrl': url}
+
+    def send_message(self, QueueUrl, MessageBody):
+        with self.condition:
+            if QueueUrl not in self.queues:
+                raise client_error('AWS.SimpleQueueService.NonExistentQueue', 'SendMessage')
+            self.queues[QueueUrl].append(MessageBody)
+            self.condition.notify_all()
+        return {'MessageId': uuid.uuid4().hex}
+
+    def receive_message(self, QueueUrl, WaitTimeSeconds=0, MaxNumberOfMessages=1):
+        deadline = time.monotonic() + WaitTimeSeconds
+        with self.condition:
+            while not self.queues[QueueUrl] and time.monotonic() < deadline:
+                self.condition.wait(deadline - time.monotonic())
+            if not self.queues[QueueUrl]:
+                return {}
+            body = self.queues[QueueUrl].popleft()
+        return {'Messages': [{'Body': body, 'ReceiptHandle': uuid.uuid4().hex}]}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        return {}
+
+    def delete_queue(self, QueueUrl):
+        with self.condition:
+            if self.queues.pop(QueueUrl, None) is None:
+                raise client_error('AWS.SimpleQueueService.NonExistentQueue', 'DeleteQueue')
+        return {}
+
+
+class TableStandin:
+    """get_item and put_item (with attribute_not_exists conditions) on one table."""
+
+    def __init__(self):
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        with self.lock:
+            item = self.items.get(Key['id']['S'])
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, TableName, Item, ConditionExpression=None):
+        with self.lock:
+            if ConditionExpression == 'attribute_not_exists(id)' and Item['id']['S'] in self.items:
+                raise client_error('ConditionalCheckFailedException', 'PutItem')
+            self.items[Item['id']['S']] = dict(Item)
+        return {}
+
+
+class SSMStub:
+    """Answers every command with Success, and counts them."""
+
+    def __init__(self):
+        self.sent = 0
+
+    def send_command(self, **kwargs):
+        self.sent += 1
+        return {'Command': {'CommandId': f'ssm-{self.sent}'}}
+
+    def get_command_invocation(self, CommandId, InstanceId):
+        return {'Status': 'Success', 'StandardOutputContent': 'ok via ssm', 'StandardErrorContent': ''}
+
+
+class Agent:
+    """chaos_agent.run() on a thread, stoppable."""
+
+    def __init__(self, chaos_agent, sqs, dynamodb, config):
+        self.args = (sqs, dynamodb, config)
+        self.chaos_agent = chaos_agent
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        sqs, dynamodb, config = self.args
+        queue_url = sqs.create_queue(QueueName=config['queue_prefix'] + INSTANCE_ID)['QueueUrl']
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self.chaos_agent.run,
+            args=(sqs, dynamodb, config, INSTANCE_ID, queue_url),
+            kwargs={'should_stop': self.stop_event.is_set},
+            daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def wait_for(predicate, seconds=5):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def mismatches(response, expected):
+    return {k: response.get(k) for k, v in expected.items() if response.get(k) != v}
+
+
+def check():
+    os.environ.update({
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'CHAOS_AGENT': 'on',
+        'CHAOS_AGENT_TABLE': TABLE,
+        'CHAOS_QUEUE_PREFIX': QUEUE_PREFIX,
+        'INSTANCE_ARN_PREFIX': INSTANCE_ARN_PREFIX,
+        'CHAOS_AGENT_PICKUP_SECONDS': '0.5'
+    })
+    for key in ('INSTANCE_INDEX_TABLE', 'WARM_POOL_TABLE', 'BAKED_AMI_PARAMETER', 'COMMAND_TOPIC_ARN'):
+        os.environ.pop(key, None)
+    sys.path.insert(0, LAYER_DIR)
+
+    from workshop_common import chaos_agent
+    from workshop_common.clients import set_client_factory
+    from workshop_common.commands import SCENARIO_COMMANDS
+    from workshop_common.handlers import kill_and_restart
+    from workshop_common.scenarios import run_scenario
+
+    sqs, table, ssm = QueueStandin(), TableStandin(), SSMStub()
+    fakes = {'sqs': sqs, 'dynamodb': table, 'ssm': ssm, 'ec2': object(), 'cloudwatch': object()}
+    set_client_factory(lambda service, **kwargs: fakes[service])
+
+    config = {
+        'region': 'us-east-1',
+        'table': TABLE,
+        'queue_prefix': QUEUE_PREFIX.rsplit('/', 1)[-1],
+        'instance_arn_prefix': INSTANCE_ARN_PREFIX,
+        'long_poll_seconds': 0.2,
+        'scenarios': {name: CASES.get(name, ('true',))[0] for name in SCENARIO_COMMANDS}
+    }
+    agent = Agent(chaos_agent, sqs, table, config)
+    event = {'username': 'standin', 'instance_id': INSTANCE_ID}
+
+    def handle(name):
+        if name == 'kill_and_restart':
+            return kill_and_restart.lambda_handler(dict(event), None)
+        return run_scenario(name, dict(event), None)
+
+    instance_arn = INSTANCE_ARN_PREFIX + INSTANCE_ID
+    heartbeat_id = chaos_agent.heartbeat_key(instance_arn)['id']['S']
+    failures = []
+    quiet = open(os.devnull, 'w')
+    stdout, sys.stdout = sys.stdout, quiet
+    try:
+        agent.start()
+        if not wait_for(lambda: table.get_item(TableName=TABLE, Key=chaos_agent.heartbeat_key(instance_arn))):
+            failures.append('agent never heartbeated')
+
+        # Known scenarios through the agent
+        for name, (_, expected) in CASES.items():
+            response = handle(name)
+            if mismatches(response, expected):
+                failures.append(f"{name}: {mismatches(response, expected)} in {response}")
+        if ssm.sent:
+            failures.append(f'{ssm.sent} command(s) went to SSM while the agent was healthy')
+
+        # Anything outside the allow-list is refused by the agent itself
+        request_id = uuid.uuid4().hex
+        sqs.send_message(
+            QueueUrl=QUEUE_PREFIX + INSTANCE_ID,
+            MessageBody=json.dumps({'request_id': request_id, 'scenario': 'rm_rf_root'})
+        )
+        key = chaos_agent.result_key(instance_arn, request_id)
+        done = wait_for(lambda: table.get_item(TableName=TABLE, Key=key).get('Item', {}).get('status') == {'S': 'Failed'})
+        stderr = table.get_item(TableName=TABLE, Key=key).get('Item', {}).get('stderr', {}).get('S')
+        if not done or stderr != 'Scenario not allowed: rm_rf_root':
+            failures.append(f'disallowed scenario: {table.get_item(TableName=TABLE, Key=key)}')
+
+        # A stale heartbeat goes straight to SSM
+        agent.stop()
+        with table.lock:
+            table.items[heartbeat_id]['heartbeat_at'] = {'N': str(int(time.time()) - 600)}
+        response = handle('fill_disk')
+        if response.get('via') != 'ssm' or not response.get('success') or ssm.sent != 1:
+            failures.append(f'stale heartbeat: {response}')
+
+        # A hung agent (fresh heartbeat, nothing polling) is taken back after
+        # the pickup window; the agent skips the request once it gets to it
+        with table.lock:
+            table.items[heartbeat_id]['heartbeat_at'] = {'N': str(int(time.time()))}
+        response = handle('fill_disk')
+        abandoned = [k for k, v in table.items.items() if v.get('status') == {'S': 'Abandoned'}]
+        if response.get('via') != 'ssm' or ssm.sent != 2 or len(abandoned) != 1:
+            failures.append(f'pickup timeout: {response}, abandoned={abandoned}')
+        agent.start()
+        wait_for(lambda: not sqs.queues[QUEUE_PREFIX + INSTANCE_ID])
+        time.sleep(0.3)
+        agent.stop()
+        if abandoned and table.items[abandoned[0]].get('status') != {'S': 'Abandoned'}:
+            failures.append(f'agent ran an abandoned request: {table.items[abandoned[0]]}')
+    finally:
+        sys.stdout = stdout
+        quiet.close()
+        set_client_factory(None)
+
+    if failures:
+        print('Chaos agent check failed:\n  ' + '\n  '.join(failures))
+        return 1
+    print(f"Chaos agent OK ({len(CASES)} scenarios via the agent, allow-list enforced, SSM fallback on stale and hung agents)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(check())
@@ -0,0 +1,158 @@
+"""
+Fill-to-alarm latency for a deployed workshop.
+
+Unlike the other benchmarks this one runs against real AWS: it needs
+credentials for the workshop account and a provisioned instance for
+--username. Each round:
+
+  1. invokes the trigger action (fill_disk, or spike_cpu with --scenario cpu)
+     through the dispatcher and notes when it returned
+  2. polls describe_alarm_history for the user's alarm until it changes to ALARM
+  3. invokes the recovery action (reset_disk, or kill_and_restart) and waits
+     for the alarm to return to OK before the next round
+
+Reported per round, in seconds after the trigger (or recovery) returned:
+
+  alarm_s      the alarm's transition to ALARM (what the SNS alert follows)
+  datapoint_s  the start of the breaching datapoint's period, i.e. how stale the
+               evaluated data was; negative values mean the datapoint's
+               period began before the trigger returned
+  ok_s         the alarm's transition back to OK after recovery
+
+Compare TELEMETRY_MODE=standard and low_latency deployments with the same
+--rounds to see where the time goes.
+
+Usage:
+  python benchmarks/alarm_latency.py --username alice --rounds 3
+  python benchmarks/alarm_latency.py --username alice --scenario cpu --function workshop-dispatcher
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import boto3
+
+# Scenario -> (trigger action, recovery action, alarm name suffix)
+SCENARIOS = {
+    'disk': ('fill_disk', 'reset_disk', 'disk-high'),
+    'cpu': ('spike_cpu', 'kill_and_restart', 'cpu-high')
+}
+
+POLL_SECONDS = 1
+
+
+def invoke(lambda_client, function_name, action, username):
+    response = lambda_client.invoke(
+        FunctionName=function_name,
+        Payload=json.dumps({'action': action, 'username': username}).encode()
+    )
+    result = json.loads(response['Payload'].read())
+    if not result.get('success') and not result.get('requires_escalation'):
+        raise RuntimeError(f"{action} failed: {result.get('error', result)}")
+    return datetime.now(timezone.utc)
+
+
+def wait_for_state(cloudwatch, alarm_name, state, since, timeout):
+    """First history entry at or after `since` moving alarm_name to `state`, as (time, history data)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        history = cloudwatch.describe_alarm_history(
+            AlarmName=alarm_name,
+            HistoryItemType='StateUpdate',
+            StartDate=since,
+            ScanBy='TimestampAscending'
+        )['AlarmHistoryItems']
+        for item in history:
+            data = json.loads(item['HistoryData'])
+            if data.get('newState', {}).get('stateValue') == state:
+                return item['Timestamp'], data
+        time.sleep(POLL_SECONDS)
+    raise TimeoutError(f"{alarm_name} did not reach {state} within {timeout} s")
+
+
+def datapoint_time(history_data):
+    """Timestamp of the newest datapoint the alarm evaluated, if reported."""
+    datapoints = history_data.get('newState', {}).get('stateReasonData', {}).get('evaluatedDatapoints', [])
+    stamps = []
+    for datapoint in datapoints:
+        try:
+            stamps.append(datetime.fromisoformat(datapoint['timestamp']))
+        except (KeyError, ValueError):
+            continue
+    return max(stamps) if stamps else None
+
+
+def current_state(cloudwatch, alarm_name):
+    alarms = cloudwatch.describe_alarms(AlarmNames=[alarm_name])['MetricAlarms']
+    if not alarms:
+        raise RuntimeError(f"Alarm {alarm_name} not found")
+    return alarms[0]['StateValue']
+
+
+def run_round(lambda_client, cloudwatch, args, alarm_name):
+    trigger, recovery, _ = SCENARIOS[args.scenario]
+
+    triggered = invoke(lambda_client, args.function, trigger, args.username)
+    alarmed, data = wait_for_state(cloudwatch, alarm_name, 'ALARM', triggered, args.timeout)
+    datapoint = datapoint_time(data)
+
+    recovered = invoke(lambda_client, args.function, recovery, args.username)
+    ok, _ = wait_for_state(cloudwatch, alarm_name, 'OK', recovered, args.timeout)
+
+    return {
+        'alarm_s': round((alarmed - triggered).total_seconds(), 1),
+        'datapoint_s': round((datapoint - triggered).total_seconds(), 1) if datapoint else None,
+        'ok_s': round((ok - recovered).total_seconds(), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--username', required=True, help='workshop user with a running instance')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='disk')
+    parser.add_argument('--function', default='workshop-dispatcher', help='dispatcher function name')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--timeout', type=int, default=600, help='seconds to wait for each state change')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    lambda_client = boto3.client('lambda')
+    cloudwatch = boto3.client('cloudwatch')
+    _, recovery, suffix = SCENARIOS[args.scenario]
+    alarm_name = f"workshop-{args.username}-{suffix}"
+
+    # Start from OK so the first transition measured is the one we caused
+    if current_state(cloudwatch, alarm_name) == 'ALARM':
+        recovered = invoke(lambda_client, args.function, recovery, args.username)
+        wait_for_state(cloudwatch, alarm_name, 'OK', recovered, args.timeout)
+
+    rounds = []
+    for n in range(args.rounds):
+        result = run_round(lambda_client, cloudwatch, args, alarm_name)
+        rounds.append(result)
+        if not args.json:
+            print(f"round {n + 1}: alarm {result['alarm_s']} s, datapoint {result['datapoint_s']} s, "
+                  f"back to OK {result['ok_s']} s")
+
+    summary = {
+        metric: {
+            'median': statistics.median(values),
+            'max': max(values)
+        }
+        for metric in ('alarm_s', 'datapoint_s', 'ok_s')
+        for values in [[r[metric] for r in rounds if r[metric] is not None]]
+        if values
+    }
+    if args.json:
+        print(json.dumps({'alarm': alarm_name, 'rounds': rounds, 'summary': summary}, indent=2))
+    else:
+        for metric, stats in summary.items():
+            print(f"{metric:<12} median {stats['median']:>6.1f}  max {stats['max']:>6.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
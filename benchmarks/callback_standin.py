@@ -0,0 +1,184 @@
+"""
+Local stand-in for the n8n callback used by event-driven SSM commands.
+
+  python benchmarks/callback_standin.py --serve [--port 8787]
+      Runs an HTTP server that prints every JSON payload POSTed to it. Point
+      N8N_CALLBACK_URL at http://127.0.0.1:8787/ when running command_complete
+      locally.
+
+  python benchmarks/callback_standin.py
+      Offline check of the whole event-driven path against the stand-in:
+      a "wait": false call must send its command with an SNS notification
+      config, and SNS-shaped completion notifications for fill_disk,
+      reset_disk (immutable file), spike_cpu (failed) and kill_and_restart
+      (recovered by the kill, and escalated to a reboot) must reach the callback with the same responses the synchronous handlers
+      return. SSM and EC2 are answered by a botocore before-call stub, as in
+      cold_start.py. The first callback attempt gets HTTP 500, so the retry is
+      exercised too. Exits 1 on any mismatch.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAYER_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda_functions', 'shared', 'python')
+
+INSTANCE_ID = 'i-0standin000000000'
+COMMAND_ID = '00000000-0000-4000-8000-000000000001'
+TOPIC_ARN = 'arn:aws:sns:us-east-1:123456789012:workshop-command-events'
+
+# Scenario, SSM invocation as get_command_invocation returns it, and the
+# fields the callback payload must carry
+CASES = [
+    ('fill_disk', {
+        'Status': 'Success',
+        'StandardOutputContent': '/dev/nvme0n1p1   30G   27G  3.0G  90% /'
+    }, {'success': True, 'disk_status': '/dev/nvme0n1p1   30G   27G  3.0G  90% /'}),
+    ('reset_disk', {
+        'Status': 'Success',
+        'StandardOutputContent': "rm: cannot remove '/var/tmp/filler_corrupt.dat': Operation not permitted"
+    }, {'success': False, 'requires_escalation': True}),
+    ('spike_cpu', {
+        'Status': 'Failed',
+        'StandardErrorContent': 'stress-ng: command not found'
+    }, {'success': False, 'error': 'Command Failed: stress-ng: command not found'}),
+    ('kill_and_restart', {
+        'Status': 'Success',
+        'StandardOutputContent': 'cpu_busy_percent=2\nstress_ng_running=0\n'
+    }, {'success': True, 'rung': 'kill', 'actions': ['killed stress-ng']}),
+    ('kill_and_restart', {
+        'Status': 'Success',
+        'StandardOutputContent': 'cpu_busy_percent=97\nstress_ng_running=1\n'
+    }, {'success': True, 'rung': 'reboot', 'actions': ['killed stress-ng', 'rebooted instance']})
+]
+
+
+class Callback(BaseHTTPRequestHandler):
+    received = []
+    fail_remaining = 0
+    echo = False
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if Callback.fail_remaining > 0:
+            Callback.fail_remaining -= 1
+            self.send_response(500)
+            self.end_headers()
+            return
+        payload = json.loads(body)
+        Callback.received.append(payload)
+        if Callback.echo:
+            print(json.dumps(payload, indent=2), flush=True)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port):
+    Callback.echo = True
+    server = ThreadingHTTPServer(('127.0.0.1', port), Callback)
+    print(f"Listening on http://127.0.0.1:{port}/ (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def check():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Callback)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Callback.fail_remaining = 1
+
+    os.environ.update({
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'standin',
+        'AWS_SECRET_ACCESS_KEY': 'standin',
+        'N8N_CALLBACK_URL': f'http://127.0.0.1:{server.server_port}/webhook',
+        'COMMAND_TOPIC_ARN': TOPIC_ARN,
+        'COMMAND_NOTIFY_ROLE_ARN': 'arn:aws:iam::123456789012:role/workshop-ssm-notify'
+    })
+    for key in ('INSTANCE_INDEX_TABLE', 'WARM_POOL_TABLE', 'BAKED_AMI_PARAMETER'):
+        os.environ.pop(key, None)
+    sys.path.insert(0, LAYER_DIR)
+
+    import boto3
+    from botocore.awsrequest import AWSResponse
+
+    invocation = {}
+    sent = []
+
+    def stub(model, **kwargs):
+        responses = {
+            'DescribeInstances': {'Reservations': [{'Instances': [{'InstanceId': INSTANCE_ID}]}]},
+            'SendCommand': {'Command': {'CommandId': COMMAND_ID}},
+            'GetCommandInvocation': invocation
+        }
+        return AWSResponse(None, 200, {}, None), dict(responses.get(model.name, {}))
+
+    def record_send(params, **kwargs):
+        sent.append(params)
+
+    boto3.setup_default_session(region_name='us-east-1')
+    boto3.DEFAULT_SESSION.events.register('before-call', stub)
+    boto3.DEFAULT_SESSION.events.register('before-parameter-build.ssm.SendCommand', record_send)
+
+    from workshop_common.handlers import command_complete
+    from workshop_common.scenarios import async_comment, run_scenario
+
+    failures = []
+    quiet = open(os.devnull, 'w')
+    stdout, sys.stdout = sys.stdout, quiet
+    try:
+        dispatched = run_scenario('fill_disk', {'username': 'standin', 'wait': False}, None)
+        notification = sent[-1].get('NotificationConfig', {}) if sent else {}
+        if dispatched.get('status') != 'dispatched' or notification.get('NotificationArn') != TOPIC_ARN:
+            failures.append(f"wait=false: {dispatched}, NotificationConfig={notification}")
+
+        for name, output, expected in CASES:
+            invocation.clear()
+            invocation.update(output, Comment=async_comment(name, 'standin'))
+            before = len(Callback.received)
+            message = {'commandId': COMMAND_ID, 'instanceId': INSTANCE_ID, 'status': output['Status']}
+            command_complete.lambda_handler({'Records': [{'Sns': {'Message': json.dumps(message)}}]}, None)
+
+            payloads = Callback.received[before:]
+            payload = payloads[0] if len(payloads) == 1 else {}
+            mismatched = {k: payload.get(k) for k, v in expected.items() if payload.get(k) != v}
+            if len(payloads) != 1 or payload.get('action') != name or mismatched:
+                failures.append(f"{name}: got {payloads}")
+
+        # Commands without the event-driven comment are not posted
+        invocation.clear()
+        invocation.update({'Status': 'Success', 'Comment': ''})
+        before = len(Callback.received)
+        command_complete.lambda_handler({'command_id': COMMAND_ID, 'instance_id': INSTANCE_ID}, None)
+        if len(Callback.received) != before:
+            failures.append('synchronous command was posted to the callback')
+    finally:
+        sys.stdout = stdout
+        quiet.close()
+        server.shutdown()
+
+    if failures:
+        print('Event-driven completion check failed:\n  ' + '\n  '.join(failures))
+        return 1
+    print(f"Event-driven completion OK ({len(CASES)} scenarios delivered to the stand-in callback)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--serve', action='store_true', help='run the stand-in callback server')
+    parser.add_argument('--port', type=int, default=8787)
+    args = parser.parse_args()
+    return serve(args.port) if args.serve else check()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Cold-start benchmark for the workshop Lambda handlers.
+
+Each sample runs in a fresh Python process, like a new Lambda container, and
+measures for one handler module:
+
+  import_ms       importing lambda_function.py (includes any clients built at import)
+  client_ms       total time spent constructing boto3 clients, at import or first call
+  clients         number of clients constructed
+  first_call_ms   the first lambda_handler invocation (lazy client setup lands here)
+  warm_call_ms    a second invocation in the same process
+
+Runs offline: every AWS call is answered from canned responses by a botocore
+before-call hook, the same mechanism botocore's Stubber uses, so nothing is
+sent over the network and no credentials are needed. time.sleep is a no-op in
+the child so SSM poll delays don't drown out the setup cost being measured.
+
+Usage:
+  python benchmarks/cold_start.py                  # compare against baselines.json
+  python benchmarks/cold_start.py --update         # re-record baselines.json
+  python benchmarks/cold_start.py --handlers fill_disk provision --runs 9
+
+Exits 1 if any handler constructs more clients than its baseline, or if its
+median import_ms + first_call_ms exceeds the baseline by more than
+--tolerance (fraction) plus --slack-ms. Timings depend on the machine, so
+re-record baselines with --update when moving to a different one; the client
+count does not.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS_DIR = os.path.join(ROOT, 'lambda_functions')
+LAYER_DIR = os.path.join(FUNCTIONS_DIR, 'shared', 'python')
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# Handler directory -> event for its first call
+HANDLERS = {
+    'provision': {'username': 'bench'},
+    'teardown': {'username': 'bench'},
+    'fill_disk': {'username': 'bench'},
+    'reset_disk': {'username': 'bench'},
+    'spike_cpu': {'username': 'bench'},
+    'kill_and_restart': {'username': 'bench'},
+    'corrupt_disk': {'username': 'bench'},
+    'fix_corrupt_disk': {'username': 'bench'},
+    'dispatcher': {'action': 'fill_disk', 'username': 'bench'}
+}
+
+METRICS = ['import_ms', 'client_ms', 'clients', 'first_call_ms', 'warm_call_ms']
+
+# Canned responses by operation name; anything else gets {}
+STUB_RESPONSES = {
+    'DescribeInstances': {'Reservations': [{'Instances': [{
+        'InstanceId': 'i-0bench000000000000',
+        'State': {'Name': 'running'},
+        'PublicIpAddress': '192.0.2.10',
+        'Tags': [{'Key': 'workshop-user', 'Value': 'bench'}]
+    }]}]},
+    'SendCommand': {'Command': {'CommandId': '00000000-0000-4000-8000-000000000000'}},
+    'GetCommandInvocation': {'Status': 'Success', 'StandardOutputContent': 'ok', 'StandardErrorContent': ''},
+    'DescribeAlarms': {'MetricAlarms': []}
+}
+
+
+class FakeContext:
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:bench'
+
+    def get_remaining_time_in_millis(self):
+        return 60000
+
+
+def child(handler_name):
+    """Measure one handler in this (fresh) process and print the result as JSON."""
+    import boto3
+    from botocore.awsrequest import AWSResponse
+
+    def stub(model, **kwargs):
+        return AWSResponse(None, 200, {}, None), dict(STUB_RESPONSES.get(model.name, {}))
+
+    boto3.setup_default_session(region_name='us-east-1')
+    boto3.DEFAULT_SESSION.events.register('before-call', stub)
+
+    client_timings = []
+    make_client = boto3.session.Session.client
+
+    def timed_client(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return make_client(self, *args, **kwargs)
+        finally:
+            client_timings.append(time.perf_counter() - started)
+
+    boto3.session.Session.client = timed_client
+    time.sleep = lambda seconds: None
+
+    sys.path[:0] = [os.path.join(FUNCTIONS_DIR, handler_name), LAYER_DIR]
+    started = time.perf_counter()
+    import lambda_function
+    imported = time.perf_counter()
+
+    event = HANDLERS[handler_name]
+    lambda_function.lambda_handler(dict(event), FakeContext())
+    first = time.perf_counter()
+    lambda_function.lambda_handler(dict(event), FakeContext())
+    warm = time.perf_counter()
+
+    print(json.dumps({
+        'import_ms': round((imported - started) * 1000, 2),
+        'client_ms': round(sum(client_timings) * 1000, 2),
+        'clients': len(client_timings),
+        'first_call_ms': round((first - imported) * 1000, 2),
+        'warm_call_ms': round((warm - first) * 1000, 2)
+    }))
+
+
+def sample(handler_name):
+    env = dict(os.environ)
+    for key in ('INSTANCE_INDEX_TABLE', 'WARM_POOL_TABLE', 'BAKED_AMI_PARAMETER'):
+        env.pop(key, None)
+    env.update({
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'bench',
+        'AWS_SECRET_ACCESS_KEY': 'bench',
+        'PYTHONDONTWRITEBYTECODE': '1'
+    })
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', handler_name],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    # Handlers print progress; the measurement is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(handler_names, runs):
+    results = {}
+    for handler_name in handler_names:
+        samples = [sample(handler_name) for _ in range(runs)]
+        results[handler_name] = {
+            metric: round(statistics.median(s[metric] for s in samples), 2)
+            for metric in METRICS
+        }
+    return results
+
+
+def cold_ms(result):
+    return result['import_ms'] + result['first_call_ms']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--handlers', nargs='+', choices=sorted(HANDLERS), default=sorted(HANDLERS))
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per handler (median is reported)')
+    parser.add_argument('--update', action='store_true', help='write the results to baselines.json')
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--slack-ms', type=float, default=20.0)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return 0
+
+    results = measure(args.handlers, args.runs)
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as f:
+            baselines = json.load(f)
+
+    regressions = []
+    print(f"{'handler':<18} {'import':>8} {'clients':>12} {'first call':>11} {'warm':>7} {'cold':>8} {'baseline':>9}")
+    for handler_name, result in results.items():
+        baseline = baselines.get('handlers', {}).get(handler_name)
+        baseline_cold = f"{cold_ms(baseline):.1f}" if baseline else '-'
+        print(
+            f"{handler_name:<18} {result['import_ms']:>8.1f} "
+            f"{result['client_ms']:>7.1f} ({result['clients']}) "
+            f"{result['first_call_ms']:>11.1f} {result['warm_call_ms']:>7.1f} "
+            f"{cold_ms(result):>8.1f} {baseline_cold:>9}"
+        )
+        if baseline and (
+            result['clients'] > baseline['clients']
+            or cold_ms(result) > cold_ms(baseline) * (1 + args.tolerance) + args.slack_ms
+        ):
+            regressions.append(handler_name)
+
+    if args.update:
+        with open(BASELINES_PATH, 'w') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'runs': args.runs,
+                'handlers': {**baselines.get('handlers', {}), **results}
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baselines written to {BASELINES_PATH}")
+        return 0
+
+    if regressions:
+        print(f"Cold start regressed for: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
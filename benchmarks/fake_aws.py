@@ -0,0 +1,374 @@
+"""
+In-process fake EC2, SSM and CloudWatch for offline load simulation.
+
+FakeAWS holds the simulated state (instances, SSM commands, alarms) and hands
+out one fake client per service through client_factory, which plugs into
+workshop_common.clients.set_client_factory. Only the operations the handlers
+use are implemented; anything else raises NotImplementedError.
+
+Every call goes through FakeAWS.call, which:
+  - sleeps for the service's latency (mean +/- 50%, with per-operation overrides)
+  - applies a per-service token-bucket rate limit; throttled calls are retried
+    with exponential backoff like botocore's default (legacy) retry mode, and
+    raise once the attempts run out
+  - injects failures at a per-operation rate as non-retryable InternalFailure
+  - counts calls, throttles and failures under the calling thread's label
+    (set with FakeAWS.label, e.g. the action and attendee being run)
+"""
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict
+
+from botocore.exceptions import ClientError
+
+# Throttle error code per service
+THROTTLE_CODES = {
+    'ec2': 'RequestLimitExceeded',
+    'ssm': 'ThrottlingException',
+    'cloudwatch': 'Throttling'
+}
+
+DEFAULT_CONFIG = {
+    # Mean latency per service in seconds, and per "service.Operation" overrides
+    'latency': {'ec2': 0.12, 'ssm': 0.06, 'cloudwatch': 0.05},
+    'operation_latency': {'ec2.RunInstances': 0.8, 'ec2.TerminateInstances': 0.3},
+    # Token bucket per service: sustained requests/second and burst size
+    'rate_limits': {
+        'ec2': (20, 40),
+        'ssm': (20, 40),
+        'cloudwatch': (15, 30)
+    },
+    # "service.Operation" -> probability of a hard InternalFailure
+    'failure_rates': {},
+    # botocore legacy mode: 5 attempts in total, base 50 ms exponential backoff
+    'max_attempts': 5,
+    'retry_base_delay': 0.05,
+    # Simulated instance and command behavior, in seconds
+    'boot_seconds': 30,
+    'command_seconds': {
+        'fallocate': 4.0,
+        'rm -': 0.5,
+        'chattr -i': 0.6,
+        'stress-ng --cpu': 0.3,
+        # kill, settle and sample CPU
+        'pkill': 5.2
+    },
+    'default_command_seconds': 0.5
+}
+
+
+def throttled(service, operation):
+    return ClientError(
+        {'Error': {'Code': THROTTLE_CODES[service], 'Message': 'Rate exceeded'}},
+        operation
+    )
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class FakeAWS:
+    def __init__(self, config=None, seed=None):
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.buckets = {
+            service: TokenBucket(rate, burst)
+            for service, (rate, burst) in self.config['rate_limits'].items()
+        }
+        self.local = threading.local()
+
+        self.instances = {}
+        self.commands = {}
+        self.alarms = {}
+        self.ids = itertools.count(1)
+
+        # label -> "service.Operation" -> count
+        self.calls = defaultdict(lambda: defaultdict(int))
+        self.throttles = defaultdict(int)
+        self.failures = defaultdict(int)
+
+        self.clients = {
+            'ec2': FakeEC2(self),
+            'ssm': FakeSSM(self),
+            'cloudwatch': FakeCloudWatch(self)
+        }
+
+    def client_factory(self, service_name):
+        if service_name not in self.clients:
+            raise NotImplementedError(f'No fake for {service_name}')
+        return self.clients[service_name]
+
+    def label(self, name):
+        """Attribute this thread's subsequent calls to `name`."""
+        self.local.label = name
+
+    def call(self, service, operation, handler, **kwargs):
+        label = getattr(self.local, 'label', None)
+        key = f'{service}.{operation}'
+        with self.lock:
+            self.calls[label][key] += 1
+
+        for attempt in range(self.config['max_attempts']):
+            latency = self.config['operation_latency'].get(key, self.config['latency'].get(service, 0.05))
+            time.sleep(latency * self.random.uniform(0.5, 1.5))
+
+            bucket = self.buckets.get(service)
+            if bucket and not bucket.take():
+                with self.lock:
+                    self.throttles[label] += 1
+                if attempt + 1 == self.config['max_attempts']:
+                    raise throttled(service, operation)
+                time.sleep(self.random.uniform(0, self.config['retry_base_delay'] * 2 ** attempt))
+                continue
+
+            if self.random.random() < self.config['failure_rates'].get(key, 0):
+                with self.lock:
+                    self.failures[label] += 1
+                raise ClientError({'Error': {'Code': 'InternalFailure', 'Message': 'Injected failure'}}, operation)
+
+            with self.lock:
+                return handler(**kwargs)
+
+    def new_id(self, prefix):
+        return f'{prefix}-{next(self.ids):017x}'
+
+    def instance_state(self, instance):
+        if instance['state'] == 'pending' and time.monotonic() >= instance['ready_at']:
+            instance['state'] = 'running'
+        return instance['state']
+
+    def command_seconds(self, command):
+        for fragment, seconds in self.config['command_seconds'].items():
+            if fragment in command:
+                return seconds
+        return self.config['default_command_seconds']
+
+
+def tag_dict(tags):
+    return {t['Key']: t['Value'] for t in tags}
+
+
+def matches_filters(instance, filters):
+    for f in filters or []:
+        name, values = f['Name'], f['Values']
+        if name == 'instance-state-name':
+            if instance['state'] not in values:
+                return False
+        elif name.startswith('tag:'):
+            if instance['tags'].get(name[4:]) not in values:
+                return False
+        else:
+            raise NotImplementedError(f'Filter {name}')
+    return True
+
+
+class FakeService:
+    service = None
+    operations = {}
+
+    def __init__(self, aws):
+        self.aws = aws
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'meta':
+            # No botocore internals: metrics.instrument_client() skips fakes,
+            # the simulator counts their calls itself
+            raise AttributeError(name)
+        if name not in self.operations:
+            raise NotImplementedError(f'{self.service}.{name} is not faked')
+        handler = getattr(self, '_' + name)
+        return lambda **kwargs: self.aws.call(self.service, self.operations[name], handler, **kwargs)
+
+    def get_paginator(self, name):
+        return FakePaginator(getattr(self, name))
+
+
+class FakePaginator:
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        yield self.method(**kwargs)
+
+
+class FakeEC2(FakeService):
+    service = 'ec2'
+    operations = {
+        'describe_instances': 'DescribeInstances',
+        'run_instances': 'RunInstances',
+        'create_tags': 'CreateTags',
+        'terminate_instances': 'TerminateInstances',
+        'reboot_instances': 'RebootInstances'
+    }
+
+    def _describe(self, instance):
+        return {
+            'InstanceId': instance['id'],
+            'InstanceType': instance['type'],
+            'SubnetId': instance['subnet'],
+            'Placement': {'AvailabilityZone': 'us-east-1a'},
+            'State': {'Name': self.aws.instance_state(instance)},
+            'PublicIpAddress': instance['ip'],
+            'Tags': [{'Key': k, 'Value': v} for k, v in instance['tags'].items()],
+            'BlockDeviceMappings': [{'Ebs': {'VolumeId': instance['volume_id']}}]
+        }
+
+    def _describe_instances(self, InstanceIds=None, Filters=None):
+        if InstanceIds is not None:
+            missing = [i for i in InstanceIds if i not in self.aws.instances]
+            if missing:
+                raise ClientError(
+                    {'Error': {'Code': 'InvalidInstanceID.NotFound', 'Message': f'{missing} not found'}},
+                    'DescribeInstances'
+                )
+            candidates = [self.aws.instances[i] for i in InstanceIds]
+        else:
+            candidates = list(self.aws.instances.values())
+        for instance in candidates:
+            self.aws.instance_state(instance)
+        found = [self._describe(i) for i in candidates if matches_filters(i, Filters)]
+        return {'Reservations': [{'Instances': found}] if found else []}
+
+    def _run_instances(self, MinCount, MaxCount, InstanceType, SubnetId=None, TagSpecifications=(), **kwargs):
+        tags = {}
+        for spec in TagSpecifications:
+            if spec['ResourceType'] == 'instance':
+                tags.update(tag_dict(spec['Tags']))
+        launched = []
+        for _ in range(MaxCount):
+            instance_id = self.aws.new_id('i')
+            n = len(self.aws.instances) + 1
+            self.aws.instances[instance_id] = {
+                'id': instance_id,
+                'type': InstanceType,
+                'subnet': SubnetId,
+                'state': 'pending',
+                'ready_at': time.monotonic() + self.aws.config['boot_seconds'],
+                'tags': dict(tags),
+                'ip': f'198.51.{n // 250}.{n % 250 + 1}',
+                'volume_id': self.aws.new_id('vol'),
+                'files': set()
+            }
+            launched.append(self._describe(self.aws.instances[instance_id]))
+        return {'Instances': launched}
+
+    def _create_tags(self, Resources, Tags):
+        for resource in Resources:
+            if resource in self.aws.instances:
+                self.aws.instances[resource]['tags'].update(tag_dict(Tags))
+        return {}
+
+    def _terminate_instances(self, InstanceIds):
+        for instance_id in InstanceIds:
+            if instance_id in self.aws.instances:
+                self.aws.instances[instance_id]['state'] = 'terminated'
+        return {}
+
+    def _reboot_instances(self, InstanceIds):
+        for instance_id in InstanceIds:
+            instance = self.aws.instances[instance_id]
+            instance['state'] = 'pending'
+            instance['ready_at'] = time.monotonic() + self.aws.config['boot_seconds'] / 3
+        return {}
+
+
+class FakeSSM(FakeService):
+    service = 'ssm'
+    operations = {
+        'send_command': 'SendCommand',
+        'get_command_invocation': 'GetCommandInvocation'
+    }
+
+    def _send_command(self, InstanceIds, Parameters, **kwargs):
+        instance_id = InstanceIds[0]
+        instance = self.aws.instances.get(instance_id)
+        if not instance or self.aws.instance_state(instance) != 'running':
+            raise ClientError({'Error': {'Code': 'InvalidInstanceId', 'Message': 'Instance not online'}}, 'SendCommand')
+        command = Parameters['commands'][0]
+        command_id = self.aws.new_id('cmd')
+        self.aws.commands[command_id] = {
+            'instance_id': instance_id,
+            'command': command,
+            'done_at': time.monotonic() + self.aws.command_seconds(command),
+            'output': None
+        }
+        return {'Command': {'CommandId': command_id}}
+
+    def _get_command_invocation(self, CommandId, InstanceId):
+        command = self.aws.commands.get(CommandId)
+        if not command or command['instance_id'] != InstanceId:
+            raise ClientError({'Error': {'Code': 'InvocationDoesNotExist', 'Message': ''}}, 'GetCommandInvocation')
+        if time.monotonic() < command['done_at']:
+            return {'Status': 'InProgress', 'StandardOutputContent': '', 'StandardErrorContent': ''}
+        if command['output'] is None:
+            command['output'] = self._execute(self.aws.instances[InstanceId], command['command'])
+        status, stdout, stderr = command['output']
+        return {'Status': status, 'StandardOutputContent': stdout, 'StandardErrorContent': stderr}
+
+    def _execute(self, instance, command):
+        """Apply a scenario command's effect on the instance's filler files."""
+        files = instance['files']
+        stdout = ''
+        if 'stress-ng --cpu' in command:
+            instance['stressed'] = True
+        elif 'pkill' in command:
+            instance['stressed'] = False
+            return 'Success', 'cpu_busy_percent=2\nstress_ng_running=0\n', ''
+        if 'fallocate' in command and 'chattr +i' in command:
+            files.add('filler_corrupt.dat+i')
+        elif 'fallocate' in command:
+            files.add('filler.dat')
+        elif 'chattr -i' in command:
+            files.clear()
+        elif 'rm -' in command:
+            if 'filler_corrupt.dat+i' in files:
+                stdout = "rm: cannot remove '/var/tmp/filler_corrupt.dat': Operation not permitted\n"
+            files.discard('filler.dat')
+        used = 15 + 80 * len(files)
+        stdout += f'Filesystem      Size  Used Avail Use% Mounted on\n/dev/nvme0n1p1   30G   {used * 30 // 100}G  {30 - used * 30 // 100}G  {min(used, 100)}% /'
+        return 'Success', stdout, ''
+
+
+class FakeCloudWatch(FakeService):
+    service = 'cloudwatch'
+    operations = {
+        'put_metric_alarm': 'PutMetricAlarm',
+        'describe_alarms': 'DescribeAlarms',
+        'delete_alarms': 'DeleteAlarms'
+    }
+
+    def _put_metric_alarm(self, AlarmName, **kwargs):
+        self.aws.alarms[AlarmName] = kwargs
+        return {}
+
+    def _describe_alarms(self, AlarmNames=None, AlarmNamePrefix=None, **kwargs):
+        names = [
+            name for name in self.aws.alarms
+            if (AlarmNames is None or name in AlarmNames)
+            and (AlarmNamePrefix is None or name.startswith(AlarmNamePrefix))
+        ]
+        return {'MetricAlarms': [{'AlarmName': name} for name in names]}
+
+    def _delete_alarms(self, AlarmNames):
+        for name in AlarmNames:
+            self.aws.alarms.pop(name, None)
+        return {}
@@ -0,0 +1,300 @@
+"""
+Offline workshop load simulator.
+
+Replays a room of attendees against the real handlers (through the dispatcher)
+with the AWS clients swapped for the fakes in fake_aws.py. Each attendee runs
+the workshop script below with some think time between steps; --concurrency
+attendees are active at once.
+
+Time is virtual: time.sleep/monotonic/time are scaled by --time-scale, so a
+session with 30 s boots and 2 s SSM polls replays in a fraction of the wall
+time while every duration reported stays in simulated seconds.
+
+Reports per action: count, errors, p50/p95/p99 latency, AWS calls per
+successful invocation (by operation) and throttled attempts. Failed
+invocations usually stop early and make fewer calls, so they are left out of
+the per-invocation counts. With --check, exits 1 if any action's mean AWS
+calls per successful invocation exceeds its budget in api_budgets.json by
+more than --budget-tolerance, or if more than --max-error-rate of its
+invocations failed (--update-budgets re-records the budgets from this run).
+
+Usage:
+  python benchmarks/load_sim.py --attendees 300 --concurrency 100 --time-scale 0.05
+  python benchmarks/load_sim.py --attendees 50 --check
+  python benchmarks/load_sim.py --attendees 50 --alarm-mode fleet
+  python benchmarks/load_sim.py --failure-rate ssm.SendCommand=0.02 --rate-limit ec2=10,20
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAYER_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'lambda_functions', 'shared', 'python')
+BUDGETS_PATH = os.path.join(BENCHMARKS_DIR, 'api_budgets.json')
+
+# One attendee's session: (action, think time in seconds before the step)
+WORKSHOP_SCRIPT = [
+    ('provision', 0),
+    ('fill_disk', 60),
+    ('reset_disk', 90),
+    ('spike_cpu', 60),
+    ('kill_and_restart', 90),
+    ('teardown', 120)
+]
+
+# Lambda timeouts from lambda.tf, used for the fake context's remaining time
+TIMEOUTS = {'provision': 300}
+DEFAULT_TIMEOUT = 60
+
+_real_sleep = time.sleep
+_real_monotonic = time.monotonic
+_real_time = time.time
+
+
+class VirtualClock:
+    """Scales time.sleep, time.monotonic and time.time by `scale` (0.1 = 10x faster)."""
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.origin = _real_monotonic()
+        self.wall_origin = _real_time()
+
+    def monotonic(self):
+        return self.origin + (_real_monotonic() - self.origin) / self.scale
+
+    def time(self):
+        return self.wall_origin + (_real_monotonic() - self.origin) / self.scale
+
+    def sleep(self, seconds):
+        _real_sleep(max(seconds, 0) * self.scale)
+
+    def install(self):
+        time.monotonic = self.monotonic
+        time.time = self.time
+        time.sleep = self.sleep
+
+
+class FakeContext:
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:workshop-dispatcher'
+
+    def __init__(self, timeout):
+        self.deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(int((self.deadline - time.monotonic()) * 1000), 0)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_attendee(n, aws, dispatcher, results, think_scale, rng_seed):
+    rng = random.Random(rng_seed)
+    username = f'attendee{n:03d}'
+    for action, think in WORKSHOP_SCRIPT:
+        time.sleep(think * think_scale * rng.uniform(0.5, 1.5))
+        # One label per invocation, so calls can be split by outcome
+        invocation = (action, username)
+        aws.label(invocation)
+        context = FakeContext(TIMEOUTS.get(action, DEFAULT_TIMEOUT))
+        started = time.monotonic()
+        try:
+            response = dispatcher.lambda_handler({'action': action, 'username': username}, context)
+        except Exception as e:
+            response = {'success': False, 'error': f'Unhandled {type(e).__name__}: {e}'}
+        elapsed = time.monotonic() - started
+        results.append((action, invocation, elapsed, response))
+        if action == 'provision' and not response.get('success'):
+            # Nothing else can run without an instance
+            break
+
+
+def simulate(args):
+    # Handlers read their settings at import; point them at nothing real
+    for key in ('INSTANCE_INDEX_TABLE', 'WARM_POOL_TABLE', 'BAKED_AMI_PARAMETER'):
+        os.environ.pop(key, None)
+    os.environ.update({
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AMI_ID': 'ami-0sim',
+        'SUBNET_ID': 'subnet-0sim',
+        'SECURITY_GROUP_ID': 'sg-0sim',
+        'INSTANCE_PROFILE_ARN': 'arn:aws:iam::123456789012:instance-profile/sim',
+        'SNS_TOPIC_ARN': 'arn:aws:sns:us-east-1:123456789012:sim',
+        'ALARM_MODE': args.alarm_mode
+    })
+    sys.path.insert(0, LAYER_DIR)
+    sys.path.insert(0, BENCHMARKS_DIR)
+
+    from fake_aws import FakeAWS
+    from workshop_common import clients, dispatcher
+
+    config = {}
+    if args.rate_limit:
+        config['rate_limits'] = dict(FakeAWS().config['rate_limits'])
+        for item in args.rate_limit:
+            service, limits = item.split('=')
+            rate, burst = limits.split(',')
+            config['rate_limits'][service] = (float(rate), float(burst))
+    if args.failure_rate:
+        config['failure_rates'] = {k: float(v) for k, v in (item.split('=') for item in args.failure_rate)}
+    if args.boot_seconds is not None:
+        config['boot_seconds'] = args.boot_seconds
+
+    VirtualClock(args.time_scale).install()
+    aws = FakeAWS(config, seed=args.seed)
+    clients.set_client_factory(aws.client_factory)
+
+    # Handlers print every step; keep the report readable
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+
+    lock = threading.Lock()
+
+    class Results(list):
+        def append(self, item):
+            with lock:
+                super().append(item)
+
+    results = Results()
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(run_attendee, n, aws, dispatcher, results, args.think_scale, args.seed * 100003 + n)
+                for n in range(args.attendees)
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        if not args.verbose:
+            sys.stdout.close()
+            sys.stdout = sys.__stdout__
+    duration = time.monotonic() - started
+
+    return summarize(results, aws, duration)
+
+
+def summarize(results, aws, duration):
+    by_action = defaultdict(list)
+    for action, invocation, elapsed, response in results:
+        by_action[action].append((invocation, elapsed, response))
+
+    def total(counts, invocations):
+        return sum(counts.get(invocation, 0) for invocation in invocations)
+
+    report = {'simulated_seconds': round(duration, 1), 'actions': {}}
+    for action, _ in WORKSHOP_SCRIPT:
+        runs = by_action.get(action)
+        if not runs:
+            continue
+        latencies = [elapsed for _, elapsed, _ in runs]
+        errors = [r for _, _, r in runs if not r.get('success')]
+        succeeded = [invocation for invocation, _, r in runs if r.get('success')]
+        calls = defaultdict(int)
+        for invocation in succeeded:
+            for op, n in aws.calls.get(invocation, {}).items():
+                calls[op] += n
+        invocations = [invocation for invocation, _, _ in runs]
+        report['actions'][action] = {
+            'count': len(runs),
+            'errors': len(errors),
+            'p50_s': round(statistics.median(latencies), 3),
+            'p95_s': round(percentile(latencies, 0.95), 3),
+            'p99_s': round(percentile(latencies, 0.99), 3),
+            'calls_per_invocation': round(sum(calls.values()) / len(succeeded), 2) if succeeded else 0,
+            'calls_by_operation': {op: round(n / len(succeeded), 2) for op, n in sorted(calls.items())},
+            'throttled_attempts': total(aws.throttles, invocations),
+            'injected_failures': total(aws.failures, invocations),
+            'sample_errors': sorted({r.get('error', '')[:120] for r in errors})[:3]
+        }
+    return report
+
+
+def print_report(report):
+    print(f"Simulated session length: {report['simulated_seconds']} s")
+    print(f"{'action':<18} {'n':>5} {'err':>5} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'calls':>7} {'throttled':>10}")
+    for action, r in report['actions'].items():
+        print(
+            f"{action:<18} {r['count']:>5} {r['errors']:>5} {r['p50_s']:>8.2f} {r['p95_s']:>8.2f} "
+            f"{r['p99_s']:>8.2f} {r['calls_per_invocation']:>7.2f} {r['throttled_attempts']:>10}"
+        )
+    for action, r in report['actions'].items():
+        ops = ', '.join(f'{op} {n}' for op, n in r['calls_by_operation'].items())
+        print(f"  {action}: {ops}")
+        for error in r['sample_errors']:
+            print(f"    error: {error}")
+
+
+def check_budgets(report, update, tolerance, max_error_rate):
+    if update:
+        budgets = {action: r['calls_per_invocation'] for action, r in report['actions'].items()}
+        with open(BUDGETS_PATH, 'w') as f:
+            json.dump(budgets, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Budgets written to {BUDGETS_PATH}")
+        return 0
+
+    with open(BUDGETS_PATH) as f:
+        budgets = json.load(f)
+    over = [
+        f"{action}: {r['calls_per_invocation']} > {budgets[action]}"
+        for action, r in report['actions'].items()
+        if action in budgets and r['calls_per_invocation'] > budgets[action] * (1 + tolerance)
+    ]
+    # Failures would otherwise pass silently: they don't count towards the budgets
+    over += [
+        f"{action}: {r['errors']} of {r['count']} invocations failed"
+        for action, r in report['actions'].items()
+        if r['count'] and r['errors'] > r['count'] * max_error_rate
+    ]
+    if over:
+        print('AWS call budget check failed:\n  ' + '\n  '.join(over))
+        return 1
+    print('AWS call budgets OK')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--attendees', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=100, help='attendees active at once')
+    parser.add_argument('--time-scale', type=float, default=0.05, help='wall seconds per simulated second')
+    parser.add_argument('--think-scale', type=float, default=1.0, help='multiplier on think time between steps')
+    parser.add_argument('--boot-seconds', type=float, help='simulated instance boot time')
+    parser.add_argument('--rate-limit', action='append', metavar='SERVICE=RATE,BURST')
+    parser.add_argument('--failure-rate', action='append', metavar='service.Operation=P')
+    parser.add_argument('--alarm-mode', choices=['per_user', 'fleet'], default='per_user',
+                        help='ALARM_MODE for the handlers (api_budgets.json is recorded with per_user)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--check', action='store_true', help='fail if AWS calls per action exceed api_budgets.json')
+    parser.add_argument('--update-budgets', action='store_true', help='record this run as api_budgets.json')
+    parser.add_argument('--budget-tolerance', type=float, default=0.15,
+                        help='allowed fractional growth over the budget (poll counts vary run to run)')
+    parser.add_argument('--max-error-rate', type=float, default=0.05,
+                        help='with --check, fraction of an action\'s invocations allowed to fail')
+    parser.add_argument('--verbose', action='store_true', help="keep the handlers' own log output")
+    args = parser.parse_args()
+
+    report = simulate(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.check or args.update_budgets:
+        return check_budgets(report, args.update_budgets, args.budget_tolerance, args.max_error_rate)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+# -----------------------------------------------------------------------------
+# DynamoDB Tables for Workshop State
+# -----------------------------------------------------------------------------
+
+# Username -> instance ID index, written by provision and cleared by teardown.
+# Lets action handlers skip the describe_instances tag scan.
+resource "aws_dynamodb_table" "instance_index" {
+  name         = "${var.project_name}-instance-index"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "username"
+
+  attribute {
+    name = "username"
+    type = "S"
+  }
+
+  tags = {
+    Name    = "${var.project_name}-instance-index"
+    Project = var.project_name
+  }
+}
+
+# Warm pool of pre-booted instances waiting to be claimed by provision.
+# Claims are conditional updates on the status attribute.
+resource "aws_dynamodb_table" "warm_pool" {
+  name         = "${var.project_name}-warm-pool"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "instance_id"
+
+  attribute {
+    name = "instance_id"
+    type = "S"
+  }
+
+  tags = {
+    Name    = "${var.project_name}-warm-pool"
+    Project = var.project_name
+  }
+}
+
+# Capacity benchmark runs, kept per instance type for comparison across runs.
+# run_key is "<started_at>#<instance_id>", so queries return newest first.
+resource "aws_dynamodb_table" "benchmark_results" {
+  name         = "${var.project_name}-benchmark-results"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "instance_type"
+  range_key    = "run_key"
+
+  attribute {
+    name = "instance_type"
+    type = "S"
+  }
+
+  attribute {
+    name = "run_key"
+    type = "S"
+  }
+
+  tags = {
+    Name    = "${var.project_name}-benchmark-results"
+    Project = var.project_name
+  }
+}
+
+# Chaos agent heartbeats ("<instance ARN>#agent") and scenario results
+# ("<instance ARN>#result#<request ID>"); instances can only write keys under
+# their own ARN. Results are claimed with conditional puts by
+# whichever of the agent and the handler gets there first; both expire.
+resource "aws_dynamodb_table" "chaos_agent" {
+  name         = "${var.project_name}-chaos-agent"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "id"
+
+  attribute {
+    name = "id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name    = "${var.project_name}-chaos-agent"
+    Project = var.project_name
+  }
+}
+
+# Incident timeline: one item per user an injected incident hit
+# ("<incident ID>#<username>") with when it was injected, detected, responded
+# to and recovered, plus "open#<username>#<kind>" pointers to each user's open
+# incident. Partitioned by cohort (workshop tag) for the incidents report.
+resource "aws_dynamodb_table" "incidents" {
+  name         = "${var.project_name}-incidents"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "cohort"
+  range_key    = "incident_key"
+
+  attribute {
+    name = "cohort"
+    type = "S"
+  }
+
+  attribute {
+    name = "incident_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name    = "${var.project_name}-incidents"
+    Project = var.project_name
+  }
+}
+
+# Action leases: one item per attendee queueing their scenario actions, so
+# actions on one instance run in order while attendees stay parallel.
+# next_ticket/serving form the queue; holder and lease_expires_at are set
+# while an action runs, so a Lambda that dies mid-action only holds the
+# instance until its lease expires.
+resource "aws_dynamodb_table" "action_leases" {
+  name         = "${var.project_name}-action-leases"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "username"
+
+  attribute {
+    name = "username"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name    = "${var.project_name}-action-leases"
+    Project = var.project_name
+  }
+}
@@ -43,8 +43,12 @@ data "aws_iam_policy_document" "lambda_permissions" {
       "ec2:DescribeInstances",
       "ec2:DescribeInstanceStatus",
       "ec2:CreateTags",
+      "ec2:DeleteTags",
       "ec2:DescribeTags",
-      "ec2:RebootInstances"
+      "ec2:RebootInstances",
+      "ec2:CreateImage",
+      "ec2:DescribeImages",
+      "ec2:DescribeSubnets"
     ]
     resources = ["*"]
   }
@@ -55,7 +59,10 @@ data "aws_iam_policy_document" "lambda_permissions" {
     actions = [
       "cloudwatch:PutMetricAlarm",
       "cloudwatch:DeleteAlarms",
-      "cloudwatch:DescribeAlarms"
+      "cloudwatch:DescribeAlarms",
+      "cloudwatch:DescribeAlarmHistory",
+      "cloudwatch:GetMetricData",
+      "cloudwatch:PutMetricData"
     ]
     resources = ["*"]
   }
@@ -66,16 +73,75 @@ data "aws_iam_policy_document" "lambda_permissions" {
     actions = [
       "ssm:SendCommand",
       "ssm:GetCommandInvocation",
-      "ssm:ListCommandInvocations"
+      "ssm:ListCommands",
+      "ssm:ListCommandInvocations",
+      "ssm:DescribeInstanceInformation"
     ]
     resources = ["*"]
   }
 
-  # IAM PassRole for EC2 instance profile
+  # Baked workshop image ID, written by provision's bake_image mode
   statement {
-    effect    = "Allow"
-    actions   = ["iam:PassRole"]
-    resources = [aws_iam_role.ec2.arn]
+    effect = "Allow"
+    actions = [
+      "ssm:GetParameter",
+      "ssm:PutParameter"
+    ]
+    resources = ["arn:aws:ssm:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:parameter/${var.project_name}/baked-ami-id"]
+  }
+
+  # DynamoDB workshop state tables
+  statement {
+    effect = "Allow"
+    actions = [
+      "dynamodb:GetItem",
+      "dynamodb:PutItem",
+      "dynamodb:UpdateItem",
+      "dynamodb:DeleteItem",
+      "dynamodb:BatchWriteItem",
+      "dynamodb:Scan",
+      "dynamodb:Query"
+    ]
+    resources = [
+      aws_dynamodb_table.instance_index.arn,
+      aws_dynamodb_table.warm_pool.arn,
+      aws_dynamodb_table.benchmark_results.arn,
+      aws_dynamodb_table.chaos_agent.arn,
+      aws_dynamodb_table.incidents.arn,
+      aws_dynamodb_table.action_leases.arn
+    ]
+  }
+
+  # Chaos agent queues: send scenarios, delete queues at teardown
+  statement {
+    effect = "Allow"
+    actions = [
+      "sqs:SendMessage",
+      "sqs:DeleteQueue"
+    ]
+    resources = ["arn:aws:sqs:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:${var.project_name}-agent-*"]
+  }
+
+  # Provision (standalone or via the dispatcher) re-invokes itself
+  # asynchronously to refill the warm pool
+  statement {
+    effect  = "Allow"
+    actions = ["lambda:InvokeFunction"]
+    resources = [
+      "arn:aws:lambda:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:function:${var.project_name}-provision",
+      "arn:aws:lambda:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:function:${var.project_name}-dispatcher"
+    ]
+  }
+
+  # IAM PassRole for the EC2 instance profile, and for the role SSM uses to
+  # publish command completion notifications
+  statement {
+    effect  = "Allow"
+    actions = ["iam:PassRole"]
+    resources = [
+      aws_iam_role.ec2.arn,
+      aws_iam_role.ssm_notify.arn
+    ]
   }
 
   # SNS publish for testing
@@ -128,6 +194,63 @@ resource "aws_iam_role_policy_attachment" "ec2_cloudwatch" {
   policy_arn = "arn:aws:iam::aws:policy/CloudWatchAgentServerPolicy"
 }
 
+# Chaos agent: its own queue and the heartbeat/result table. Instances cannot
+# send messages, and a message only names a scenario from the agent's
+# allow-list, never a command. Queues are tagged workshop-instance-arn with
+# the creating instance's ARN, and table writes are limited to keys starting
+# with it, so an instance can neither take another one's work nor forge its
+# heartbeat or results
+data "aws_iam_policy_document" "ec2_chaos_agent" {
+  statement {
+    effect = "Allow"
+    actions = [
+      "sqs:CreateQueue",
+      "sqs:TagQueue"
+    ]
+    resources = ["arn:aws:sqs:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:${var.project_name}-agent-*"]
+
+    condition {
+      test     = "StringEquals"
+      variable = "aws:RequestTag/workshop-instance-arn"
+      values   = ["$${ec2:SourceInstanceARN}"]
+    }
+  }
+
+  statement {
+    effect = "Allow"
+    actions = [
+      "sqs:ReceiveMessage",
+      "sqs:DeleteMessage",
+      "sqs:ListQueueTags"
+    ]
+    resources = ["arn:aws:sqs:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:${var.project_name}-agent-*"]
+
+    condition {
+      test     = "StringEquals"
+      variable = "aws:ResourceTag/workshop-instance-arn"
+      values   = ["$${ec2:SourceInstanceARN}"]
+    }
+  }
+
+  statement {
+    effect    = "Allow"
+    actions   = ["dynamodb:PutItem"]
+    resources = [aws_dynamodb_table.chaos_agent.arn]
+
+    condition {
+      test     = "ForAllValues:StringLike"
+      variable = "dynamodb:LeadingKeys"
+      values   = ["$${ec2:SourceInstanceARN}#*"]
+    }
+  }
+}
+
+resource "aws_iam_role_policy" "ec2_chaos_agent" {
+  name   = "${var.project_name}-ec2-chaos-agent"
+  role   = aws_iam_role.ec2.id
+  policy = data.aws_iam_policy_document.ec2_chaos_agent.json
+}
+
 # Instance profile for EC2
 resource "aws_iam_instance_profile" "ec2" {
   name = "${var.project_name}-ec2-instance-profile"
@@ -138,6 +261,44 @@ resource "aws_iam_instance_profile" "ec2" {
   }
 }
 
+# -----------------------------------------------------------------------------
+# SSM Notification Role (publishes command completion to SNS)
+# -----------------------------------------------------------------------------
+
+data "aws_iam_policy_document" "ssm_notify_assume_role" {
+  statement {
+    effect = "Allow"
+    principals {
+      type        = "Service"
+      identifiers = ["ssm.amazonaws.com"]
+    }
+    actions = ["sts:AssumeRole"]
+  }
+}
+
+resource "aws_iam_role" "ssm_notify" {
+  name               = "${var.project_name}-ssm-notify-role"
+  assume_role_policy = data.aws_iam_policy_document.ssm_notify_assume_role.json
+
+  tags = {
+    Project = var.project_name
+  }
+}
+
+data "aws_iam_policy_document" "ssm_notify_permissions" {
+  statement {
+    effect    = "Allow"
+    actions   = ["sns:Publish"]
+    resources = [aws_sns_topic.command_events.arn]
+  }
+}
+
+resource "aws_iam_role_policy" "ssm_notify" {
+  name   = "${var.project_name}-ssm-notify-policy"
+  role   = aws_iam_role.ssm_notify.id
+  policy = data.aws_iam_policy_document.ssm_notify_permissions.json
+}
+
 # -----------------------------------------------------------------------------
 # Lambda Invoke Policy (for n8n workflow to invoke Lambda functions)
 # -----------------------------------------------------------------------------
@@ -171,6 +332,8 @@ data "aws_iam_policy_document" "lambda_invoke" {
       "${aws_lambda_function.corrupt_disk.arn}:*",
       aws_lambda_function.fix_corrupt_disk.arn,
       "${aws_lambda_function.fix_corrupt_disk.arn}:*",
+      aws_lambda_function.dispatcher.arn,
+      "${aws_lambda_function.dispatcher.arn}:*",
     ]
   }
 }
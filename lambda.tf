@@ -1,3 +1,16 @@
+# Every function's environment repeats its timeout as FUNCTION_TIMEOUT;
+# workshop_common/clients.py sizes the AWS client timeouts from it, so keep
+# the two in step
+
+# Each instance's chaos agent creates and long-polls the queue named
+# "<project_name>-agent-<instance ID>"
+locals {
+  chaos_queue_prefix = "https://sqs.${data.aws_region.current.name}.amazonaws.com/${data.aws_caller_identity.current.account_id}/${var.project_name}-agent-"
+
+  # Chaos agent table keys start with the writing instance's ARN
+  instance_arn_prefix = "arn:aws:ec2:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:instance/"
+}
+
 # -----------------------------------------------------------------------------
 # Lambda Function Zip Archives
 # -----------------------------------------------------------------------------
@@ -50,6 +63,36 @@ data "archive_file" "fix_corrupt_disk" {
   output_path = "${path.module}/lambda_functions/fix_corrupt_disk.zip"
 }
 
+data "archive_file" "dispatcher" {
+  type        = "zip"
+  source_dir  = "${path.module}/lambda_functions/dispatcher"
+  output_path = "${path.module}/lambda_functions/dispatcher.zip"
+}
+
+data "archive_file" "command_complete" {
+  type        = "zip"
+  source_dir  = "${path.module}/lambda_functions/command_complete"
+  output_path = "${path.module}/lambda_functions/command_complete.zip"
+}
+
+# -----------------------------------------------------------------------------
+# Shared Lambda Layer (workshop_common package)
+# -----------------------------------------------------------------------------
+
+data "archive_file" "shared_layer" {
+  type        = "zip"
+  source_dir  = "${path.module}/lambda_functions/shared"
+  output_path = "${path.module}/lambda_functions/shared_layer.zip"
+}
+
+resource "aws_lambda_layer_version" "shared" {
+  layer_name          = "${var.project_name}-shared"
+  description         = "Shared helpers for workshop Lambda functions"
+  filename            = data.archive_file.shared_layer.output_path
+  source_code_hash    = data.archive_file.shared_layer.output_base64sha256
+  compatible_runtimes = ["python3.11"]
+}
+
 # -----------------------------------------------------------------------------
 # Lambda Functions
 # -----------------------------------------------------------------------------
@@ -61,20 +104,36 @@ resource "aws_lambda_function" "provision" {
   role             = aws_iam_role.lambda.arn
   handler          = "lambda_function.lambda_handler"
   runtime          = "python3.11"
-  timeout          = 120
+  timeout          = 300
   memory_size      = 256
   filename         = data.archive_file.provision.output_path
   source_code_hash = data.archive_file.provision.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
 
   environment {
     variables = {
       AMI_ID               = var.ami_id
+      AMI_ID_ARM64         = var.ami_id_arm64
       SUBNET_ID            = var.subnet_id
+      SUBNET_IDS           = join(",", var.subnet_ids)
       SECURITY_GROUP_ID    = aws_security_group.workshop.id
       INSTANCE_PROFILE_ARN = aws_iam_instance_profile.ec2.arn
       SNS_TOPIC_ARN        = aws_sns_topic.workshop_alerts.arn
       DISK_THRESHOLD       = var.disk_threshold_percent
       ALARM_PERIOD         = var.alarm_period_seconds
+      INSTANCE_INDEX_TABLE = aws_dynamodb_table.instance_index.name
+      WARM_POOL_TABLE      = aws_dynamodb_table.warm_pool.name
+      WARM_POOL_SIZE       = var.warm_pool_size
+      BAKED_AMI_PARAMETER  = "/${var.project_name}/baked-ami-id"
+      TELEMETRY_MODE       = var.telemetry_mode
+      ALARM_MODE           = var.alarm_mode
+      PROVISION_PROFILE    = var.provision_profile
+      INSTANCE_TYPE        = var.instance_type
+      CHAOS_AGENT          = var.chaos_agent ? "on" : "off"
+      CHAOS_AGENT_TABLE    = aws_dynamodb_table.chaos_agent.name
+      CHAOS_QUEUE_PREFIX   = local.chaos_queue_prefix
+      INSTANCE_ARN_PREFIX  = local.instance_arn_prefix
+      FUNCTION_TIMEOUT     = 300
     }
   }
 
@@ -91,10 +150,24 @@ resource "aws_lambda_function" "teardown" {
   role             = aws_iam_role.lambda.arn
   handler          = "lambda_function.lambda_handler"
   runtime          = "python3.11"
-  timeout          = 60
+  timeout          = 300
   memory_size      = 256
   filename         = data.archive_file.teardown.output_path
   source_code_hash = data.archive_file.teardown.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+
+  environment {
+    variables = {
+      INSTANCE_INDEX_TABLE = aws_dynamodb_table.instance_index.name
+      WARM_POOL_TABLE      = aws_dynamodb_table.warm_pool.name
+      ALARM_MODE           = var.alarm_mode
+      CHAOS_AGENT          = var.chaos_agent ? "on" : "off"
+      CHAOS_AGENT_TABLE    = aws_dynamodb_table.chaos_agent.name
+      CHAOS_QUEUE_PREFIX   = local.chaos_queue_prefix
+      INSTANCE_ARN_PREFIX  = local.instance_arn_prefix
+      FUNCTION_TIMEOUT     = 300
+    }
+  }
 
   tags = {
     Name    = "${var.project_name}-teardown"
@@ -113,6 +186,24 @@ resource "aws_lambda_function" "fill_disk" {
   memory_size      = 256
   filename         = data.archive_file.fill_disk.output_path
   source_code_hash = data.archive_file.fill_disk.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+
+  environment {
+    variables = {
+      INSTANCE_INDEX_TABLE    = aws_dynamodb_table.instance_index.name
+      COMMAND_TOPIC_ARN       = aws_sns_topic.command_events.arn
+      COMMAND_NOTIFY_ROLE_ARN = aws_iam_role.ssm_notify.arn
+      TELEMETRY_MODE          = var.telemetry_mode
+      CHAOS_AGENT             = var.chaos_agent ? "on" : "off"
+      CHAOS_AGENT_TABLE       = aws_dynamodb_table.chaos_agent.name
+      CHAOS_QUEUE_PREFIX      = local.chaos_queue_prefix
+      INSTANCE_ARN_PREFIX     = local.instance_arn_prefix
+      ALARM_MODE              = var.alarm_mode
+      INCIDENT_TABLE          = aws_dynamodb_table.incidents.name
+      LEASE_TABLE             = aws_dynamodb_table.action_leases.name
+      FUNCTION_TIMEOUT        = 60
+    }
+  }
 
   tags = {
     Name    = "${var.project_name}-fill-disk"
@@ -131,6 +222,24 @@ resource "aws_lambda_function" "reset_disk" {
   memory_size      = 256
   filename         = data.archive_file.reset_disk.output_path
   source_code_hash = data.archive_file.reset_disk.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+
+  environment {
+    variables = {
+      INSTANCE_INDEX_TABLE    = aws_dynamodb_table.instance_index.name
+      COMMAND_TOPIC_ARN       = aws_sns_topic.command_events.arn
+      COMMAND_NOTIFY_ROLE_ARN = aws_iam_role.ssm_notify.arn
+      TELEMETRY_MODE          = var.telemetry_mode
+      CHAOS_AGENT             = var.chaos_agent ? "on" : "off"
+      CHAOS_AGENT_TABLE       = aws_dynamodb_table.chaos_agent.name
+      CHAOS_QUEUE_PREFIX      = local.chaos_queue_prefix
+      INSTANCE_ARN_PREFIX     = local.instance_arn_prefix
+      ALARM_MODE              = var.alarm_mode
+      INCIDENT_TABLE          = aws_dynamodb_table.incidents.name
+      LEASE_TABLE             = aws_dynamodb_table.action_leases.name
+      FUNCTION_TIMEOUT        = 60
+    }
+  }
 
   tags = {
     Name    = "${var.project_name}-reset-disk"
@@ -149,6 +258,24 @@ resource "aws_lambda_function" "spike_cpu" {
   memory_size      = 256
   filename         = data.archive_file.spike_cpu.output_path
   source_code_hash = data.archive_file.spike_cpu.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+
+  environment {
+    variables = {
+      INSTANCE_INDEX_TABLE    = aws_dynamodb_table.instance_index.name
+      COMMAND_TOPIC_ARN       = aws_sns_topic.command_events.arn
+      COMMAND_NOTIFY_ROLE_ARN = aws_iam_role.ssm_notify.arn
+      TELEMETRY_MODE          = var.telemetry_mode
+      CHAOS_AGENT             = var.chaos_agent ? "on" : "off"
+      CHAOS_AGENT_TABLE       = aws_dynamodb_table.chaos_agent.name
+      CHAOS_QUEUE_PREFIX      = local.chaos_queue_prefix
+      INSTANCE_ARN_PREFIX     = local.instance_arn_prefix
+      ALARM_MODE              = var.alarm_mode
+      INCIDENT_TABLE          = aws_dynamodb_table.incidents.name
+      LEASE_TABLE             = aws_dynamodb_table.action_leases.name
+      FUNCTION_TIMEOUT        = 60
+    }
+  }
 
   tags = {
     Name    = "${var.project_name}-spike-cpu"
@@ -156,17 +283,35 @@ resource "aws_lambda_function" "spike_cpu" {
   }
 }
 
-# Kill and Restart Lambda - Kills runaway processes and reboots instance
+# Kill and Restart Lambda - Kills runaway processes, reboots instance if load persists
 resource "aws_lambda_function" "kill_and_restart" {
   function_name    = "${var.project_name}-kill-and-restart"
-  description      = "Kills runaway processes and restarts workshop EC2 instance"
+  description      = "Kills runaway processes and restarts workshop EC2 instance if CPU stays high"
   role             = aws_iam_role.lambda.arn
   handler          = "lambda_function.lambda_handler"
   runtime          = "python3.11"
-  timeout          = 60
+  timeout          = 300 # room for wait_for_recovery after a reboot
   memory_size      = 256
   filename         = data.archive_file.kill_and_restart.output_path
   source_code_hash = data.archive_file.kill_and_restart.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+
+  environment {
+    variables = {
+      INSTANCE_INDEX_TABLE    = aws_dynamodb_table.instance_index.name
+      COMMAND_TOPIC_ARN       = aws_sns_topic.command_events.arn
+      COMMAND_NOTIFY_ROLE_ARN = aws_iam_role.ssm_notify.arn
+      TELEMETRY_MODE          = var.telemetry_mode
+      CHAOS_AGENT             = var.chaos_agent ? "on" : "off"
+      CHAOS_AGENT_TABLE       = aws_dynamodb_table.chaos_agent.name
+      CHAOS_QUEUE_PREFIX      = local.chaos_queue_prefix
+      INSTANCE_ARN_PREFIX     = local.instance_arn_prefix
+      ALARM_MODE              = var.alarm_mode
+      INCIDENT_TABLE          = aws_dynamodb_table.incidents.name
+      LEASE_TABLE             = aws_dynamodb_table.action_leases.name
+      FUNCTION_TIMEOUT        = 300
+    }
+  }
 
   tags = {
     Name    = "${var.project_name}-kill-and-restart"
@@ -185,6 +330,24 @@ resource "aws_lambda_function" "corrupt_disk" {
   memory_size      = 256
   filename         = data.archive_file.corrupt_disk.output_path
   source_code_hash = data.archive_file.corrupt_disk.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+
+  environment {
+    variables = {
+      INSTANCE_INDEX_TABLE    = aws_dynamodb_table.instance_index.name
+      COMMAND_TOPIC_ARN       = aws_sns_topic.command_events.arn
+      COMMAND_NOTIFY_ROLE_ARN = aws_iam_role.ssm_notify.arn
+      TELEMETRY_MODE          = var.telemetry_mode
+      CHAOS_AGENT             = var.chaos_agent ? "on" : "off"
+      CHAOS_AGENT_TABLE       = aws_dynamodb_table.chaos_agent.name
+      CHAOS_QUEUE_PREFIX      = local.chaos_queue_prefix
+      INSTANCE_ARN_PREFIX     = local.instance_arn_prefix
+      ALARM_MODE              = var.alarm_mode
+      INCIDENT_TABLE          = aws_dynamodb_table.incidents.name
+      LEASE_TABLE             = aws_dynamodb_table.action_leases.name
+      FUNCTION_TIMEOUT        = 60
+    }
+  }
 
   tags = {
     Name    = "${var.project_name}-corrupt-disk"
@@ -203,6 +366,24 @@ resource "aws_lambda_function" "fix_corrupt_disk" {
   memory_size      = 256
   filename         = data.archive_file.fix_corrupt_disk.output_path
   source_code_hash = data.archive_file.fix_corrupt_disk.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+
+  environment {
+    variables = {
+      INSTANCE_INDEX_TABLE    = aws_dynamodb_table.instance_index.name
+      COMMAND_TOPIC_ARN       = aws_sns_topic.command_events.arn
+      COMMAND_NOTIFY_ROLE_ARN = aws_iam_role.ssm_notify.arn
+      TELEMETRY_MODE          = var.telemetry_mode
+      CHAOS_AGENT             = var.chaos_agent ? "on" : "off"
+      CHAOS_AGENT_TABLE       = aws_dynamodb_table.chaos_agent.name
+      CHAOS_QUEUE_PREFIX      = local.chaos_queue_prefix
+      INSTANCE_ARN_PREFIX     = local.instance_arn_prefix
+      ALARM_MODE              = var.alarm_mode
+      INCIDENT_TABLE          = aws_dynamodb_table.incidents.name
+      LEASE_TABLE             = aws_dynamodb_table.action_leases.name
+      FUNCTION_TIMEOUT        = 60
+    }
+  }
 
   tags = {
     Name    = "${var.project_name}-fix-corrupt-disk"
@@ -210,6 +391,120 @@ resource "aws_lambda_function" "fix_corrupt_disk" {
   }
 }
 
+# Dispatcher Lambda - Serves every action above, routed on the "action" field, so
+# all traffic shares one pool of warm containers
+resource "aws_lambda_function" "dispatcher" {
+  function_name    = "${var.project_name}-dispatcher"
+  description      = "Routes workshop actions to their handlers by the action field"
+  role             = aws_iam_role.lambda.arn
+  handler          = "lambda_function.lambda_handler"
+  runtime          = "python3.11"
+  timeout          = 300
+  memory_size      = 256
+  filename         = data.archive_file.dispatcher.output_path
+  source_code_hash = data.archive_file.dispatcher.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+
+  environment {
+    variables = {
+      AMI_ID                  = var.ami_id
+      AMI_ID_ARM64            = var.ami_id_arm64
+      SUBNET_ID               = var.subnet_id
+      SUBNET_IDS              = join(",", var.subnet_ids)
+      SECURITY_GROUP_ID       = aws_security_group.workshop.id
+      INSTANCE_PROFILE_ARN    = aws_iam_instance_profile.ec2.arn
+      SNS_TOPIC_ARN           = aws_sns_topic.workshop_alerts.arn
+      DISK_THRESHOLD          = var.disk_threshold_percent
+      ALARM_PERIOD            = var.alarm_period_seconds
+      INSTANCE_INDEX_TABLE    = aws_dynamodb_table.instance_index.name
+      WARM_POOL_TABLE         = aws_dynamodb_table.warm_pool.name
+      WARM_POOL_SIZE          = var.warm_pool_size
+      BAKED_AMI_PARAMETER     = "/${var.project_name}/baked-ami-id"
+      BENCHMARK_TABLE         = aws_dynamodb_table.benchmark_results.name
+      COMMAND_TOPIC_ARN       = aws_sns_topic.command_events.arn
+      COMMAND_NOTIFY_ROLE_ARN = aws_iam_role.ssm_notify.arn
+      TELEMETRY_MODE          = var.telemetry_mode
+      ALARM_MODE              = var.alarm_mode
+      PROVISION_PROFILE       = var.provision_profile
+      INSTANCE_TYPE           = var.instance_type
+      CHAOS_AGENT             = var.chaos_agent ? "on" : "off"
+      CHAOS_AGENT_TABLE       = aws_dynamodb_table.chaos_agent.name
+      CHAOS_QUEUE_PREFIX      = local.chaos_queue_prefix
+      INSTANCE_ARN_PREFIX     = local.instance_arn_prefix
+      INCIDENT_TABLE          = aws_dynamodb_table.incidents.name
+      LEASE_TABLE             = aws_dynamodb_table.action_leases.name
+      FUNCTION_TIMEOUT        = 300
+    }
+  }
+
+  tags = {
+    Name    = "${var.project_name}-dispatcher"
+    Project = var.project_name
+  }
+}
+
+# Command Complete Lambda - Interprets finished event-driven SSM commands and
+# posts the result to the n8n callback (subscribed to the command events topic)
+resource "aws_lambda_function" "command_complete" {
+  function_name    = "${var.project_name}-command-complete"
+  description      = "Posts results of event-driven SSM commands to the n8n callback"
+  role             = aws_iam_role.lambda.arn
+  handler          = "lambda_function.lambda_handler"
+  runtime          = "python3.11"
+  timeout          = 60
+  memory_size      = 256
+  filename         = data.archive_file.command_complete.output_path
+  source_code_hash = data.archive_file.command_complete.output_base64sha256
+  layers           = [aws_lambda_layer_version.shared.arn]
+
+  environment {
+    variables = {
+      N8N_CALLBACK_URL = var.n8n_callback_url
+      TELEMETRY_MODE   = var.telemetry_mode
+      ALARM_MODE       = var.alarm_mode
+      INCIDENT_TABLE   = aws_dynamodb_table.incidents.name
+      LEASE_TABLE      = aws_dynamodb_table.action_leases.name
+      FUNCTION_TIMEOUT = 60
+    }
+  }
+
+  tags = {
+    Name    = "${var.project_name}-command-complete"
+    Project = var.project_name
+  }
+}
+
+# -----------------------------------------------------------------------------
+# Warm Pool Refill Schedule
+# -----------------------------------------------------------------------------
+
+resource "aws_cloudwatch_event_rule" "warm_pool_refill" {
+  count               = var.warm_pool_size > 0 ? 1 : 0
+  name                = "${var.project_name}-warm-pool-refill"
+  description         = "Keeps the warm pool of workshop instances at its target size"
+  schedule_expression = "rate(1 minute)"
+
+  tags = {
+    Project = var.project_name
+  }
+}
+
+resource "aws_cloudwatch_event_target" "warm_pool_refill" {
+  count = var.warm_pool_size > 0 ? 1 : 0
+  rule  = aws_cloudwatch_event_rule.warm_pool_refill[0].name
+  arn   = aws_lambda_function.provision.arn
+  input = jsonencode({ mode = "pool_refill" })
+}
+
+resource "aws_lambda_permission" "warm_pool_refill" {
+  count         = var.warm_pool_size > 0 ? 1 : 0
+  statement_id  = "AllowWarmPoolRefillSchedule"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.provision.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.warm_pool_refill[0].arn
+}
+
 # -----------------------------------------------------------------------------
 # CloudWatch Log Groups for Lambda Functions
 # -----------------------------------------------------------------------------
@@ -285,3 +580,21 @@ resource "aws_cloudwatch_log_group" "fix_corrupt_disk" {
     Project = var.project_name
   }
 }
+
+resource "aws_cloudwatch_log_group" "dispatcher" {
+  name              = "/aws/lambda/${aws_lambda_function.dispatcher.function_name}"
+  retention_in_days = 7
+
+  tags = {
+    Project = var.project_name
+  }
+}
+
+resource "aws_cloudwatch_log_group" "command_complete" {
+  name              = "/aws/lambda/${aws_lambda_function.command_complete.function_name}"
+  retention_in_days = 7
+
+  tags = {
+    Project = var.project_name
+  }
+}
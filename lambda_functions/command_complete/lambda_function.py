@@ -0,0 +1,3 @@
+# Standalone entry point for SSM completion notifications; the handler lives in
+# the shared layer with the scenarios it interprets
+from workshop_common.handlers.command_complete import lambda_handler  # noqa: F401
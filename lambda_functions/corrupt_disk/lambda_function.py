@@ -1,10 +1,4 @@
-import json
-import time
-import boto3
-from botocore.exceptions import ClientError
-
-ec2 = boto3.client('ec2')
-ssm = boto3.client('ssm')
+from workshop_common.scenarios import run_scenario
 
 
 def lambda_handler(event, context):
@@ -13,6 +7,12 @@ def lambda_handler(event, context):
     The immutable flag prevents the regular reset_disk Lambda from deleting it.
 
     Input: {"username": "user123"}
+    Optional: "instance_id": "i-xxx" skips the username -> instance lookup
+    Resume: {"username": "user123", "command_id": "..."} keeps waiting on a command
+            that was still running when a previous call ran out of time
+    Bulk: {"usernames": ["user1", "user2"]} or {"all": true}, plus optional
+          "max_concurrency", "max_errors" and "command_ids" (to resume);
+          returns {"results": {username: output}, "summary": {...}}
     Output: {
         "success": true,
         "instance_id": "i-xxx",
@@ -21,117 +21,4 @@ def lambda_handler(event, context):
         "message": "Disk corrupted with immutable file. Automated reset will fail - requires manual intervention."
     }
     """
-    try:
-        # Parse input
-        if isinstance(event, str):
-            event = json.loads(event)
-
-        username = event.get('username')
-        if not username:
-            return {
-                'success': False,
-                'error': 'Missing required field: username'
-            }
-
-        # Sanitize username
-        safe_username = ''.join(c for c in username if c.isalnum() or c in '-_').lower()
-
-        # Find running instance for this user
-        response = ec2.describe_instances(
-            Filters=[
-                {'Name': 'tag:workshop-user', 'Values': [safe_username]},
-                {'Name': 'instance-state-name', 'Values': ['running']}
-            ]
-        )
-
-        instance_id = None
-        for reservation in response['Reservations']:
-            for instance in reservation['Instances']:
-                instance_id = instance['InstanceId']
-                break
-            if instance_id:
-                break
-
-        if not instance_id:
-            return {
-                'success': False,
-                'error': f'No running instance found for user: {safe_username}'
-            }
-
-        # Send SSM command to create immutable filler file
-        # Create 25GB file with immutable flag - reset_disk's rm -f will fail with "Operation not permitted"
-        # Note: Use /var/tmp instead of /tmp because /tmp is often tmpfs (RAM-based)
-        command = 'fallocate -l 25G /var/tmp/filler_corrupt.dat && chattr +i /var/tmp/filler_corrupt.dat && df -h /'
-
-        print(f"Sending SSM command to instance {instance_id}: {command}")
-
-        ssm_response = ssm.send_command(
-            InstanceIds=[instance_id],
-            DocumentName='AWS-RunShellScript',
-            Parameters={'commands': [command]},
-            TimeoutSeconds=60
-        )
-
-        command_id = ssm_response['Command']['CommandId']
-
-        # Wait for command to complete
-        max_attempts = 30
-        attempt = 0
-        output = None
-
-        while attempt < max_attempts:
-            time.sleep(2)
-            attempt += 1
-
-            try:
-                result = ssm.get_command_invocation(
-                    CommandId=command_id,
-                    InstanceId=instance_id
-                )
-
-                status = result['Status']
-                print(f"Command status: {status}")
-
-                if status in ['Success', 'Failed', 'Cancelled', 'TimedOut']:
-                    output = result.get('StandardOutputContent', '')
-                    error_output = result.get('StandardErrorContent', '')
-
-                    if status == 'Success':
-                        return {
-                            'success': True,
-                            'instance_id': instance_id,
-                            'username': safe_username,
-                            'disk_status': output,
-                            'message': 'Disk corrupted with immutable file. Automated reset will fail - requires manual intervention.'
-                        }
-                    else:
-                        return {
-                            'success': False,
-                            'instance_id': instance_id,
-                            'username': safe_username,
-                            'error': f'Command {status}: {error_output or output}'
-                        }
-            except ClientError as e:
-                if 'InvocationDoesNotExist' in str(e):
-                    continue
-                raise
-
-        return {
-            'success': False,
-            'instance_id': instance_id,
-            'username': safe_username,
-            'error': 'Command timed out waiting for completion'
-        }
-
-    except ClientError as e:
-        print(f"AWS Error: {e}")
-        return {
-            'success': False,
-            'error': str(e)
-        }
-    except Exception as e:
-        print(f"Error: {e}")
-        return {
-            'success': False,
-            'error': str(e)
-        }
+    return run_scenario('corrupt_disk', event, context)
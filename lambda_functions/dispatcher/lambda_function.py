@@ -0,0 +1,2 @@
+# The dispatcher lives in the shared layer; this module only exposes its entry point
+from workshop_common.dispatcher import lambda_handler  # noqa: F401
@@ -0,0 +1,6 @@
+"""
+Shared code for the workshop Lambda functions.
+
+Packaged as a Lambda layer (see lambda.tf); the layer's python/ directory is
+on sys.path inside every function that attaches it.
+"""
@@ -0,0 +1,208 @@
+"""
+Chaos agent that runs on workshop instances.
+
+launch.py installs it from the user data as a systemd service when
+CHAOS_AGENT is "on" (see chaos_runner.chaos_agent_script). It long-polls the
+instance's own SQS queue, runs the scenario each message names and writes the
+result to the chaos agent table, where chaos_runner picks it up. Every item it
+writes is keyed under its instance ARN, the only keys the instance role may
+write. Messages
+only ever name a scenario: the commands come from the allow-list in the
+agent's config file, written next to it from commands.SCENARIO_COMMANDS, and
+any other name is rejected.
+
+This file is copied onto instances as-is, so it imports nothing from
+workshop_common. boto3 is imported only in main(), so tests can drive run()
+with stand-in clients; botocore, which boto3 always brings along, is imported
+at the top for its exception types.
+"""
+import json
+import subprocess
+import sys
+import time
+import urllib.request
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+CONFIG_PATH = '/etc/workshop-agent/config.json'
+IMDS_URL = 'http://169.254.169.254/latest'
+
+# One receive_message call waits this long for work; the agent heartbeats
+# before each one
+LONG_POLL_SECONDS = 20
+
+# Upper bound on a request's timeout_seconds
+MAX_COMMAND_SECONDS = 300
+
+# SSM keeps the first 24000 characters of command output; results match it
+MAX_OUTPUT_CHARS = 24000
+
+# Heartbeats and results expire from the table (DynamoDB TTL)
+ITEM_TTL_SECONDS = 3600
+
+# Tag naming the instance that owns an agent queue. The instance role may
+# only create queues tagged with its own ARN, and only receive from and
+# delete messages on queues carrying it
+QUEUE_OWNER_TAG = 'workshop-instance-arn'
+
+# Back off after a failed queue or table call (e.g. before the network is up)
+ERROR_BACKOFF_SECONDS = 5
+
+
+def instance_arn(config, instance_id):
+    return config['instance_arn_prefix'] + instance_id
+
+
+def heartbeat_key(instance_arn):
+    return {'id': {'S': f'{instance_arn}#agent'}}
+
+
+def result_key(instance_arn, request_id):
+    return {'id': {'S': f'{instance_arn}#result#{request_id}'}}
+
+
+def run(sqs, dynamodb, config, instance_id, queue_url, should_stop=lambda: False):
+    """Heartbeat, long-poll and handle messages until should_stop() is true."""
+    wait_seconds = config.get('long_poll_seconds', LONG_POLL_SECONDS)
+    while not should_stop():
+        try:
+            now = int(time.time())
+            dynamodb.put_item(
+                TableName=config['table'],
+                Item={
+                    **heartbeat_key(instance_arn(config, instance_id)),
+                    'heartbeat_at': {'N': str(now)},
+                    'expires_at': {'N': str(now + ITEM_TTL_SECONDS)}
+                }
+            )
+            response = sqs.receive_message(QueueUrl=queue_url, WaitTimeSeconds=wait_seconds, MaxNumberOfMessages=1)
+            for message in response.get('Messages', []):
+                # Delete first: a scenario must never run twice, and the
+                # handler falls back to SSM if the result never arrives
+                sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=message['ReceiptHandle'])
+                handle_message(dynamodb, config, instance_id, message['Body'])
+        # BotoCoreError covers e.g. EndpointConnectionError while the network
+        # is still coming up at boot
+        except (ClientError, BotoCoreError, OSError) as e:
+            print(f"Agent error: {e}", flush=True)
+            time.sleep(ERROR_BACKOFF_SECONDS)
+
+
+def handle_message(dynamodb, config, instance_id, body):
+    """Claim the request, run its scenario if allowed and store the result."""
+    try:
+        request = json.loads(body)
+        request_id = request['request_id']
+    except (ValueError, KeyError, TypeError):
+        print(f"Ignoring malformed message: {body[:200]}", flush=True)
+        return
+
+    scenario = request.get('scenario')
+    key = result_key(instance_arn(config, instance_id), request_id)
+    now = int(time.time())
+
+    # The handler claims the same key as abandoned when it stops waiting for
+    # pickup, so only one side gets it
+    try:
+        dynamodb.put_item(
+            TableName=config['table'],
+            Item={
+                **key,
+                'status': {'S': 'InProgress'},
+                'instance_id': {'S': instance_id},
+                'expires_at': {'N': str(now + ITEM_TTL_SECONDS)}
+            },
+            ConditionExpression='attribute_not_exists(id)'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        print(f"Request {request_id} was abandoned by the handler; skipping", flush=True)
+        return
+
+    command = config['scenarios'].get(scenario)
+    if command is None:
+        status, stdout, stderr = 'Failed', '', f'Scenario not allowed: {scenario}'
+    else:
+        timeout = min(int(request.get('timeout_seconds', 60)), MAX_COMMAND_SECONDS)
+        print(f"Running {scenario} for request {request_id}", flush=True)
+        status, stdout, stderr = run_command(command, timeout)
+
+    dynamodb.put_item(
+        TableName=config['table'],
+        Item={
+            **key,
+            'status': {'S': status},
+            'instance_id': {'S': instance_id},
+            'scenario': {'S': str(scenario)},
+            'stdout': {'S': stdout[:MAX_OUTPUT_CHARS]},
+            'stderr': {'S': stderr[:MAX_OUTPUT_CHARS]},
+            'finished_at': {'N': str(int(time.time()))},
+            'expires_at': {'N': str(now + ITEM_TTL_SECONDS)}
+        }
+    )
+
+
+def run_command(command, timeout):
+    """Run a shell command like AWS-RunShellScript does; returns (status, stdout, stderr)."""
+    try:
+        completed = subprocess.run(
+            ['/bin/bash', '-c', command], capture_output=True, text=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired as e:
+        return 'TimedOut', _text(e.stdout), _text(e.stderr)
+    status = 'Success' if completed.returncode == 0 else 'Failed'
+    return status, completed.stdout, completed.stderr
+
+
+def _text(output):
+    if isinstance(output, bytes):
+        return output.decode(errors='replace')
+    return output or ''
+
+
+def instance_identity():
+    """This instance's ID from the instance metadata service (IMDSv2)."""
+    token_request = urllib.request.Request(
+        f'{IMDS_URL}/api/token', method='PUT', headers={'X-aws-ec2-metadata-token-ttl-seconds': '60'}
+    )
+    with urllib.request.urlopen(token_request, timeout=2) as response:
+        token = response.read().decode()
+    id_request = urllib.request.Request(
+        f'{IMDS_URL}/meta-data/instance-id', headers={'X-aws-ec2-metadata-token': token}
+    )
+    with urllib.request.urlopen(id_request, timeout=2) as response:
+        return response.read().decode()
+
+
+def main():
+    import boto3
+
+    with open(CONFIG_PATH) as f:
+        config = json.load(f)
+    instance_id = instance_identity()
+    owner = instance_arn(config, instance_id)
+    sqs = boto3.client('sqs', region_name=config['region'])
+    dynamodb = boto3.client('dynamodb', region_name=config['region'])
+
+    # Short retention: a request nobody picked up within a minute is stale,
+    # the handler has long since fallen back to SSM
+    queue_url = sqs.create_queue(
+        QueueName=config['queue_prefix'] + instance_id,
+        Attributes={'MessageRetentionPeriod': '60'},
+        tags={QUEUE_OWNER_TAG: owner}
+    )['QueueUrl']
+
+    # create_queue returns an existing queue as-is, whoever tagged it. Never
+    # heartbeat for a queue this instance does not own, so the handler keeps
+    # using SSM rather than sending work to it
+    tags = sqs.list_queue_tags(QueueUrl=queue_url).get('Tags', {})
+    if tags.get(QUEUE_OWNER_TAG) != owner:
+        print(f"Queue {queue_url} is not owned by {owner}; not polling it", flush=True)
+        return 1
+    print(f"Chaos agent polling {queue_url}", flush=True)
+    run(sqs, dynamodb, config, instance_id, queue_url)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
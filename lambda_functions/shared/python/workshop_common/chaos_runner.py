@@ -0,0 +1,250 @@
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.chaos_agent import heartbeat_key, result_key
+from workshop_common.clients import client
+from workshop_common.commands import SCENARIO_COMMANDS
+from workshop_common.ssm_runner import TERMINAL_STATUSES, has_time_for
+
+# "on" installs the chaos agent (chaos_agent.py) on new instances, and the
+# scenario handlers send work to it instead of SSM while its heartbeat is
+# fresh. Each agent long-polls its own queue, named
+# CHAOS_QUEUE_PREFIX + instance ID, and writes heartbeats and
+# results to CHAOS_AGENT_TABLE under keys starting with its instance ARN
+# (INSTANCE_ARN_PREFIX + instance ID); the instance role can write no others.
+CHAOS_AGENT = os.environ.get('CHAOS_AGENT', 'off')
+CHAOS_AGENT_TABLE = os.environ.get('CHAOS_AGENT_TABLE')
+CHAOS_QUEUE_PREFIX = os.environ.get('CHAOS_QUEUE_PREFIX', '')
+INSTANCE_ARN_PREFIX = os.environ.get('INSTANCE_ARN_PREFIX', '')
+CHAOS_AGENT_ENABLED = CHAOS_AGENT == 'on' and bool(CHAOS_AGENT_TABLE and CHAOS_QUEUE_PREFIX and INSTANCE_ARN_PREFIX)
+
+# The agent heartbeats before every 20 s long poll
+HEARTBEAT_STALE_SECONDS = 60
+
+# How long the agent has to claim a request before the handler takes it back
+# and falls back to SSM
+PICKUP_SECONDS = float(os.environ.get('CHAOS_AGENT_PICKUP_SECONDS', '3'))
+
+# Results are read with consistent get_item calls, polled much faster than SSM
+FIRST_POLL_DELAY = 0.05
+POLL_BACKOFF = 1.5
+MAX_POLL_DELAY = 0.5
+
+# command_id of a request sent to the agent, so a resume polls the table
+COMMAND_ID_PREFIX = 'agent-'
+
+# Parallel delete_queue calls at teardown; there is no batch delete, and a
+# 500-instance cohort would otherwise take hundreds of serial calls
+DELETE_QUEUE_WORKERS = int(os.environ.get('BATCH_WORKERS', '10'))
+
+# Abandoned request markers expire from the table (DynamoDB TTL)
+ITEM_TTL_SECONDS = 3600
+
+AGENT_DIR = '/opt/workshop-agent'
+AGENT_CONFIG_DIR = '/etc/workshop-agent'
+
+AGENT_UNIT = f'''[Unit]
+Description=Workshop chaos agent
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+ExecStart=/usr/bin/python3 {AGENT_DIR}/chaos_agent.py
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+'''
+
+
+def chaos_agent_script():
+    """User-data snippet installing the agent, its allow-list config and its systemd unit."""
+    with open(os.path.join(os.path.dirname(__file__), 'chaos_agent.py')) as f:
+        source = f.read()
+    config = json.dumps({
+        'region': os.environ.get('AWS_REGION'),
+        'table': CHAOS_AGENT_TABLE,
+        'queue_prefix': CHAOS_QUEUE_PREFIX.rsplit('/', 1)[-1],
+        'instance_arn_prefix': INSTANCE_ARN_PREFIX,
+        'scenarios': SCENARIO_COMMANDS
+    }, indent=2)
+    return f'''
+rpm -q python3-boto3 > /dev/null || yum install -y python3-boto3
+mkdir -p {AGENT_DIR} {AGENT_CONFIG_DIR}
+cat > {AGENT_DIR}/chaos_agent.py << 'AGENT_EOF'
+{source}
+AGENT_EOF
+cat > {AGENT_CONFIG_DIR}/config.json << 'AGENT_EOF'
+{config}
+AGENT_EOF
+cat > /etc/systemd/system/workshop-agent.service << 'AGENT_EOF'
+{AGENT_UNIT}
+AGENT_EOF
+systemctl daemon-reload
+systemctl enable --now workshop-agent
+'''
+
+
+def queue_url(instance_id):
+    return CHAOS_QUEUE_PREFIX + instance_id
+
+
+def is_agent_command(command_id):
+    return bool(command_id) and command_id.startswith(COMMAND_ID_PREFIX)
+
+
+def agent_healthy(instance_id):
+    """True if the instance's agent heartbeated within HEARTBEAT_STALE_SECONDS."""
+    try:
+        item = client('dynamodb').get_item(
+            TableName=CHAOS_AGENT_TABLE,
+            Key=heartbeat_key(INSTANCE_ARN_PREFIX + instance_id)
+        ).get('Item')
+    except ClientError as e:
+        print(f"Chaos agent health check failed: {e}")
+        return False
+    return bool(item) and time.time() - int(item['heartbeat_at']['N']) < HEARTBEAT_STALE_SECONDS
+
+
+def run_agent_command(instance_id, scenario, context=None, timeout_seconds=60,
+                      max_wait_seconds=None, command_id=None):
+    """
+    Run a scenario through the instance's chaos agent and wait for the result.
+
+    Returns the same shape as ssm_runner.run_command (plus "via": "agent"), or
+    None when the agent is unhealthy or does not claim the request within
+    PICKUP_SECONDS; the caller then falls back to SSM. A result with
+    resumable=True carries a command_id that resumes polling here.
+    """
+    started = time.monotonic()
+
+    if command_id:
+        request_id = command_id[len(COMMAND_ID_PREFIX):]
+        print(f"Resuming chaos agent request {request_id} on instance {instance_id}")
+    else:
+        if not agent_healthy(instance_id):
+            print(f"Chaos agent on {instance_id} is not healthy; using SSM")
+            return None
+        request_id = uuid.uuid4().hex
+        print(f"Sending {scenario} to the chaos agent on {instance_id}")
+        client('sqs').send_message(
+            QueueUrl=queue_url(instance_id),
+            MessageBody=json.dumps({
+                'request_id': request_id,
+                'scenario': scenario,
+                'timeout_seconds': timeout_seconds
+            })
+        )
+
+    dispatched = time.monotonic()
+    result = poll_result(instance_id, request_id, context, max_wait_seconds, wait_for_pickup=not command_id)
+    finished = time.monotonic()
+    if result is None:
+        print(f"Chaos agent on {instance_id} did not pick up {scenario}; using SSM")
+        return None
+
+    result.update({
+        'command_id': COMMAND_ID_PREFIX + request_id,
+        'via': 'agent',
+        'timings': {
+            'dispatch_ms': int((dispatched - started) * 1000),
+            'poll_ms': int((finished - dispatched) * 1000),
+            'total_ms': int((finished - started) * 1000)
+        }
+    })
+    metrics.add_phase('dispatch', (dispatched - started) * 1000)
+    metrics.add_phase('poll', (finished - dispatched) * 1000)
+    metrics.count('PollIterations', result['polls'])
+    metrics.count('AgentCommands')
+    return result
+
+
+def poll_result(instance_id, request_id, context=None, max_wait_seconds=None, wait_for_pickup=True):
+    """
+    Poll the result item until terminal or out of time. Returns None if the
+    request was taken back because the agent did not claim it in time.
+    """
+    key = result_key(INSTANCE_ARN_PREFIX + instance_id, request_id)
+    started = time.monotonic()
+    delay = FIRST_POLL_DELAY
+    polls = 0
+    status = 'Pending'
+
+    while True:
+        if wait_for_pickup and status == 'Pending' and time.monotonic() - started >= PICKUP_SECONDS:
+            if abandon(key):
+                return None
+            # The agent claimed it meanwhile; keep waiting for the result
+            wait_for_pickup = False
+
+        if not has_time_for(delay, started, context, max_wait_seconds):
+            print(f"Out of time after {polls} poll(s); chaos agent request {request_id} is {status}")
+            return {'status': status, 'resumable': True, 'stdout': '', 'stderr': '', 'polls': polls}
+
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, MAX_POLL_DELAY)
+        polls += 1
+
+        item = client('dynamodb').get_item(
+            TableName=CHAOS_AGENT_TABLE, Key=key, ConsistentRead=True
+        ).get('Item')
+        if not item:
+            continue
+        status = item['status']['S']
+        if status in TERMINAL_STATUSES:
+            return {
+                'status': status,
+                'resumable': False,
+                'stdout': item.get('stdout', {}).get('S', ''),
+                'stderr': item.get('stderr', {}).get('S', ''),
+                'polls': polls
+            }
+
+
+def abandon(key):
+    """Claim an unclaimed request so the agent skips it. False if the agent got there first."""
+    try:
+        client('dynamodb').put_item(
+            TableName=CHAOS_AGENT_TABLE,
+            Item={
+                **key,
+                'status': {'S': 'Abandoned'},
+                'expires_at': {'N': str(int(time.time()) + ITEM_TTL_SECONDS)}
+            },
+            ConditionExpression='attribute_not_exists(id)'
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def delete_agent_queues(instance_ids):
+    """
+    Delete the agent queues of terminated instances, DELETE_QUEUE_WORKERS at
+    a time. Returns how many were deleted.
+    """
+    if not instance_ids:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(DELETE_QUEUE_WORKERS, len(instance_ids))) as pool:
+        return sum(pool.map(delete_agent_queue, instance_ids))
+
+
+def delete_agent_queue(instance_id):
+    """Delete one instance's agent queue. True if it was deleted."""
+    try:
+        client('sqs').delete_queue(QueueUrl=queue_url(instance_id))
+        return True
+    except ClientError as e:
+        # Not every instance got as far as creating its queue
+        if 'NonExistentQueue' not in e.response['Error']['Code']:
+            print(f"Error deleting chaos agent queue for {instance_id}: {e}")
+        return False
@@ -0,0 +1,158 @@
+import os
+import random
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+
+# Client settings shared by every handler. Adaptive retries back off with
+# jitter, draw on botocore's retry quota and rate-limit the client itself
+# once a service starts throttling, so a burst of attendees slows down
+# instead of retrying in lockstep.
+MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '4'))
+
+# Timeouts are sized for the function's own timeout (FUNCTION_TIMEOUT, set
+# per function in lambda.tf): all MAX_ATTEMPTS attempts of one call, connect
+# plus read, fit in a third of it, leaving the handler time to report before
+# its deadline. A 60 s scenario gets 1.25 s connect / 3.75 s read; the 300 s
+# handlers reach the 2 s / 10 s caps. AWS_CONNECT_TIMEOUT and
+# AWS_READ_TIMEOUT override them.
+FUNCTION_TIMEOUT = float(os.environ.get('FUNCTION_TIMEOUT', '60'))
+ATTEMPT_SECONDS = FUNCTION_TIMEOUT / 3 / MAX_ATTEMPTS
+CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT') or min(2.0, ATTEMPT_SECONDS / 4))
+READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT') or min(10.0, ATTEMPT_SECONDS - CONNECT_TIMEOUT))
+
+# provision's batch path calls one shared client from BATCH_WORKERS threads;
+# keep a pooled connection per worker (botocore's default is 10)
+POOL_SIZE = max(10, int(os.environ.get('BATCH_WORKERS', '10')) + 2)
+
+CLIENT_CONFIG = Config(
+    retries={'mode': 'adaptive', 'total_max_attempts': MAX_ATTEMPTS},
+    max_pool_connections=POOL_SIZE,
+    tcp_keepalive=True,
+    connect_timeout=CONNECT_TIMEOUT,
+    read_timeout=READ_TIMEOUT
+)
+
+# Error codes botocore treats as throttling (botocore.retries.standard)
+THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'ProvisionedThroughputExceededException',
+    'TransactionInProgressException', 'RequestLimitExceeded', 'BandwidthLimitExceeded',
+    'LimitExceededException', 'RequestThrottled', 'SlowDown', 'PriorRequestNotComplete',
+    'EC2ThrottledException'
+}
+
+# retry_throttled: extra attempts after botocore's own ran out, with fully
+# jittered waits of up to THROTTLE_BACKOFF_SECONDS * 2**attempt. Every
+# attendee's Lambda has its own client, so adaptive mode can't spread a room
+# clicking provision at once; seconds-long random waits do.
+THROTTLE_RETRIES = 3
+THROTTLE_BACKOFF_SECONDS = 1.0
+
+# One client per (service, region) for the life of the container, shared by
+# every module. Creating a client loads its service model and costs tens of
+# milliseconds, so clients are built on first use rather than at import: a
+# call only pays for the services it actually talks to.
+_clients = {}
+_lock = threading.Lock()
+
+# Used instead of boto3.client when set (see set_client_factory)
+_factory = None
+
+# Container-lifetime totals across all clients (see api_stats)
+_stats = {'calls': 0, 'retries': 0, 'throttles': 0}
+_stats_lock = threading.Lock()
+
+
+def client(service_name, region_name=None):
+    """Return the shared boto3 client for service_name (in region_name), creating it on first use."""
+    key = (service_name, region_name)
+    existing = _clients.get(key)
+    if existing is not None:
+        return existing
+    # Client creation is not thread-safe (provision's batch path runs a thread pool)
+    with _lock:
+        if key not in _clients:
+            new_client = _new_client(service_name, region_name)
+            metrics.instrument_client(new_client)
+            _count_retries(new_client)
+            _clients[key] = new_client
+        return _clients[key]
+
+
+def _new_client(service_name, region_name):
+    if _factory is not None:
+        return _factory(service_name) if region_name is None else _factory(service_name, region_name=region_name)
+    return boto3.client(service_name, region_name=region_name, config=CLIENT_CONFIG)
+
+
+def set_client_factory(factory):
+    """
+    Build clients with factory(service_name) instead of boto3.client, e.g. to
+    run the handlers against in-process fakes. Clients already built are
+    dropped. Pass None to go back to boto3.
+    """
+    global _factory
+    with _lock:
+        _factory = factory
+        _clients.clear()
+
+
+def api_stats():
+    """
+    Totals for every client in this container: API calls, retried attempts and
+    throttled attempts (each throttled response counts, retried or not).
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def retry_throttled(call, *args, **kwargs):
+    """
+    call(*args, **kwargs), retried up to THROTTLE_RETRIES more times while it
+    fails with a throttling error. Only for calls that are safe to repeat
+    (reads, or writes a throttled attempt never applied).
+    """
+    for attempt in range(THROTTLE_RETRIES + 1):
+        try:
+            return call(*args, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in THROTTLE_CODES or attempt == THROTTLE_RETRIES:
+                raise
+            metrics.count('ThrottleBackoffs')
+            time.sleep(random.uniform(0, THROTTLE_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def _count_retries(aws_client):
+    events = getattr(getattr(aws_client, 'meta', None), 'events', None)
+    if events is None:
+        # Not a botocore client (e.g. the load simulator's fakes)
+        return
+    events.register('needs-retry', _on_attempt)
+    events.register('after-call', _on_call)
+    events.register('after-call-error', _on_call)
+
+
+def _on_attempt(response=None, attempts=1, **kwargs):
+    # Called after every attempt; response is (http_response, parsed) or None
+    # on a connection error
+    if response is None:
+        return
+    http_response, parsed = response
+    code = parsed.get('Error', {}).get('Code')
+    if code in THROTTLE_CODES or http_response.status_code == 429:
+        with _stats_lock:
+            _stats['throttles'] += 1
+        metrics.count('ApiThrottles')
+
+
+def _on_call(parsed=None, **kwargs):
+    retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    with _stats_lock:
+        _stats['calls'] += 1
+        _stats['retries'] += retries
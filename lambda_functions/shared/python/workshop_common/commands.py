@@ -0,0 +1,48 @@
+# Shell commands behind each scenario. Kept apart from the scenario registry
+# (scenarios.py) so the chaos agent's allow-list, which launch.py writes into
+# the instance user data, is built from the same strings without importing
+# the handlers.
+
+# fill_disk: create 25GB file to push 30GB disk past 80% threshold
+# Note: Use /var/tmp instead of /tmp because /tmp is often tmpfs (RAM-based)
+FILL_DISK_COMMAND = 'fallocate -l 25G /var/tmp/filler.dat && df -h /'
+
+# reset_disk: remove filler files
+# Use verbose mode and capture stderr to detect immutable file errors
+RESET_DISK_COMMAND = 'output=$(rm -fv /var/tmp/filler*.dat 2>&1); echo "$output"; df -h /'
+
+# corrupt_disk: create 25GB file with immutable flag - reset_disk's rm -f will
+# fail with "Operation not permitted"
+CORRUPT_DISK_COMMAND = 'fallocate -l 25G /var/tmp/filler_corrupt.dat && chattr +i /var/tmp/filler_corrupt.dat && df -h /'
+
+# fix_corrupt_disk: first remove the immutable flag (suppress error if file
+# doesn't exist), then delete all filler files
+FIX_CORRUPT_DISK_COMMAND = 'chattr -i /var/tmp/filler_corrupt.dat 2>/dev/null || true && rm -f /var/tmp/filler*.dat && df -h /'
+
+# spike_cpu: run stress-ng in background for 1800 seconds (30 minutes)
+SPIKE_CPU_COMMAND = 'nohup stress-ng --cpu 2 --timeout 1800s > /dev/null 2>&1 & disown'
+
+# kill_and_restart: kill stress-ng, let the load settle, then sample CPU
+# busy time from /proc/stat over KILL_SAMPLE_SECONDS and report whether any
+# stress-ng survived. The handler only reboots if the sample shows load left.
+KILL_SAMPLE_SECONDS = 3
+KILL_COMMAND = (
+    'pkill -9 stress-ng || true; sleep 2; '
+    'read -r _ u n s i w q sq st _ < /proc/stat; '
+    f'sleep {KILL_SAMPLE_SECONDS}; '
+    'read -r _ u2 n2 s2 i2 w2 q2 sq2 st2 _ < /proc/stat; '
+    'busy=$(( (u2+n2+s2+q2+sq2+st2) - (u+n+s+q+sq+st) )); '
+    'total=$(( busy + (i2+w2) - (i+w) )); '
+    'echo "cpu_busy_percent=$(( total > 0 ? 100 * busy / total : 0 ))"; '
+    'echo "stress_ng_running=$(pgrep -c stress-ng || true)"'
+)
+
+# Scenario name -> command. The chaos agent runs only these (see chaos_agent.py)
+SCENARIO_COMMANDS = {
+    'fill_disk': FILL_DISK_COMMAND,
+    'reset_disk': RESET_DISK_COMMAND,
+    'corrupt_disk': CORRUPT_DISK_COMMAND,
+    'fix_corrupt_disk': FIX_CORRUPT_DISK_COMMAND,
+    'spike_cpu': SPIKE_CPU_COMMAND,
+    'kill_and_restart': KILL_COMMAND
+}
@@ -0,0 +1,43 @@
+import json
+
+from workshop_common.handlers import (
+    benchmark, fleet_breaches, incident_report, kill_and_restart, provision, status, teardown
+)
+from workshop_common.scenarios import SCENARIOS, run_scenario
+
+# Actions with their own handler; every other registered scenario runs through run_scenario
+HANDLERS = {
+    'provision': provision.lambda_handler,
+    'teardown': teardown.lambda_handler,
+    'kill_and_restart': kill_and_restart.lambda_handler,
+    'fleet_breaches': fleet_breaches.lambda_handler,
+    'status': status.lambda_handler,
+    'benchmark': benchmark.lambda_handler,
+    'incidents': incident_report.lambda_handler
+}
+
+ACTIONS = sorted(set(HANDLERS) | set(SCENARIOS))
+
+
+def lambda_handler(event, context):
+    """
+    Single entry point for every workshop action.
+
+    Input: {"action": "fill_disk", "username": "user123", ...}
+    The rest of the event is the chosen action's usual input, and the output is
+    that action's usual output. Serving everything from one function keeps one
+    pool of warm containers instead of one per action.
+    """
+    if isinstance(event, str):
+        event = json.loads(event)
+
+    action = event.get('action')
+    if action in HANDLERS:
+        return HANDLERS[action](event, context)
+    if action in SCENARIOS:
+        return run_scenario(action, event, context)
+
+    return {
+        'success': False,
+        'error': f"Unknown or missing action: {action}. Expected one of: {', '.join(ACTIONS)}"
+    }
@@ -0,0 +1,248 @@
+import time
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.ssm_runner import FIRST_POLL_DELAY, MAX_POLL_DELAY, POLL_BACKOFF, has_time_for
+
+WORKSHOP_TAG = 'devops-workshop'
+
+# SSM accepts at most 50 values per send_command target
+MAX_TARGET_VALUES = 50
+
+COMMAND_TERMINAL_STATUSES = ['Success', 'Failed', 'Cancelled', 'TimedOut']
+
+
+def run_bulk(ec2, ssm, event, command, interpret, context, timeout_seconds=60, max_wait_seconds=None,
+             comment=None):
+    """
+    Bulk mode shared by the SSM-backed handlers.
+
+    Targets either {"usernames": [...]} or {"all": true} (every instance tagged
+    workshop=<workshop>) with tag-targeted send_command calls instead of one
+    command per instance. Waits for the commands as a whole, then collects
+    every invocation with paginated list_command_invocations and passes each
+    one through the handler's interpret(result, instance_id, username).
+
+    Pass "command_ids" from an in-progress response to resume waiting.
+    comment is set on every command sent (e.g. the incident ID).
+
+    Output: {
+        "success": true,
+        "command_ids": ["..."],
+        "results": {"user1": {...handler output...}, "user2": {...}},
+        "summary": {"targeted": 2, "succeeded": 1, "failed": 1},
+        "timings": {"dispatch_ms": 150, "poll_ms": 4200, "collect_ms": 300, "total_ms": 4650}
+    }
+    """
+    started = time.monotonic()
+    workshop = event.get('workshop', WORKSHOP_TAG)
+
+    usernames = None
+    if event.get('usernames') is not None:
+        usernames = []
+        for username in event['usernames']:
+            safe_username = ''.join(c for c in str(username) if c.isalnum() or c in '-_').lower()
+            if safe_username and safe_username not in usernames:
+                usernames.append(safe_username)
+        if not usernames:
+            return {
+                'success': False,
+                'error': 'Field usernames must be a non-empty list'
+            }
+
+    command_ids = event.get('command_ids')
+    if not command_ids:
+        if usernames is None:
+            target_sets = [[{'Key': 'tag:workshop', 'Values': [workshop]}]]
+        else:
+            target_sets = [
+                [
+                    {'Key': 'tag:workshop-user', 'Values': usernames[i:i + MAX_TARGET_VALUES]},
+                    {'Key': 'tag:workshop', 'Values': [workshop]}
+                ]
+                for i in range(0, len(usernames), MAX_TARGET_VALUES)
+            ]
+
+        command_ids = []
+        for targets in target_sets:
+            print(f"Sending SSM command to targets {targets}: {command}")
+            params = {
+                'Targets': targets,
+                'DocumentName': 'AWS-RunShellScript',
+                'Parameters': {'commands': [command]},
+                'TimeoutSeconds': timeout_seconds,
+                'MaxConcurrency': str(event.get('max_concurrency', '50')),
+                'MaxErrors': str(event.get('max_errors', '100%'))
+            }
+            if comment:
+                params['Comment'] = comment[:100]
+            response = ssm.send_command(**params)
+            command_ids.append(response['Command']['CommandId'])
+
+    dispatched = time.monotonic()
+    pending = wait_for_commands(ssm, command_ids, context, max_wait_seconds)
+    polled = time.monotonic()
+
+    instance_users = workshop_instance_users(ec2, workshop)
+    invocations = collect_invocations(ssm, command_ids)
+    collected = time.monotonic()
+    metrics.add_phase('dispatch', (dispatched - started) * 1000)
+    metrics.add_phase('poll', (polled - dispatched) * 1000)
+    metrics.add_phase('collect', (collected - polled) * 1000)
+
+    results = {}
+    for invocation in invocations:
+        instance_id = invocation['InstanceId']
+        username = instance_users.get(instance_id, instance_id)
+        if invocation['resumable']:
+            results[username] = {
+                'success': False,
+                'in_progress': True,
+                'instance_id': instance_id,
+                'username': username,
+                'command_id': invocation['command_id']
+            }
+        else:
+            results[username] = interpret(invocation, instance_id, username)
+
+    # A user without an invocation yet is only known to have no instance once
+    # the command targeting them has finished resolving its targets
+    for username, command_id in user_commands(usernames or [], command_ids).items():
+        if username in results:
+            continue
+        if command_id in pending or (command_id is None and pending):
+            results[username] = {
+                'success': False,
+                'in_progress': True,
+                'username': username,
+                'command_id': command_id or pending[0]
+            }
+        else:
+            results[username] = {
+                'success': False,
+                'username': username,
+                'error': f'No running instance found for user: {username}'
+            }
+
+    summary = {
+        'targeted': len(invocations),
+        'succeeded': sum(1 for r in results.values() if r.get('success')),
+        'in_progress': sum(1 for r in results.values() if r.get('in_progress')),
+        'failed': sum(1 for r in results.values() if not r.get('success') and not r.get('in_progress'))
+    }
+
+    response = {
+        'success': True,
+        'command_ids': command_ids,
+        'results': results,
+        'summary': summary,
+        'timings': {
+            'dispatch_ms': int((dispatched - started) * 1000),
+            'poll_ms': int((polled - dispatched) * 1000),
+            'collect_ms': int((collected - polled) * 1000),
+            'total_ms': int((collected - started) * 1000)
+        }
+    }
+    if pending:
+        response['in_progress'] = True
+        response['message'] = (
+            f"{len(pending)} command(s) still running. "
+            "Call again with these command_ids to resume waiting."
+        )
+    return response
+
+
+def user_commands(usernames, command_ids):
+    """
+    Username -> ID of the command targeting it. Commands are sent for
+    MAX_TARGET_VALUES users at a time, in order; None for every user when the
+    command IDs don't line up with that (a resume with a different list).
+    """
+    chunks = (len(usernames) + MAX_TARGET_VALUES - 1) // MAX_TARGET_VALUES
+    if len(command_ids) != chunks:
+        return {username: None for username in usernames}
+    return {username: command_ids[i // MAX_TARGET_VALUES] for i, username in enumerate(usernames)}
+
+
+def wait_for_commands(ssm, command_ids, context=None, max_wait_seconds=None):
+    """Poll list_commands with adaptive backoff. Returns the command IDs still running."""
+    started = time.monotonic()
+    delay = FIRST_POLL_DELAY
+    pending = list(command_ids)
+
+    while pending:
+        if not has_time_for(delay, started, context, max_wait_seconds):
+            print(f"Out of time with {len(pending)} command(s) still running")
+            break
+
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, MAX_POLL_DELAY)
+        metrics.count('PollIterations')
+
+        still_running = []
+        for command_id in pending:
+            commands = ssm.list_commands(CommandId=command_id)['Commands']
+            status = commands[0]['Status'] if commands else 'Pending'
+            if status not in COMMAND_TERMINAL_STATUSES:
+                still_running.append(command_id)
+            print(f"Command {command_id} status: {status}")
+        pending = still_running
+
+    return pending
+
+
+def collect_invocations(ssm, command_ids):
+    """
+    Gather every invocation of the given commands in runner result form:
+    {"InstanceId", "status", "resumable", "command_id", "stdout", "stderr", "timings"}.
+    """
+    invocations = []
+    paginator = ssm.get_paginator('list_command_invocations')
+    for command_id in command_ids:
+        for page in paginator.paginate(CommandId=command_id, Details=True):
+            for invocation in page['CommandInvocations']:
+                status = invocation['Status']
+                plugins = invocation.get('CommandPlugins') or [{}]
+                output = plugins[0].get('Output', '')
+                stdout, _, stderr = output.partition('----------ERROR-------')
+
+                timings = {}
+                requested = invocation.get('RequestedDateTime')
+                finished = plugins[0].get('ResponseFinishDateTime')
+                if requested and finished:
+                    timings['total_ms'] = int((finished - requested).total_seconds() * 1000)
+
+                invocations.append({
+                    'InstanceId': invocation['InstanceId'],
+                    'status': status,
+                    'resumable': status not in COMMAND_TERMINAL_STATUSES,
+                    'command_id': command_id,
+                    'stdout': stdout.strip('\n'),
+                    'stderr': stderr.strip('\n'),
+                    'polls': 0,
+                    'timings': timings
+                })
+    return invocations
+
+
+def workshop_instance_users(ec2, workshop=WORKSHOP_TAG):
+    """Map instance ID -> workshop-user tag for every live instance in the workshop."""
+    users = {}
+    paginator = ec2.get_paginator('describe_instances')
+    try:
+        pages = paginator.paginate(
+            Filters=[
+                {'Name': 'tag:workshop', 'Values': [workshop]},
+                {'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']}
+            ]
+        )
+        for page in pages:
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+                    if 'workshop-user' in tags:
+                        users[instance['InstanceId']] = tags['workshop-user']
+    except ClientError as e:
+        # Results are still useful keyed by instance ID
+        print(f"Could not map instances to users: {e}")
+    return users
@@ -0,0 +1,7 @@
+"""
+Handlers for the actions that need more than a registered SSM scenario
+(see workshop_common.scenarios). Each module exposes lambda_handler(event, context),
+served both by its own function and by the dispatcher, except command_complete,
+which SSM's completion notifications invoke directly, and fleet_breaches, status,
+benchmark and incident_report (the "incidents" action), which only the dispatcher serves.
+"""
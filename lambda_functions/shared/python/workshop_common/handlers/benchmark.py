@@ -0,0 +1,378 @@
+import json
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.clients import client
+from workshop_common.fanout import run_bulk
+from workshop_common.instance_index import run_on_user_instance
+from workshop_common.scenarios import command_failed
+from workshop_common.ssm_runner import run_command, still_running_response
+
+# DynamoDB table keeping every run for comparison (hash key instance_type,
+# range key run_key = "<started_at>#<instance_id>"). Unset, results are only returned.
+BENCHMARK_TABLE = os.environ.get('BENCHMARK_TABLE')
+
+# Bounded stress-ng stages, each reporting --metrics-brief. {load} is only
+# used by the cpu stage, which runs once per level of the cpu_loads sweep.
+STRESSORS = {
+    'cpu': 'stress-ng --cpu 0 --cpu-load {load}',
+    'vm': 'stress-ng --vm 1 --vm-bytes 256M',
+    'io': 'stress-ng --hdd 1 --hdd-bytes 256M --temp-path /var/tmp',
+    'latency': 'stress-ng --cyclic 1 --cyclic-policy rr'
+}
+DEFAULT_STRESSORS = ['cpu', 'vm', 'io', 'latency']
+DEFAULT_CPU_LOADS = [100]
+DEFAULT_STAGE_SECONDS = 10
+
+# Keep a whole run inside one 300 s dispatcher invocation
+MAX_TOTAL_SECONDS = 240
+
+# Where the sweep says credit throttling starts: the first load level whose
+# bogo-ops/s per point of load falls this far below the lowest level's, or
+# whose steal time passes THROTTLE_STEAL_PERCENT
+THROTTLE_EFFICIENCY_DROP = 0.2
+THROTTLE_STEAL_PERCENT = 10
+
+# Shell helpers: CPU time totals from /proc/stat around each stage, so steal
+# time (what a t3 out of credits is throttled with) can be reported per stage
+BENCHMARK_PRELUDE = (
+    'sample() { read -r _ u n s i w q sq st _ < /proc/stat; echo "$((u+n+s+i+w+q+sq+st)) $st"; }; '
+    'steal() { set -- $1 $2; echo "steal_percent=$(( $3 > $1 ? 100 * ($4 - $2) / ($3 - $1) : 0 ))"; }; '
+    'TOKEN=$(curl -s -m 2 -X PUT http://169.254.169.254/latest/api/token -H "X-aws-ec2-metadata-token-ttl-seconds: 60"); '
+    'echo "instance_type=$(curl -s -m 2 -H "X-aws-ec2-metadata-token: $TOKEN" '
+    'http://169.254.169.254/latest/meta-data/instance-type)"; '
+)
+
+STAGE_HEADER = re.compile(r'^=== stage (\w+)(?: load=(\d+))?$')
+# "stress-ng: info:  [123] cpu  12345  10.00  19.90  0.01  1234.45  620.12"
+# (newer stress-ng prints "metrc:" and extra columns after these)
+METRICS_LINE = re.compile(
+    r'\]\s+([a-z][\w-]*)\s+(\d+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)'
+)
+CYCLIC_MEAN = re.compile(r'cyclic:\s+mean: ([\d.]+) ns')
+CYCLIC_MAX = re.compile(r'cyclic:\s+min: (\d+) ns, max: (\d+) ns')
+CYCLIC_PERCENTILE = re.compile(r'cyclic:\s+([\d.]+)%:\s+(\d+) ns')
+
+
+@metrics.instrumented('benchmark')
+def lambda_handler(event, context):
+    """
+    Capacity benchmark: bounded stress-ng stages on a user's instance, parsed
+    into bogo-ops/s, steal time and latency figures, and stored per instance
+    type for comparison across runs.
+
+    Input: {"action": "benchmark", "username": "user123"}
+    Optional: "stressors": ["cpu", "vm", "io", "latency"] (default all four),
+              "cpu_loads": [25, 50, 75, 100] (cpu stage sweep, default [100]),
+              "stage_seconds": 10,
+              "instance_id": "i-xxx" skips the username -> instance lookup,
+              "command_id": "..." resumes a run that outlived the previous call
+    Bulk: {"usernames": [...]} or {"all": true}, as for the SSM scenarios
+    Compare: {"action": "benchmark", "compare": ["t3.micro", "t3a.micro"], "limit": 5}
+             returns the latest stored runs per instance type
+    Output: {
+        "success": true,
+        "instance_id": "i-xxx",
+        "username": "user123",
+        "instance_type": "t3.micro",
+        "run_id": "...",
+        "stages": [
+            {"stage": "cpu", "cpu_load": 50, "stressor": "cpu", "bogo_ops": 41200,
+             "bogo_ops_per_second": 4120.0, "bogo_ops_per_cpu_second": 2060.0, "steal_percent": 0},
+            {"stage": "latency", "latency_ns": {"mean": 5870.3, "p50": 5594, "p99": 10608, "max": 69430}}
+        ],
+        "sweep": [{"cpu_load": 50, "bogo_ops_per_second": 4120.0, "per_load_point": 82.4, "steal_percent": 0}],
+        "throttle_onset_cpu_load": 75,   # null if the sweep never throttled
+        "cpu_credit_balance": 12.5,      # latest CPUCreditBalance, null for non-burstable types
+        "stored": true
+    }
+    """
+    try:
+        # Parse input
+        if isinstance(event, str):
+            event = json.loads(event)
+
+        if event.get('compare'):
+            return compare_runs(event['compare'], int(event.get('limit', 5)))
+
+        stressors = event.get('stressors', DEFAULT_STRESSORS)
+        cpu_loads = [int(load) for load in event.get('cpu_loads', DEFAULT_CPU_LOADS)]
+        stage_seconds = int(event.get('stage_seconds', DEFAULT_STAGE_SECONDS))
+        unknown = [s for s in stressors if s not in STRESSORS]
+        if unknown or not stressors:
+            return {
+                'success': False,
+                'error': f"Unknown stressor: {unknown[0] if unknown else None}. Expected some of: {', '.join(STRESSORS)}"
+            }
+        if not cpu_loads or any(load < 1 or load > 100 for load in cpu_loads):
+            return {
+                'success': False,
+                'error': 'cpu_loads must be a non-empty list of percentages between 1 and 100'
+            }
+        stages = stage_count(stressors, cpu_loads)
+        if stage_seconds < 1:
+            return {
+                'success': False,
+                'error': 'stage_seconds must be at least 1'
+            }
+        if stages * stage_seconds > MAX_TOTAL_SECONDS:
+            return {
+                'success': False,
+                'error': f"{stages} stage(s) x {stage_seconds} s exceeds the {MAX_TOTAL_SECONDS} s limit per run"
+            }
+
+        command = benchmark_command(stressors, cpu_loads, stage_seconds)
+        timeout_seconds = stages * stage_seconds + 60
+        interpret = benchmark_interpreter(uuid.uuid4().hex, datetime.now(timezone.utc).isoformat(), stage_seconds)
+
+        # Bulk mode: one tag-targeted SSM command for many users
+        if event.get('usernames') is not None or event.get('all'):
+            return run_bulk(client('ec2'), client('ssm'), event, command, interpret, context,
+                            timeout_seconds=timeout_seconds)
+
+        username = event.get('username')
+        if not username:
+            return {
+                'success': False,
+                'error': 'Missing required field: username'
+            }
+
+        # Sanitize username
+        safe_username = ''.join(c for c in username if c.isalnum() or c in '-_').lower()
+
+        instance_id, result = run_on_user_instance(
+            client('ec2'), safe_username,
+            lambda iid: run_command(client('ssm'), iid, command, context,
+                                    timeout_seconds=timeout_seconds, command_id=event.get('command_id')),
+            instance_id=event.get('instance_id')
+        )
+
+        if not instance_id:
+            return {
+                'success': False,
+                'error': f'No running instance found for user: {safe_username}'
+            }
+
+        if result['resumable']:
+            return still_running_response(result, instance_id, safe_username)
+
+        return interpret(result, instance_id, safe_username)
+
+    except ClientError as e:
+        print(f"AWS Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def stage_count(stressors, cpu_loads):
+    return sum(len(cpu_loads) if s == 'cpu' else 1 for s in stressors)
+
+
+def benchmark_command(stressors, cpu_loads, stage_seconds):
+    """One shell command running every stage in turn, each under a "=== stage" header."""
+    parts = [BENCHMARK_PRELUDE]
+    for stressor in stressors:
+        for load in (cpu_loads if stressor == 'cpu' else [None]):
+            header = f'=== stage {stressor}' + (f' load={load}' if load is not None else '')
+            run = STRESSORS[stressor].format(load=load)
+            parts.append(
+                f'echo "{header}"; a=$(sample); '
+                f'{run} --timeout {stage_seconds}s --metrics-brief 2>&1; '
+                'b=$(sample); steal "$a" "$b"; '
+            )
+    return ''.join(parts)
+
+
+def parse_benchmark(output):
+    """(instance_type, stages) from benchmark_command output."""
+    instance_type = None
+    stages = []
+    stage = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('instance_type='):
+            instance_type = line.split('=', 1)[1] or None
+            continue
+        header = STAGE_HEADER.match(line)
+        if header:
+            stage = {'stage': header.group(1)}
+            if header.group(2):
+                stage['cpu_load'] = int(header.group(2))
+            stages.append(stage)
+            continue
+        if stage is None:
+            continue
+        if line.startswith('steal_percent='):
+            stage['steal_percent'] = int(line.split('=', 1)[1])
+            continue
+        if stage['stage'] == 'latency':
+            latency = stage.setdefault('latency_ns', {})
+            mean = CYCLIC_MEAN.search(line)
+            extremes = CYCLIC_MAX.search(line)
+            percentile = CYCLIC_PERCENTILE.search(line)
+            if mean:
+                latency['mean'] = float(mean.group(1))
+            elif extremes:
+                latency['min'], latency['max'] = int(extremes.group(1)), int(extremes.group(2))
+            elif percentile:
+                latency[f"p{float(percentile.group(1)):g}"] = int(percentile.group(2))
+            continue
+        match = METRICS_LINE.search(line)
+        if match:
+            stage.update({
+                'stressor': match.group(1),
+                'bogo_ops': int(match.group(2)),
+                'bogo_ops_per_second': float(match.group(6)),
+                'bogo_ops_per_cpu_second': float(match.group(7))
+            })
+    return instance_type, stages
+
+
+def cpu_sweep(stages):
+    """The cpu stages by load, with where credit throttling appears to start."""
+    sweep = sorted(
+        (
+            {
+                'cpu_load': s['cpu_load'],
+                'bogo_ops_per_second': s['bogo_ops_per_second'],
+                'per_load_point': round(s['bogo_ops_per_second'] / s['cpu_load'], 1),
+                'steal_percent': s.get('steal_percent')
+            }
+            for s in stages if s['stage'] == 'cpu' and 'bogo_ops_per_second' in s
+        ),
+        key=lambda s: s['cpu_load']
+    )
+    onset = None
+    if sweep:
+        baseline = sweep[0]['per_load_point']
+        for point in sweep:
+            dropped = baseline and point['per_load_point'] < baseline * (1 - THROTTLE_EFFICIENCY_DROP)
+            if dropped or (point['steal_percent'] or 0) >= THROTTLE_STEAL_PERCENT:
+                onset = point['cpu_load']
+                break
+    return sweep, onset
+
+
+def benchmark_interpreter(run_id, started_at, stage_seconds):
+    """Build the interpret(result, instance_id, username) for one benchmark run."""
+
+    def interpret(result, instance_id, username):
+        if result['status'] != 'Success':
+            return command_failed(result, instance_id, username)
+        instance_type, stages = parse_benchmark(result['stdout'])
+        sweep, onset = cpu_sweep(stages)
+        response = {
+            'success': True,
+            'instance_id': instance_id,
+            'username': username,
+            'instance_type': instance_type,
+            'run_id': run_id,
+            'started_at': started_at,
+            'stage_seconds': stage_seconds,
+            'stages': stages,
+            'sweep': sweep,
+            'throttle_onset_cpu_load': onset,
+            'cpu_credit_balance': cpu_credit_balance(instance_id),
+            'command_id': result['command_id']
+        }
+        response['stored'] = store_run(response)
+        return response
+
+    return interpret
+
+
+def cpu_credit_balance(instance_id):
+    """Latest CPUCreditBalance for a burstable instance, or None."""
+    end = datetime.now(timezone.utc)
+    try:
+        values = client('cloudwatch').get_metric_data(
+            MetricDataQueries=[{
+                'Id': 'credits',
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'AWS/EC2',
+                        'MetricName': 'CPUCreditBalance',
+                        'Dimensions': [{'Name': 'InstanceId', 'Value': instance_id}]
+                    },
+                    'Period': 300,
+                    'Stat': 'Average'
+                }
+            }],
+            StartTime=end - timedelta(minutes=15),
+            EndTime=end,
+            ScanBy='TimestampDescending'
+        )['MetricDataResults'][0]['Values']
+    except ClientError as e:
+        print(f"Could not read CPU credit balance for {instance_id}: {e}")
+        return None
+    return round(values[0], 1) if values else None
+
+
+def store_run(response):
+    """Write a run to BENCHMARK_TABLE. Returns True when stored."""
+    if not BENCHMARK_TABLE:
+        return False
+    try:
+        client('dynamodb').put_item(
+            TableName=BENCHMARK_TABLE,
+            Item={
+                'instance_type': {'S': response['instance_type'] or 'unknown'},
+                'run_key': {'S': f"{response['started_at']}#{response['instance_id']}"},
+                'run_id': {'S': response['run_id']},
+                'instance_id': {'S': response['instance_id']},
+                'username': {'S': response['username']},
+                'results': {'S': json.dumps({
+                    k: response[k] for k in
+                    ('stage_seconds', 'stages', 'sweep', 'throttle_onset_cpu_load', 'cpu_credit_balance')
+                })}
+            }
+        )
+        return True
+    except ClientError as e:
+        print(f"Could not store benchmark run {response['run_id']}: {e}")
+        return False
+
+
+def compare_runs(instance_types, limit):
+    """Latest `limit` stored runs per instance type, newest first."""
+    if not BENCHMARK_TABLE:
+        return {
+            'success': False,
+            'error': 'Benchmark storage is not configured (BENCHMARK_TABLE unset)'
+        }
+    runs = {}
+    for instance_type in instance_types:
+        items = client('dynamodb').query(
+            TableName=BENCHMARK_TABLE,
+            KeyConditionExpression='instance_type = :t',
+            ExpressionAttributeValues={':t': {'S': instance_type}},
+            ScanIndexForward=False,
+            Limit=limit
+        )['Items']
+        runs[instance_type] = [
+            {
+                'run_id': item['run_id']['S'],
+                'started_at': item['run_key']['S'].split('#')[0],
+                'instance_id': item['instance_id']['S'],
+                'username': item['username']['S'],
+                **json.loads(item['results']['S'])
+            }
+            for item in items
+        ]
+    return {
+        'success': True,
+        'runs': runs
+    }
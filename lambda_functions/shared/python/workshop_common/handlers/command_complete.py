@@ -0,0 +1,162 @@
+import json
+import os
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from workshop_common import incidents, leases, metrics
+from workshop_common.clients import client
+from workshop_common.handlers.kill_and_restart import reboot_after_kill
+from workshop_common.scenarios import SCENARIOS, parse_async_comment
+from workshop_common.ssm_runner import TERMINAL_STATUSES
+
+# n8n webhook that receives each finished command's response. Unset, the
+# payload is only logged.
+N8N_CALLBACK_URL = os.environ.get('N8N_CALLBACK_URL')
+CALLBACK_TIMEOUT_SECONDS = 10
+CALLBACK_ATTEMPTS = 3
+
+# Steps that run after a scenario's command has finished, before the callback
+FOLLOW_UPS = {
+    'kill_and_restart': reboot_after_kill
+}
+
+
+@metrics.instrumented('command_complete')
+def lambda_handler(event, context):
+    """
+    Finish event-driven scenario commands (sent with "wait": false).
+
+    Input: the SNS notification SSM publishes when an invocation finishes
+           (NotificationType "Invocation"), an EventBridge "EC2 Command
+           Invocation Status-change Notification", or, for testing,
+           {"command_id": "...", "instance_id": "i-xxx"}
+    For each finished invocation, reads its output with get_command_invocation,
+    applies the scenario's interpret() (the same response the synchronous call
+    returns, including reset_disk's requires_escalation), records it on the
+    incident timeline under the incident ID from the command's comment,
+    releases the attendee's action lease the command held, and POSTs
+    {"action": "<scenario>", ...response} to N8N_CALLBACK_URL.
+
+    Output: {
+        "success": true,
+        "results": [{"action": "reset_disk", "command_id": "...", "delivered": true, ...}]
+    }
+    """
+    try:
+        if isinstance(event, str):
+            event = json.loads(event)
+
+        results = []
+        for command_id, instance_id, status in notifications(event):
+            if status and status not in TERMINAL_STATUSES:
+                continue
+            results.append(complete_command(command_id, instance_id))
+
+        return {
+            'success': all(r.get('delivered', True) for r in results),
+            'results': results
+        }
+
+    except ClientError as e:
+        print(f"AWS Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def notifications(event):
+    """Yield (command_id, instance_id, status) for each invocation the event reports."""
+    for record in event.get('Records', []):
+        message = json.loads(record['Sns']['Message'])
+        yield message['commandId'], message['instanceId'], message.get('status')
+    if 'detail' in event:
+        detail = event['detail']
+        yield detail['command-id'], detail['instance-id'], detail.get('status')
+    if 'command_id' in event:
+        yield event['command_id'], event['instance_id'], event.get('status')
+
+
+def complete_command(command_id, instance_id):
+    """Interpret one finished invocation and post it to the callback."""
+    invocation = client('ssm').get_command_invocation(CommandId=command_id, InstanceId=instance_id)
+
+    parsed = parse_async_comment(invocation.get('Comment'))
+    if not parsed:
+        # Not sent by dispatch_scenario (e.g. a synchronous command)
+        print(f"Ignoring command {command_id}: not an event-driven scenario command")
+        return {'command_id': command_id, 'ignored': True}
+    name, username, incident_id, cohort = parsed
+
+    result = {
+        'status': invocation['Status'],
+        'resumable': False,
+        'command_id': command_id,
+        'stdout': invocation.get('StandardOutputContent', ''),
+        'stderr': invocation.get('StandardErrorContent', ''),
+        'polls': 0,
+        'timings': command_timings(invocation)
+    }
+    response = SCENARIOS[name]['interpret'](result, instance_id, username)
+    if name in FOLLOW_UPS:
+        response = FOLLOW_UPS[name](response)
+    # dispatch_scenario handed the attendee's lease to this command
+    leases.release_holder(username, command_id)
+    incidents.track(name, incident_id, [response], cohort, invocation_started_at(invocation))
+
+    payload = {'action': name, **response}
+    delivered = post_callback(payload)
+    return {**payload, 'delivered': delivered}
+
+
+def invocation_started_at(invocation):
+    """When the invocation started running, as an ISO timestamp, or None."""
+    try:
+        started = datetime.fromisoformat(invocation['ExecutionStartDateTime'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (started if started.tzinfo else started.replace(tzinfo=timezone.utc)).isoformat()
+
+
+def command_timings(invocation):
+    """Execution time on the instance, from the invocation's start and end timestamps."""
+    try:
+        start = datetime.fromisoformat(invocation['ExecutionStartDateTime'])
+        end = datetime.fromisoformat(invocation['ExecutionEndDateTime'])
+    except (KeyError, TypeError, ValueError):
+        return {}
+    return {'total_ms': int((end - start).total_seconds() * 1000)}
+
+
+def post_callback(payload):
+    """POST payload as JSON to N8N_CALLBACK_URL, retrying a few times. Returns True once delivered."""
+    body = json.dumps(payload).encode()
+    if not N8N_CALLBACK_URL:
+        print(f"No N8N_CALLBACK_URL set; result: {body.decode()}")
+        return True
+
+    request = urllib.request.Request(
+        N8N_CALLBACK_URL,
+        data=body,
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    for attempt in range(CALLBACK_ATTEMPTS):
+        try:
+            with urllib.request.urlopen(request, timeout=CALLBACK_TIMEOUT_SECONDS) as response:
+                print(f"Callback for {payload['action']} returned HTTP {response.status}")
+                return True
+        except OSError as e:
+            print(f"Callback attempt {attempt + 1} failed: {e}")
+            if attempt + 1 < CALLBACK_ATTEMPTS:
+                time.sleep(2 ** attempt)
+    return False
@@ -0,0 +1,121 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.clients import client
+from workshop_common.launch import FLEET_ALARM_PERIOD, FLEET_QUERIES, fleet_alarm_name
+
+DEFAULT_LOOKBACK_MINUTES = 5
+
+
+@metrics.instrumented('fleet_breaches')
+def lambda_handler(event, context):
+    """
+    List the instances breaching the fleet alarms, with their workshop users.
+
+    A fleet alarm's SNS notification names the alarm, not the instance; n8n
+    calls this (through the dispatcher) to find out who to remediate.
+
+    Input: {"action": "fleet_breaches"}
+    Optional: "metric": "disk" | "cpu" (default both), "minutes": 5 (lookback)
+    Output: {
+        "success": true,
+        "breaches": [
+            {"metric": "disk", "alarm_name": "workshop-fleet-devops-workshop-disk-high",
+             "instance_id": "i-xxx", "username": "user123",
+             "value": 91.2, "threshold": 80, "timestamp": "2024-05-01T12:00:00+00:00"}
+        ]
+    }
+    """
+    try:
+        # Parse input
+        if isinstance(event, str):
+            event = json.loads(event)
+
+        wanted = [event['metric']] if event.get('metric') else list(FLEET_QUERIES)
+        unknown = [m for m in wanted if m not in FLEET_QUERIES]
+        if unknown:
+            return {
+                'success': False,
+                'error': f"Unknown metric: {unknown[0]}. Expected one of: {', '.join(FLEET_QUERIES)}"
+            }
+
+        breaches = find_breaches(wanted, int(event.get('minutes', DEFAULT_LOOKBACK_MINUTES)))
+        users = instance_users([b['instance_id'] for b in breaches])
+        for breach in breaches:
+            breach['username'] = users.get(breach['instance_id'])
+
+        return {
+            'success': True,
+            'breaches': breaches
+        }
+
+    except ClientError as e:
+        print(f"AWS Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def find_breaches(wanted, minutes):
+    """
+    Run the fleet alarms' queries and keep instances whose latest value is
+    over the threshold. Only each series' first (newest) value counts.
+    """
+    end = datetime.now(timezone.utc)
+    queries = [
+        {'Id': metric, 'Expression': FLEET_QUERIES[metric][0], 'Period': FLEET_ALARM_PERIOD, 'ReturnData': True}
+        for metric in wanted
+    ]
+
+    breaches = []
+    seen = set()
+    paginator = client('cloudwatch').get_paginator('get_metric_data')
+    pages = paginator.paginate(
+        MetricDataQueries=queries,
+        StartTime=end - timedelta(minutes=minutes),
+        EndTime=end,
+        ScanBy='TimestampDescending'
+    )
+    for page in pages:
+        for result in page['MetricDataResults']:
+            # Newest first; a GROUP BY InstanceId series is labelled with the
+            # instance ID, and later pages only continue it with older values
+            if not result['Values'] or (result['Id'], result['Label']) in seen:
+                continue
+            seen.add((result['Id'], result['Label']))
+            metric = result['Id']
+            threshold = FLEET_QUERIES[metric][1]
+            value = result['Values'][0]
+            if value > threshold:
+                breaches.append({
+                    'metric': metric,
+                    'alarm_name': fleet_alarm_name(metric),
+                    'instance_id': result['Label'],
+                    'value': round(value, 1),
+                    'threshold': threshold,
+                    'timestamp': result['Timestamps'][0].isoformat()
+                })
+    return breaches
+
+
+def instance_users(instance_ids):
+    """Map instance ID -> workshop-user tag."""
+    users = {}
+    if not instance_ids:
+        return users
+    response = client('ec2').describe_instances(InstanceIds=sorted(set(instance_ids)))
+    for reservation in response['Reservations']:
+        for instance in reservation['Instances']:
+            tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+            users[instance['InstanceId']] = tags.get('workshop-user')
+    return users
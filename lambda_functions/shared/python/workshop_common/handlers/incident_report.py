@@ -0,0 +1,186 @@
+import json
+import statistics
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.clients import client
+from workshop_common.incidents import INCIDENT_TABLE, cohort_of, detection_time
+
+# Alarm history lookups per report for incidents whose detection time is
+# still unknown (found ones are written back, so later reports skip them)
+MAX_DETECTION_LOOKUPS = 20
+
+# Stage -> (from, to) timestamps its duration spans
+STAGES = {
+    'detect': ('injected_at', 'detected_at'),
+    'respond': ('detected_at', 'responded_at'),
+    'recover': ('responded_at', 'recovered_at'),
+    'total': ('injected_at', 'recovered_at')
+}
+
+
+@metrics.instrumented('incidents')
+def lambda_handler(event, context):
+    """
+    Incident timeline report: how long each injected incident took to be
+    detected (alarm fired), responded to (remediation invoked) and recovered
+    (remediation cleared it), per incident and across the cohort.
+
+    Input: {"action": "incidents"}
+    Optional: "incident_id": "3f2a9c1b7d4e" (one incident),
+              "username": "user123" (one user's incidents),
+              "workshop": "devops-workshop" (the cohort, default this workshop)
+    Output: {
+        "success": true,
+        "cohort": {
+            "workshop": "devops-workshop", "incidents": 12, "users": 40, "open": 3,
+            "detect_seconds": {"count": 38, "mean": 71.4, "p50": 65.0, "max": 140.2},
+            "respond_seconds": {...}, "recover_seconds": {...}, "total_seconds": {...}
+        },
+        "incidents": [
+            {"incident_id": "3f2a9c1b7d4e", "scenario": "fill_disk", "injected_at": "...",
+             "users": 1, "open": 0, "detect_seconds": {...}, ...,
+             "timelines": [{"username": "user123", "instance_id": "i-xxx", "kind": "disk",
+                            "alarm_name": "...", "remediation": "reset_disk",
+                            "injected_at": "...", "detected_at": "...", "responded_at": "...",
+                            "recovered_at": "...", "durations": {"detect_seconds": 65.0, ...},
+                            "events": [{"step": "injected", "at": "...", "source": "fill_disk",
+                                        "command_id": "..."}, ...]}]}
+        ]
+    }
+    """
+    try:
+        # Parse input
+        if isinstance(event, str):
+            event = json.loads(event)
+
+        if not INCIDENT_TABLE:
+            return {
+                'success': False,
+                'error': 'Incident timeline is not configured (INCIDENT_TABLE unset)'
+            }
+
+        cohort = cohort_of(event)
+        records = [
+            timeline(item) for item in incident_items(cohort)
+            if (not event.get('incident_id') or item['incident_id']['S'] == event['incident_id'])
+            and (not event.get('username') or item['username']['S'] == event['username'])
+        ]
+        fill_detections(cohort, records)
+        for record in records:
+            record['durations'] = durations(record)
+
+        by_incident = {}
+        for record in sorted(records, key=lambda r: r['injected_at']):
+            by_incident.setdefault(record['incident_id'], []).append(record)
+
+        return {
+            'success': True,
+            'cohort': {'workshop': cohort, 'incidents': len(by_incident), **summary(records)},
+            'incidents': [
+                {
+                    'incident_id': incident_id,
+                    'scenario': timelines[0]['scenario'],
+                    'injected_at': timelines[0]['injected_at'],
+                    **summary(timelines),
+                    'timelines': [{k: v for k, v in t.items() if k not in ('incident_id', 'scenario')}
+                                  for t in timelines]
+                }
+                for incident_id, timelines in reversed(by_incident.items())
+            ]
+        }
+
+    except ClientError as e:
+        print(f"AWS Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def incident_items(cohort):
+    """Every incident item in the cohort's partition (open incident pointers skipped)."""
+    paginator = client('dynamodb').get_paginator('query')
+    pages = paginator.paginate(
+        TableName=INCIDENT_TABLE,
+        KeyConditionExpression='cohort = :c',
+        ExpressionAttributeValues={':c': {'S': cohort}}
+    )
+    for page in pages:
+        for item in page['Items']:
+            if not item['incident_key']['S'].startswith('open#'):
+                yield item
+
+
+def timeline(item):
+    """An incident item as plain JSON."""
+    record = {
+        name: item[name]['S']
+        for name in ('incident_id', 'username', 'instance_id', 'kind', 'scenario', 'alarm_name',
+                     'remediation', 'injected_at', 'detected_at', 'responded_at', 'recovered_at')
+        if name in item
+    }
+    record['events'] = [
+        {k: v['S'] for k, v in entry['M'].items()}
+        for entry in item.get('events', {}).get('L', [])
+    ]
+    return record
+
+
+def fill_detections(cohort, records):
+    """Look up (and store) detection times still missing, up to MAX_DETECTION_LOOKUPS."""
+    missing = [r for r in records if 'detected_at' not in r and r.get('alarm_name')]
+    for record in missing[:MAX_DETECTION_LOOKUPS]:
+        detected_at = detection_time(record['alarm_name'], record['injected_at'])
+        if not detected_at:
+            continue
+        record['detected_at'] = detected_at
+        record['events'].insert(1, {'step': 'detected', 'at': detected_at, 'source': 'alarm'})
+        client('dynamodb').update_item(
+            TableName=INCIDENT_TABLE,
+            Key={
+                'cohort': {'S': cohort},
+                'incident_key': {'S': f"{record['incident_id']}#{record['username']}"}
+            },
+            UpdateExpression='SET detected_at = if_not_exists(detected_at, :detected)',
+            ExpressionAttributeValues={':detected': {'S': detected_at}}
+        )
+
+
+def durations(record):
+    """Seconds each stage took, None where either end is not recorded yet."""
+    result = {}
+    for stage, (start, end) in STAGES.items():
+        seconds = None
+        if record.get(start) and record.get(end):
+            seconds = round(
+                (datetime.fromisoformat(record[end]) - datetime.fromisoformat(record[start])).total_seconds(), 1
+            )
+        result[f'{stage}_seconds'] = seconds
+    return result
+
+
+def summary(records):
+    """User and open counts plus count/mean/p50/max of each stage over `records`."""
+    result = {
+        'users': len(records),
+        'open': sum(1 for r in records if 'recovered_at' not in r)
+    }
+    for stage in STAGES:
+        values = [r['durations'][f'{stage}_seconds'] for r in records]
+        values = [v for v in values if v is not None]
+        result[f'{stage}_seconds'] = {
+            'count': len(values),
+            'mean': round(statistics.mean(values), 1) if values else None,
+            'p50': round(statistics.median(values), 1) if values else None,
+            'max': max(values) if values else None
+        }
+    return result
@@ -0,0 +1,289 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from workshop_common import incidents, leases, metrics
+from workshop_common.clients import client
+from workshop_common.fanout import run_bulk
+from workshop_common.instance_index import run_on_user_instance
+from workshop_common.launch import ALARM_PERIOD
+from workshop_common.scenarios import CPU_RECOVERED_PERCENT, SCENARIOS, dispatch_scenario, run_scenario_command
+from workshop_common.ssm_runner import has_time_for
+
+SCENARIO = SCENARIOS['kill_and_restart']
+
+# Poll interval and cap while waiting for a rebooted instance's status
+# checks and first CPU datapoint (the Lambda deadline also bounds the wait)
+RECOVERY_POLL_SECONDS = 5
+RECOVERY_MAX_WAIT_SECONDS = 240
+
+# An instance takes at least this long to shut down and boot again. Right
+# after reboot_instances the pre-reboot status checks still read ok and the
+# CloudWatch agent may flush a last datapoint on its way down, so neither is
+# trusted until this long after the reboot.
+REBOOT_MIN_SECONDS = 30
+
+
+def kill_and_restart_bulk(event, context, incident_id=None):
+    """
+    Kill stress-ng on many instances with one SSM command, then reboot, in one
+    call, the instances whose post-kill sample still shows load.
+    """
+    bulk = run_bulk(client('ec2'), client('ssm'), event, SCENARIO['command'], SCENARIO['interpret'], context,
+                    timeout_seconds=SCENARIO['timeout_seconds'],
+                    max_wait_seconds=SCENARIO['max_wait_seconds'],
+                    comment=incidents.command_comment(incident_id))
+
+    # Reboot everything reached that the kill did not fix, including kills
+    # that did not finish in time
+    targeted = [r for r in bulk.get('results', {}).values() if r.get('instance_id')]
+    to_reboot = [r for r in targeted if not r.get('recovered')]
+    if to_reboot:
+        instance_ids = [r['instance_id'] for r in to_reboot]
+        print(f"Rebooting instances: {instance_ids}")
+        client('ec2').reboot_instances(InstanceIds=instance_ids)
+    for r in targeted:
+        r['success'] = True
+        r.pop('in_progress', None)
+        if r.get('recovered'):
+            r['rung'] = 'kill'
+            r['message'] = 'Process killed; CPU recovered without a reboot'
+        else:
+            r['rung'] = 'reboot'
+            r['actions'] = r.get('actions', []) + ['rebooted instance']
+            r['message'] = 'Process killed and instance rebooted'
+    if targeted:
+        bulk['summary']['succeeded'] = len(targeted)
+        bulk['summary']['in_progress'] = 0
+        bulk['summary']['rebooted'] = len(to_reboot)
+        bulk.pop('in_progress', None)
+        bulk.pop('message', None)
+
+    return bulk
+
+
+def reboot_after_kill(response):
+    """Completion step for an event-driven kill: reboot only if the kill did not clear the load."""
+    if response.get('recovered'):
+        response['rung'] = 'kill'
+        response['message'] = 'Process killed; CPU recovered without a reboot'
+        return response
+    instance_id = response['instance_id']
+    print(f"Rebooting instance {instance_id}")
+    client('ec2').reboot_instances(InstanceIds=[instance_id])
+    response['rung'] = 'reboot'
+    response['actions'] = response.get('actions', []) + ['rebooted instance']
+    response['message'] = 'Process killed and instance rebooted'
+    return response
+
+
+def wait_for_recovery(instance_id, rebooted_at, started, context):
+    """
+    After a reboot, wait for passing status checks and then the first
+    cpu_usage_active datapoint from a period starting REBOOT_MIN_SECONDS or
+    more after the reboot (so it can only come from the restarted instance),
+    until the Lambda deadline or RECOVERY_MAX_WAIT_SECONDS from `started`.
+    Returns that datapoint's value, or None if it didn't arrive in time.
+    """
+    booted_after = rebooted_at + timedelta(seconds=REBOOT_MIN_SECONDS)
+    checks_ok = False
+    while True:
+        if not checks_ok and datetime.now(timezone.utc) >= booted_after:
+            statuses = client('ec2').describe_instance_status(
+                InstanceIds=[instance_id], IncludeAllInstances=True
+            )['InstanceStatuses']
+            status = statuses[0] if statuses else {}
+            checks_ok = (
+                status.get('InstanceState', {}).get('Name') == 'running'
+                and status.get('InstanceStatus', {}).get('Status') == 'ok'
+                and status.get('SystemStatus', {}).get('Status') == 'ok'
+            )
+        if checks_ok:
+            result = client('cloudwatch').get_metric_data(
+                MetricDataQueries=[{
+                    'Id': 'cpu',
+                    'MetricStat': {
+                        'Metric': {
+                            'Namespace': 'Workshop',
+                            'MetricName': 'cpu_usage_active',
+                            'Dimensions': [
+                                {'Name': 'InstanceId', 'Value': instance_id},
+                                {'Name': 'cpu', 'Value': 'cpu-total'}
+                            ]
+                        },
+                        'Period': ALARM_PERIOD,
+                        'Stat': 'Average'
+                    }
+                }],
+                StartTime=booted_after,
+                EndTime=datetime.now(timezone.utc),
+                ScanBy='TimestampDescending'
+            )['MetricDataResults'][0]
+            # StartTime may be rounded down to the period; keep only periods
+            # that start after the instance restarted
+            values = [v for t, v in zip(result['Timestamps'], result['Values']) if t >= booted_after]
+            if values:
+                return values[0]
+        metrics.count('PollIterations')
+        if not has_time_for(RECOVERY_POLL_SECONDS, started, context, RECOVERY_MAX_WAIT_SECONDS):
+            return None
+        time.sleep(RECOVERY_POLL_SECONDS)
+
+
+@metrics.instrumented('kill_and_restart')
+def lambda_handler(event, context):
+    """
+    Kill runaway processes on a workshop user's EC2 instance, escalating to a
+    restart only if that doesn't bring CPU down.
+
+    The remediation ladder:
+      1. kill stress-ng and sample CPU on the instance a few seconds later;
+         stop here if it is under CPU_RECOVERED_PERCENT and nothing survived
+      2. otherwise reboot the instance
+      3. with "wait_for_recovery": true, wait for passing status checks and the
+         first post-reboot CPU datapoint (until the Lambda deadline)
+
+    Input: {"username": "user123"}
+    Optional: "instance_id": "i-xxx" skips the username -> instance lookup
+              "always_reboot": true reboots even when the kill recovered CPU
+              "wait_for_recovery": true waits for rung 3 after a reboot
+    Event-driven: {"username": "user123", "wait": false} returns once the kill
+          is sent; the command_complete handler reboots if needed when it
+          finishes and posts this output to the n8n callback
+    Bulk: {"usernames": ["user1", "user2"]} or {"all": true}, plus optional
+          "max_concurrency" and "max_errors"; kills with one SSM command and
+          reboots every instance still loaded with one reboot_instances call
+    Incidents: "incident_id" names the spike_cpu incident this remediates
+          (default: the user's open CPU incident); see scenarios.run_scenario
+    Leases: single-user calls wait their turn behind the attendee's other
+          actions, or return "busy"; see scenarios.run_scenario
+    Output: {
+        "success": true,
+        "instance_id": "i-xxx",
+        "username": "user123",
+        "actions": ["killed stress-ng"],
+        "rung": "kill",                  # or "reboot"
+        "recovered": true,               # null after a reboot that wasn't waited on
+        "cpu_busy_percent": 3,           # on-instance sample after the kill
+        "time_to_recovery_seconds": 6.2, # from the start of the call; null if unconfirmed
+        "incident_id": "3f2a9c1b7d4e",   # when known
+        "message": "Process killed; CPU at 3%, no reboot needed"
+    }
+    """
+    try:
+        # Parse input
+        if isinstance(event, str):
+            event = json.loads(event)
+
+        incident_id = incidents.incident_id_for('kill_and_restart', event)
+        started_at = incidents.now()
+
+        # Bulk mode: one tag-targeted SSM command for many users
+        if event.get('usernames') is not None or event.get('all'):
+            bulk = kill_and_restart_bulk(event, context, incident_id)
+            incidents.track(
+                'kill_and_restart', incident_id, bulk.get('results', {}).values(), incidents.cohort_of(event),
+                started_at
+            )
+            return bulk
+
+        username = event.get('username')
+        if not username:
+            return {
+                'success': False,
+                'error': 'Missing required field: username'
+            }
+
+        # Sanitize username
+        safe_username = ''.join(c for c in username if c.isalnum() or c in '-_').lower()
+
+        if not event.get('wait', True):
+            return dispatch_scenario(
+                'kill_and_restart', safe_username, instance_id=event.get('instance_id'), incident_id=incident_id,
+                context=context, cohort=incidents.cohort_of(event)
+            )
+
+        started = time.monotonic()
+
+        # One action at a time per attendee, held through the reboot and recovery wait
+        # Keep time for the kill's whole poll budget and the reboot after it
+        lease = leases.acquire(
+            safe_username, 'kill_and_restart', context, reserve_seconds=SCENARIO['max_wait_seconds']
+        )
+        if not lease['acquired']:
+            return leases.busy_response(lease)
+        try:
+            # Rung 1: kill stress-ng on the user's running instance (chaos agent or SSM) and
+            # sample CPU on the instance. The scenario's poll budget leaves time to reboot
+            instance_id, result = run_on_user_instance(
+                client('ec2'), safe_username,
+                lambda iid: run_scenario_command(
+                    'kill_and_restart', iid, context, comment=incidents.command_comment(incident_id)
+                ),
+                instance_id=event.get('instance_id')
+            )
+
+            if not instance_id:
+                return {
+                    'success': False,
+                    'error': f'No running instance found for user: {safe_username}'
+                }
+
+            print(f"Kill command status: {result['status']}")
+            response = {**SCENARIO['interpret'](result, instance_id, safe_username), 'via': result.get('via', 'ssm')}
+
+            if response['recovered'] and not event.get('always_reboot'):
+                response.update({
+                    'rung': 'kill',
+                    'time_to_recovery_seconds': round(time.monotonic() - started, 1),
+                    'message': f"Process killed; CPU at {response['cpu_busy_percent']}%, no reboot needed"
+                })
+                incidents.track('kill_and_restart', incident_id, [response], incidents.cohort_of(event), started_at)
+                return response
+
+            # Rung 2: load persists (or the sample failed), reboot the instance
+            print(f"Rebooting instance {instance_id} (CPU after kill: {response['cpu_busy_percent']}%)")
+            rebooted_at = datetime.now(timezone.utc)
+            with metrics.phase('reboot'):
+                client('ec2').reboot_instances(InstanceIds=[instance_id])
+            response['actions'].append('rebooted instance')
+            response.update({
+                'rung': 'reboot',
+                'recovered': None,
+                'time_to_recovery_seconds': None,
+                'message': 'Process killed and instance rebooted'
+            })
+
+            # Rung 3 (optional): confirm the instance is back and reporting
+            if event.get('wait_for_recovery'):
+                with metrics.phase('recovery'):
+                    cpu = wait_for_recovery(instance_id, rebooted_at, started, context)
+                if cpu is None:
+                    response['message'] = 'Instance rebooted; recovery not confirmed before the deadline'
+                else:
+                    response.update({
+                        'recovered': cpu < CPU_RECOVERED_PERCENT,
+                        'cpu_usage_active': round(cpu, 1),
+                        'time_to_recovery_seconds': round(time.monotonic() - started, 1),
+                        'message': f"Instance rebooted and reporting again; CPU at {cpu:.1f}%"
+                    })
+
+            incidents.track('kill_and_restart', incident_id, [response], incidents.cohort_of(event), started_at)
+            return response
+        finally:
+            leases.release(lease)
+
+    except ClientError as e:
+        print(f"AWS Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
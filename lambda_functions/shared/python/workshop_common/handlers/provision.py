@@ -0,0 +1,702 @@
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from workshop_common import metrics
+from workshop_common.clients import THROTTLE_CODES, client, retry_throttled
+from workshop_common.image_bake import bake_image
+from workshop_common.instance_index import lookup_instance_id, record_instance, record_instances
+from workshop_common.launch import (
+    ALARM_MODE, PROVISION_PROFILE, PROVISION_PROFILES, create_alarms, image_source, instance_placement,
+    launch_instances, sanitize_username, user_alarm_names, workshop_tags, WORKSHOP_TAG
+)
+from workshop_common.readiness import READY_MAX_WAIT_SECONDS, check_readiness
+from workshop_common.warm_pool import claim_instance, refill_pool, trigger_refill
+
+# Batch (cohort) provisioning settings
+BATCH_LAUNCH_SIZE = int(os.environ.get('BATCH_LAUNCH_SIZE', '50'))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', '10'))
+BATCH_POLL_DELAY = 5
+
+ACTIVE_STATES = ['pending', 'running', 'stopping', 'stopped']
+
+
+@metrics.instrumented('provision')
+def lambda_handler(event, context):
+    """
+    Provision an EC2 instance for a workshop user, or for a whole cohort.
+
+    Input: {"username": "user123"}
+    Output: {
+        "success": true,
+        "instance_id": "i-xxx",
+        "instance_name": "workshop-user123",
+        "public_ip": "x.x.x.x",
+        "username": "user123",
+        "exists": false,
+        "profile": "standard",
+        "instance_type": "t3.micro",
+        "subnet_id": "subnet-xxx",
+        "availability_zone": "us-east-1a"
+    }
+
+    Profiles: "profile": "unlimited" (or standard, arm64, fixed; default
+    PROVISION_PROFILE) picks the instance types, CPU credit mode and
+    architecture. Types are tried in order on capacity errors; instance_type
+    in the output is the one that launched. Instances are tagged
+    workshop-profile. Only default-profile requests use the warm pool.
+
+    Placement: instances are spread over SUBNET_IDS by free addresses and
+    recent capacity failures, moving to the next subnet on capacity or address
+    errors. The chosen subnet and AZ are tagged workshop-subnet / workshop-az.
+
+    Async input: {"username": "user123", "wait": false}
+    Async output: {
+        "success": true,
+        "instance_id": "i-xxx",
+        "provisioning_token": "i-xxx",
+        "status": "pending",
+        ...
+    }
+
+    Warm pool: when WARM_POOL_TABLE is set, a single-user provision first claims
+    a pre-booted instance from the pool ("from_pool": true in the output).
+    {"mode": "pool_refill"} tops the pool back up to WARM_POOL_SIZE; it runs on
+    a schedule and is also triggered asynchronously after every claim. Cohort
+    teardown disables the pool; {"mode": "pool_refill", "enable": true} turns
+    it back on.
+
+    Image bake: {"mode": "bake_image"} builds an image with the agent and
+    stress-ng preinstalled, in stages (call again with the returned
+    builder_instance_id / command_id / image_id until stage is "complete").
+    New instances then boot from it with a short user-data stub; "boot_path"
+    in the output is "baked" or "script" (stock AMI_ID, full install).
+
+    Status input: {"mode": "status", "provisioning_token": "i-xxx"}
+               or {"mode": "status", "username": "user123"}
+               or {"mode": "status", "provisioning_tokens": ["i-xxx", "i-yyy"]}
+    Status output: {
+        "success": true,
+        "status": "pending" | "running" | "failed",
+        "instance_id": "i-xxx",
+        "public_ip": "x.x.x.x",
+        "username": "user123"
+    }
+
+    Readiness input: {"mode": "ready", "provisioning_token": "i-xxx"} (or "username")
+              optional "max_wait_seconds": 120
+    Readiness output: {
+        "success": true,
+        "instance_id": "i-xxx",
+        "ready": false,
+        "lagging": "first_datapoint",   # null when ready
+        "stages": {"ec2_running": {"status": "ready", "seconds_after_launch": 12.0},
+                   "ssm_online": {...}, "user_data_done": {...},
+                   "first_datapoint": {"status": "waiting", "detail": "..."}},
+        "waited_seconds": 120.2
+    }
+    Returns as soon as every stage is ready, so workflows can call it in a
+    loop instead of sleeping after provision (see readiness.check_readiness).
+    {"username": "user123", "wait_for_ready": true} provisions and then waits
+    for readiness in the same call, adding "ready" and "readiness" to the output.
+
+    Batch input: {"usernames": ["user1", "user2", ...]}
+    Batch output: {
+        "success": true,
+        "results": {"user1": {...single-user output...}, "user2": {"success": false, "error": "..."}},
+        "summary": {"requested": 2, "provisioned": 1, "existing": 0, "failed": 1}
+    }
+    """
+    try:
+        # Parse input
+        if isinstance(event, str):
+            event = json.loads(event)
+
+        if event.get('mode') == 'status':
+            return provisioning_status(event)
+
+        if event.get('mode') == 'ready':
+            return readiness_status(event, context)
+
+        if event.get('mode') == 'pool_refill':
+            return refill_pool(context, enable=bool(event.get('enable')))
+
+        if event.get('mode') == 'bake_image':
+            return bake_image(event, context)
+
+        profile = event.get('profile') or PROVISION_PROFILE
+        if profile not in PROVISION_PROFILES:
+            return {
+                'success': False,
+                'error': f"Unknown profile: {profile} (expected one of {', '.join(PROVISION_PROFILES)})"
+            }
+
+        if event.get('usernames') is not None:
+            return provision_batch(event['usernames'], context, wait=event.get('wait', True), profile=profile)
+
+        username = event.get('username')
+        if not username:
+            return {
+                'success': False,
+                'error': 'Missing required field: username'
+            }
+
+        # Sanitize username for use in resource names
+        safe_username = sanitize_username(username)
+        instance_name = f"workshop-{safe_username}"
+
+        # Check if instance already exists for this user
+        with metrics.phase('lookup'):
+            existing = retry_throttled(
+                client('ec2').describe_instances,
+                Filters=[
+                    {'Name': 'tag:workshop-user', 'Values': [safe_username]},
+                    {'Name': 'instance-state-name', 'Values': ACTIVE_STATES}
+                ]
+            )
+
+        for reservation in existing['Reservations']:
+            for instance in reservation['Instances']:
+                if instance['State']['Name'] in ACTIVE_STATES:
+                    # Instance already exists
+                    record_instance(safe_username, instance['InstanceId'])
+                    public_ip = instance.get('PublicIpAddress', 'pending')
+                    return with_readiness(event, context, {
+                        'success': True,
+                        'instance_id': instance['InstanceId'],
+                        'instance_name': instance_name,
+                        'public_ip': public_ip,
+                        'username': safe_username,
+                        'exists': True,
+                        **instance_profile(instance),
+                        **instance_placement(instance),
+                        'message': 'Instance already exists for this user'
+                    })
+
+        # Claim a booted, agent-ready instance from the warm pool if there is
+        # one; the pool is launched with the default profile
+        claimed = None
+        if profile == PROVISION_PROFILE:
+            with metrics.phase('claim'):
+                claimed = claim_instance(safe_username)
+        if claimed:
+            trigger_refill(context)
+            return with_readiness(event, context, {
+                'success': True,
+                'instance_id': claimed['instance_id'],
+                'instance_name': instance_name,
+                'public_ip': claimed['public_ip'],
+                'username': safe_username,
+                'exists': False,
+                'from_pool': True,
+                'profile': claimed['profile'],
+                'instance_type': claimed['instance_type'],
+                'subnet_id': claimed['subnet_id'],
+                'availability_zone': claimed['availability_zone'],
+                'alarm_names': claimed['alarm_names'],
+                'message': 'Instance assigned from warm pool'
+            })
+
+        # Create new EC2 instance
+        with metrics.phase('launch'):
+            image = image_source(profile)
+            instances = launch_instances(1, [
+                {
+                    'ResourceType': 'instance',
+                    'Tags': workshop_tags(safe_username, instance_name)
+                },
+                {
+                    'ResourceType': 'volume',
+                    'Tags': workshop_tags(safe_username, f"{instance_name}-volume")
+                }
+            ], image=image, profile_name=profile)
+
+        instance_id = instances[0]['InstanceId']
+        instance_type = instances[0]['InstanceType']
+        placement = instance_placement(instances[0])
+        record_instance(safe_username, instance_id)
+
+        # Alarms only need the instance ID, so create them while it boots
+        with metrics.phase('alarms'):
+            alarm_names = create_alarms(instance_id, safe_username)
+
+        if not event.get('wait', True):
+            return {
+                'success': True,
+                'instance_id': instance_id,
+                'instance_name': instance_name,
+                'provisioning_token': instance_id,
+                'status': 'pending',
+                'username': safe_username,
+                'exists': False,
+                'alarm_names': alarm_names,
+                'boot_path': image[2],
+                'profile': profile,
+                'instance_type': instance_type,
+                **placement,
+                'message': 'Instance launching. Call provision with mode "status" to check progress.'
+            }
+
+        # Wait for instance to be running; the last poll carries the public IP
+        print(f"Waiting for instance {instance_id} to be running...")
+        instance = wait_for_instances([instance_id], context).get(instance_id, {})
+        state = instance.get('State', {}).get('Name', 'unknown')
+        if state != 'running':
+            return {
+                'success': False,
+                'instance_id': instance_id,
+                'provisioning_token': instance_id,
+                'username': safe_username,
+                'status': instance_status(instance)['status'],
+                'error': f'Instance is {state} - use mode "status" to keep checking'
+            }
+        public_ip = instance.get('PublicIpAddress', 'No public IP assigned')
+
+        return with_readiness(event, context, {
+            'success': True,
+            'instance_id': instance_id,
+            'instance_name': instance_name,
+            'public_ip': public_ip,
+            'username': safe_username,
+            'exists': False,
+            'alarm_names': alarm_names,
+            'boot_path': image[2],
+            'profile': profile,
+            'instance_type': instance_type,
+            **placement,
+            'message': 'Instance provisioned successfully'
+        })
+
+    except ClientError as e:
+        print(f"AWS Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def with_readiness(event, context, response):
+    """With "wait_for_ready", wait for the new instance to be ready and report its stages."""
+    if not event.get('wait_for_ready'):
+        return response
+    readiness = check_readiness(
+        response['instance_id'], context, int(event.get('max_wait_seconds', READY_MAX_WAIT_SECONDS))
+    )
+    response.update({
+        'ready': readiness['ready'],
+        'readiness': readiness,
+        'message': response['message'] + ('; ready for scenarios' if readiness['ready']
+                                           else f"; not ready yet ({readiness['lagging']})")
+    })
+    return response
+
+
+def readiness_status(event, context):
+    """Wait (bounded) until a user's instance is ready for scenarios, reporting each stage."""
+    instance_id = event.get('provisioning_token') or event.get('instance_id')
+    safe_username = sanitize_username(str(event.get('username') or ''))
+    if not instance_id and not safe_username:
+        return {
+            'success': False,
+            'error': 'Missing required field: provisioning_token or username'
+        }
+
+    instance_id = lookup_instance_id(client('ec2'), safe_username, instance_id=instance_id)
+    if not instance_id:
+        return {
+            'success': False,
+            'username': safe_username,
+            'error': f'No instance found for user: {safe_username}'
+        }
+
+    readiness = check_readiness(instance_id, context, int(event.get('max_wait_seconds', READY_MAX_WAIT_SECONDS)))
+    if readiness['ready']:
+        message = 'Instance is ready for scenarios'
+    else:
+        stage = readiness['stages'][readiness['lagging']]
+        message = f"Waiting on {readiness['lagging']} ({stage.get('detail', stage['status'])})"
+        if stage['status'] != 'failed':
+            message += '. Call again to keep waiting.'
+    return {
+        'success': True,
+        'instance_id': instance_id,
+        **({'username': safe_username} if safe_username else {}),
+        **readiness,
+        'message': message
+    }
+
+
+def find_existing_instances(safe_usernames):
+    """Return {username: instance} for users that already have an active instance."""
+    existing = {}
+    paginator = client('ec2').get_paginator('describe_instances')
+    # EC2 accepts at most 200 values per filter
+    for start in range(0, len(safe_usernames), 200):
+        pages = paginator.paginate(
+            Filters=[
+                {'Name': 'tag:workshop-user', 'Values': safe_usernames[start:start + 200]},
+                {'Name': 'instance-state-name', 'Values': ACTIVE_STATES}
+            ]
+        )
+        for page in pages:
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+                    user = tags.get('workshop-user')
+                    if user and user not in existing:
+                        existing[user] = instance
+    return existing
+
+
+def wait_for_instances(instance_ids, context):
+    """
+    Poll describe_instances for all instances together until none are pending
+    or the Lambda is about to run out of time. A throttled poll only delays
+    the next one: the instances are launched either way, and failing here
+    would hand back an error for an instance that is booting. Returns
+    {instance_id: instance}.
+    """
+    latest = {}
+    pending = list(instance_ids)
+    started = time.monotonic()
+    while pending:
+        metrics.count('PollIterations')
+        for start in range(0, len(pending), 1000):
+            try:
+                response = client('ec2').describe_instances(InstanceIds=pending[start:start + 1000])
+            except ClientError as e:
+                if e.response['Error']['Code'] not in THROTTLE_CODES:
+                    raise
+                print(f"Instance poll throttled; polling again: {e}")
+                continue
+            for reservation in response['Reservations']:
+                for instance in reservation['Instances']:
+                    latest[instance['InstanceId']] = instance
+
+        # Not seen yet (throttled) counts as still pending
+        pending = [i for i in pending if latest.get(i, {}).get('State', {}).get('Name', 'pending') == 'pending']
+        if not pending:
+            break
+        if context and context.get_remaining_time_in_millis() < (BATCH_POLL_DELAY + 10) * 1000:
+            print(f"Deadline approaching with {len(pending)} instance(s) still pending")
+            break
+        print(f"Waiting for {len(pending)} instance(s) to be running...")
+        time.sleep(BATCH_POLL_DELAY)
+    metrics.add_phase('wait', (time.monotonic() - started) * 1000)
+    return latest
+
+
+def instance_profile(instance):
+    """The profile and instance type an existing instance was launched with."""
+    tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+    return {
+        'profile': tags.get('workshop-profile'),
+        'instance_type': instance.get('InstanceType')
+    }
+
+
+def instance_status(instance):
+    """Summarize an EC2 instance as a provisioning status."""
+    state = instance.get('State', {}).get('Name')
+    tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+    status = {
+        'instance_id': instance.get('InstanceId'),
+        'username': tags.get('workshop-user'),
+        'state': state
+    }
+    if state == 'running':
+        status['status'] = 'running'
+        status['public_ip'] = instance.get('PublicIpAddress', 'No public IP assigned')
+    elif state == 'pending':
+        status['status'] = 'pending'
+    else:
+        status['status'] = 'failed'
+        reason = instance.get('StateReason', {}).get('Message')
+        status['error'] = reason or f'Instance is {state or "missing"}'
+    return status
+
+
+def provisioning_status(event):
+    """Report pending/running/failed for provisioning tokens or a username in one describe call."""
+    tokens = event.get('provisioning_tokens')
+    if tokens is None and event.get('provisioning_token'):
+        tokens = [event['provisioning_token']]
+
+    if tokens is not None:
+        instances = {}
+        try:
+            response = client('ec2').describe_instances(InstanceIds=tokens)
+            for reservation in response['Reservations']:
+                for instance in reservation['Instances']:
+                    instances[instance['InstanceId']] = instance
+        except ClientError as e:
+            # Unknown IDs fail the whole call; a launch that never materialized is a failure
+            if 'InvalidInstanceID' not in str(e):
+                raise
+            print(f"Status lookup error: {e}")
+
+        statuses = {
+            token: instance_status(instances.get(token, {'InstanceId': token}))
+            for token in tokens
+        }
+        if 'provisioning_tokens' in event:
+            return {'success': True, 'statuses': statuses}
+        return {'success': True, **statuses[tokens[0]]}
+
+    username = event.get('username')
+    if not username:
+        return {
+            'success': False,
+            'error': 'Missing required field: provisioning_token or username'
+        }
+
+    safe_username = sanitize_username(username)
+    response = client('ec2').describe_instances(
+        Filters=[
+            {'Name': 'tag:workshop-user', 'Values': [safe_username]},
+            {'Name': 'instance-state-name', 'Values': ['pending', 'running']}
+        ]
+    )
+    for reservation in response['Reservations']:
+        for instance in reservation['Instances']:
+            return {'success': True, **instance_status(instance)}
+
+    return {
+        'success': True,
+        'status': 'failed',
+        'username': safe_username,
+        'error': f'No pending or running instance found for user: {safe_username}'
+    }
+
+
+def provision_batch(usernames, context, wait=True, profile=PROVISION_PROFILE):
+    """
+    Provision instances for a cohort of users in a few run_instances calls.
+
+    Instances are launched in chunks of BATCH_LAUNCH_SIZE with cohort-wide tags,
+    then tagged per user and given alarms in parallel while they boot. Failures
+    are reported per user and never fail the batch as a whole. With wait=False
+    it returns right after launch with a provisioning token per user. A chunk
+    EC2 only partly fills with one instance type is topped up with the
+    profile's next type.
+    """
+    if not isinstance(usernames, list) or not usernames:
+        return {
+            'success': False,
+            'error': 'Field usernames must be a non-empty list'
+        }
+
+    started = time.time()
+    results = {}
+
+    requested = []
+    for username in usernames:
+        safe_username = sanitize_username(str(username))
+        if not safe_username:
+            results[str(username)] = {'success': False, 'error': 'Invalid username'}
+        elif safe_username not in requested:
+            requested.append(safe_username)
+
+    existing = find_existing_instances(requested)
+    for safe_username, instance in existing.items():
+        results[safe_username] = {
+            'success': True,
+            'instance_id': instance['InstanceId'],
+            'instance_name': f"workshop-{safe_username}",
+            'public_ip': instance.get('PublicIpAddress', 'pending'),
+            'username': safe_username,
+            'exists': True,
+            **instance_profile(instance),
+            **instance_placement(instance),
+            'message': 'Instance already exists for this user'
+        }
+
+    to_launch = [u for u in requested if u not in existing]
+    batch_id = uuid.uuid4().hex[:12]
+    assigned = {}
+    launched = {}
+
+    for start in range(0, len(to_launch), BATCH_LAUNCH_SIZE):
+        chunk = to_launch[start:start + BATCH_LAUNCH_SIZE]
+        cohort_tags = [
+            {'Key': 'workshop', 'Value': WORKSHOP_TAG},
+            {'Key': 'workshop-batch', 'Value': batch_id}
+        ]
+        try:
+            instances = launch_instances(len(chunk), [
+                {'ResourceType': 'instance', 'Tags': cohort_tags},
+                {'ResourceType': 'volume', 'Tags': cohort_tags}
+            ], profile_name=profile)
+        except (ClientError, BotoCoreError) as e:
+            print(f"AWS Error launching chunk of {len(chunk)}: {e}")
+            for safe_username in chunk:
+                results[safe_username] = {'success': False, 'username': safe_username, 'error': str(e)}
+            continue
+
+        for safe_username, instance in zip(chunk, instances):
+            assigned[safe_username] = instance['InstanceId']
+            launched[instance['InstanceId']] = instance
+        for safe_username in chunk[len(instances):]:
+            results[safe_username] = {
+                'success': False,
+                'username': safe_username,
+                'error': f'Insufficient capacity: launched {len(instances)} of {len(chunk)} instances'
+            }
+
+    def claim(safe_username):
+        # Per-user tags and alarms only need the instance ID, so do them while it boots
+        instance_id = assigned[safe_username]
+        client('ec2').create_tags(
+            Resources=[instance_id],
+            Tags=workshop_tags(safe_username, f"workshop-{safe_username}")
+        )
+        return create_alarms(instance_id, safe_username)
+
+    alarm_names = {}
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+        futures = {u: pool.submit(metrics.bound(claim), u) for u in assigned}
+        for safe_username, future in futures.items():
+            try:
+                alarm_names[safe_username] = future.result()
+            except (ClientError, BotoCoreError) as e:
+                # Includes client timeouts and connection errors, so one slow
+                # call never fails the batch and strands its instances
+                print(f"AWS Error setting up {safe_username}: {e}")
+                results[safe_username] = {
+                    'success': False,
+                    'instance_id': assigned[safe_username],
+                    'username': safe_username,
+                    'error': str(e)
+                }
+
+    # An instance without its workshop-user tag would be invisible to every
+    # other handler, so terminate it rather than leave it running
+    orphaned_users = [u for u in assigned if u not in alarm_names]
+    orphans = [assigned.pop(u) for u in orphaned_users]
+    orphan_cleanup_error = None
+    if orphans:
+        print(f"Terminating untagged instances: {orphans}")
+        try:
+            retry_throttled(client('ec2').terminate_instances, InstanceIds=orphans)
+        except (ClientError, BotoCoreError) as e:
+            # Keep the per-user results of the instances that did launch
+            print(f"AWS Error terminating untagged instances {orphans}: {e}")
+            orphan_cleanup_error = f"Could not terminate untagged instances {orphans}: {e}"
+        delete_user_alarms(orphaned_users)
+
+    record_instances({
+        **{u: i['InstanceId'] for u, i in existing.items()},
+        **assigned
+    })
+
+    if not wait:
+        for safe_username, instance_id in assigned.items():
+            results[safe_username] = {
+                'success': True,
+                'instance_id': instance_id,
+                'instance_name': f"workshop-{safe_username}",
+                'provisioning_token': instance_id,
+                'status': 'pending',
+                'username': safe_username,
+                'exists': False,
+                'profile': profile,
+                'instance_type': launched[instance_id]['InstanceType'],
+                **instance_placement(launched[instance_id]),
+                'alarm_names': alarm_names[safe_username],
+                'message': 'Instance launching'
+            }
+        assigned = {}
+
+    instances = wait_for_instances(list(assigned.values()), context) if assigned else {}
+
+    def tag_volumes(safe_username):
+        instance = instances.get(assigned[safe_username], {})
+        volume_ids = [
+            m['Ebs']['VolumeId'] for m in instance.get('BlockDeviceMappings', []) if 'Ebs' in m
+        ]
+        if volume_ids:
+            client('ec2').create_tags(
+                Resources=volume_ids,
+                Tags=workshop_tags(safe_username, f"workshop-{safe_username}-volume")
+            )
+
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+        for future in [pool.submit(metrics.bound(tag_volumes), u) for u in assigned]:
+            try:
+                future.result()
+            except (ClientError, BotoCoreError) as e:
+                print(f"Error tagging volume: {e}")
+
+    for safe_username, instance_id in assigned.items():
+        instance = instances.get(instance_id, {})
+        state = instance.get('State', {}).get('Name', 'unknown')
+        if state in ('running', 'pending'):
+            results[safe_username] = {
+                'success': True,
+                'instance_id': instance_id,
+                'instance_name': f"workshop-{safe_username}",
+                'public_ip': instance.get('PublicIpAddress', 'pending'),
+                'username': safe_username,
+                'exists': False,
+                'state': state,
+                'profile': profile,
+                'instance_type': launched[instance_id]['InstanceType'],
+                **instance_placement(launched[instance_id]),
+                'alarm_names': alarm_names[safe_username],
+                'message': 'Instance provisioned successfully'
+            }
+        else:
+            results[safe_username] = {
+                'success': False,
+                'instance_id': instance_id,
+                'username': safe_username,
+                'error': f'Instance entered state {state} while launching'
+            }
+
+    summary = {
+        'requested': len(results),
+        'provisioned': sum(1 for r in results.values() if r.get('success') and not r.get('exists')),
+        'existing': sum(1 for r in results.values() if r.get('exists')),
+        'failed': sum(1 for r in results.values() if not r.get('success'))
+    }
+    if orphan_cleanup_error:
+        summary['orphan_cleanup_error'] = orphan_cleanup_error
+
+    return {
+        'success': True,
+        'results': results,
+        'summary': summary,
+        'batch_id': batch_id,
+        'duration_seconds': round(time.time() - started, 1),
+        'message': f"Batch provisioned {summary['provisioned']} of {summary['requested']} user(s)"
+    }
+
+
+def delete_user_alarms(safe_usernames):
+    """
+    Delete whatever per-user alarms were created for users whose setup then
+    failed (create_alarms may have stopped after the first). Best effort.
+    """
+    if ALARM_MODE == 'fleet':
+        return
+    names = [name for u in safe_usernames for name in user_alarm_names(u)]
+    # describe_alarms and delete_alarms take up to 100 names
+    for start in range(0, len(names), 100):
+        try:
+            alarms = client('cloudwatch').describe_alarms(AlarmNames=names[start:start + 100])
+            existing = [a['AlarmName'] for a in alarms['MetricAlarms']]
+            if existing:
+                client('cloudwatch').delete_alarms(AlarmNames=existing)
+                print(f"Deleted alarms of orphaned instances: {existing}")
+        except (ClientError, BotoCoreError) as e:
+            print(f"Error deleting alarms of orphaned instances: {e}")
@@ -0,0 +1,251 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.clients import client
+from workshop_common.launch import (
+    ALARM_MODE, ALARM_PERIOD, CPU_THRESHOLD, DISK_THRESHOLD, WORKSHOP_TAG, disk_dimensions, fleet_alarm_name
+)
+
+ACTIVE_STATES = ['pending', 'running', 'stopping', 'stopped']
+
+# A dashboard refreshing every few seconds is served from one snapshot per
+# STATUS_CACHE_SECONDS per container instead of re-reading EC2 and CloudWatch
+STATUS_CACHE_SECONDS = int(os.environ.get('STATUS_CACHE_SECONDS', '10'))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# API limits
+DESCRIBE_ALARMS_BATCH_SIZE = 100
+METRIC_QUERIES_PER_REQUEST = 500
+
+# How far back to look for the latest datapoint of each metric
+METRIC_LOOKBACK_SECONDS = 300
+
+# workshop -> (expires_at, snapshot)
+_snapshots = {}
+_lock = threading.Lock()
+
+
+@metrics.instrumented('status')
+def lambda_handler(event, context):
+    """
+    Status of every instance in a workshop cohort, for a facilitator dashboard.
+
+    Input: {"action": "status"}
+    Optional: "workshop": "devops-workshop" (cohort tag), "page_size": 100,
+              "next_token": "<from the previous page>", "refresh": true (skip the cache)
+    Output: {
+        "success": true,
+        "workshop": "devops-workshop",
+        "as_of": "2024-05-01T12:00:00+00:00",
+        "summary": {"instances": 42, "running": 40, "disk_alarm": 3, "cpu_alarm": 1},
+        "instances": [
+            {"username": "alice", "instance_id": "i-xxx", "state": "running",
+             "public_ip": "1.2.3.4", "launch_time": "...",
+             "disk_used_percent": 91.0, "cpu_usage_active": 3.2,
+             "alarms": {"disk": "ALARM", "cpu": "OK"}}
+        ],
+        "next_token": "100"
+    }
+    Instances are sorted by username. Every page of one listing comes from the
+    same snapshot while it is cached; next_token is omitted on the last page.
+    """
+    try:
+        # Parse input
+        if isinstance(event, str):
+            event = json.loads(event)
+
+        workshop = event.get('workshop', WORKSHOP_TAG)
+        page_size = min(int(event.get('page_size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        offset = int(event.get('next_token') or 0)
+        if page_size < 1 or offset < 0:
+            return {
+                'success': False,
+                'error': 'page_size must be positive and next_token must come from a previous page'
+            }
+
+        snapshot = cohort_snapshot(workshop, refresh=bool(event.get('refresh')))
+        instances = snapshot['instances']
+        page = instances[offset:offset + page_size]
+
+        response = {
+            'success': True,
+            'workshop': workshop,
+            'as_of': snapshot['as_of'],
+            'summary': snapshot['summary'],
+            'instances': page
+        }
+        if offset + page_size < len(instances):
+            response['next_token'] = str(offset + page_size)
+        return response
+
+    except ClientError as e:
+        print(f"AWS Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def cohort_snapshot(workshop, refresh=False):
+    """The cached snapshot for workshop, rebuilt when older than STATUS_CACHE_SECONDS."""
+    with _lock:
+        expires_at, snapshot = _snapshots.get(workshop, (0, None))
+        if refresh or snapshot is None or expires_at <= time.time():
+            with metrics.phase('snapshot'):
+                snapshot = build_snapshot(workshop)
+            _snapshots[workshop] = (time.time() + STATUS_CACHE_SECONDS, snapshot)
+        else:
+            metrics.count('CacheHits')
+        return snapshot
+
+
+def build_snapshot(workshop):
+    instances = describe_cohort(workshop)
+    values = latest_values(instances)
+    states = alarm_states(instances, values)
+
+    for instance in instances:
+        instance_id = instance['instance_id']
+        instance['disk_used_percent'] = values.get(('disk', instance_id))
+        instance['cpu_usage_active'] = values.get(('cpu', instance_id))
+        instance['alarms'] = {
+            'disk': states.get(('disk', instance_id), 'INSUFFICIENT_DATA'),
+            'cpu': states.get(('cpu', instance_id), 'INSUFFICIENT_DATA')
+        }
+    instances.sort(key=lambda i: (i['username'] or '', i['instance_id']))
+
+    return {
+        'as_of': datetime.now(timezone.utc).isoformat(),
+        'instances': instances,
+        'summary': {
+            'instances': len(instances),
+            'running': sum(1 for i in instances if i['state'] == 'running'),
+            'disk_alarm': sum(1 for i in instances if i['alarms']['disk'] == 'ALARM'),
+            'cpu_alarm': sum(1 for i in instances if i['alarms']['cpu'] == 'ALARM')
+        }
+    }
+
+
+def describe_cohort(workshop):
+    """Every attendee instance tagged workshop=<workshop>, paging through describe_instances."""
+    instances = []
+    paginator = client('ec2').get_paginator('describe_instances')
+    pages = paginator.paginate(
+        Filters=[
+            {'Name': 'tag:workshop', 'Values': [workshop]},
+            {'Name': 'instance-state-name', 'Values': ACTIVE_STATES}
+        ]
+    )
+    for page in pages:
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+                instances.append({
+                    'username': tags.get('workshop-user'),
+                    'instance_id': instance['InstanceId'],
+                    'state': instance['State']['Name'],
+                    'public_ip': instance.get('PublicIpAddress'),
+                    'launch_time': instance['LaunchTime'].isoformat() if instance.get('LaunchTime') else None
+                })
+    return instances
+
+
+def latest_values(instances):
+    """
+    Latest disk_used_percent and cpu_usage_active per running instance, as
+    {(metric, instance_id): value}, packing METRIC_QUERIES_PER_REQUEST queries
+    into each get_metric_data request.
+    """
+    queries = {}
+    for n, instance in enumerate(i for i in instances if i['state'] == 'running'):
+        instance_id = instance['instance_id']
+        queries[f'd{n}'] = ('disk', instance_id, {
+            'Namespace': 'Workshop',
+            'MetricName': 'disk_used_percent',
+            'Dimensions': disk_dimensions(instance_id)
+        }, 'Maximum')
+        queries[f'c{n}'] = ('cpu', instance_id, {
+            'Namespace': 'Workshop',
+            'MetricName': 'cpu_usage_active',
+            'Dimensions': [
+                {'Name': 'InstanceId', 'Value': instance_id},
+                {'Name': 'cpu', 'Value': 'cpu-total'}
+            ]
+        }, 'Average')
+
+    values = {}
+    end = datetime.now(timezone.utc)
+    ids = list(queries)
+    paginator = client('cloudwatch').get_paginator('get_metric_data')
+    for start in range(0, len(ids), METRIC_QUERIES_PER_REQUEST):
+        batch = [
+            {
+                'Id': query_id,
+                'MetricStat': {'Metric': queries[query_id][2], 'Period': ALARM_PERIOD, 'Stat': queries[query_id][3]},
+                'ReturnData': True
+            }
+            for query_id in ids[start:start + METRIC_QUERIES_PER_REQUEST]
+        ]
+        pages = paginator.paginate(
+            MetricDataQueries=batch,
+            StartTime=end - timedelta(seconds=METRIC_LOOKBACK_SECONDS),
+            EndTime=end,
+            ScanBy='TimestampDescending'
+        )
+        for page in pages:
+            for result in page['MetricDataResults']:
+                metric, instance_id = queries[result['Id']][:2]
+                # Newest first; later pages only continue older datapoints
+                if result['Values'] and (metric, instance_id) not in values:
+                    values[(metric, instance_id)] = round(result['Values'][0], 1)
+    return values
+
+
+def alarm_states(instances, values):
+    """
+    Alarm state per instance as {(metric, instance_id): state}.
+
+    Per-user alarms are read with describe_alarms in batches of
+    DESCRIBE_ALARMS_BATCH_SIZE names. Fleet alarms cover every instance, so in
+    fleet mode an instance is in ALARM when its latest value is over the
+    fleet alarm's threshold, and only while that alarm is firing.
+    """
+    states = {}
+    if ALARM_MODE == 'fleet':
+        fleet = client('cloudwatch').describe_alarms(
+            AlarmNames=[fleet_alarm_name('disk'), fleet_alarm_name('cpu')]
+        )
+        firing = {a['AlarmName'] for a in fleet['MetricAlarms'] if a['StateValue'] == 'ALARM'}
+        for (metric, instance_id), value in values.items():
+            threshold = DISK_THRESHOLD if metric == 'disk' else CPU_THRESHOLD
+            breaching = value > threshold and fleet_alarm_name(metric) in firing
+            states[(metric, instance_id)] = 'ALARM' if breaching else 'OK'
+        return states
+
+    names = {}
+    for instance in instances:
+        if instance['username']:
+            names[f"workshop-{instance['username']}-disk-high"] = ('disk', instance['instance_id'])
+            names[f"workshop-{instance['username']}-cpu-high"] = ('cpu', instance['instance_id'])
+    alarm_names = list(names)
+    for start in range(0, len(alarm_names), DESCRIBE_ALARMS_BATCH_SIZE):
+        response = client('cloudwatch').describe_alarms(
+            AlarmNames=alarm_names[start:start + DESCRIBE_ALARMS_BATCH_SIZE],
+            MaxRecords=DESCRIBE_ALARMS_BATCH_SIZE
+        )
+        for alarm in response['MetricAlarms']:
+            states[names[alarm['AlarmName']]] = alarm['StateValue']
+    return states
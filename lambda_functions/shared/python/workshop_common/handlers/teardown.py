@@ -0,0 +1,236 @@
+import json
+import time
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.chaos_runner import CHAOS_AGENT_ENABLED, delete_agent_queues
+from workshop_common.clients import client
+from workshop_common.instance_index import forget_instance, forget_instances
+from workshop_common.launch import ALARM_MODE
+from workshop_common.warm_pool import disable_pool
+
+WORKSHOP_TAG = 'devops-workshop'
+ACTIVE_STATES = ['pending', 'running', 'stopping', 'stopped']
+
+# API limits: terminate_instances takes up to 1000 IDs, delete_alarms up to 100 names
+TERMINATE_BATCH_SIZE = 1000
+DELETE_ALARMS_BATCH_SIZE = 100
+
+
+@metrics.instrumented('teardown')
+def lambda_handler(event, context):
+    """
+    Teardown EC2 instance and CloudWatch alarm for a workshop user.
+
+    Input: {"username": "user123"}
+    Output: {
+        "success": true,
+        "terminated_instances": ["i-xxx"],
+        "deleted_alarms": ["workshop-user123-disk-high"],
+        "username": "user123"
+    }
+
+    Cohort input: {"mode": "cohort"} (optional "workshop": "devops-workshop",
+                  "alarm_prefix": "workshop-")
+    Cohort output: {
+        "success": true,
+        "workshop": "devops-workshop",
+        "terminated_count": 412,
+        "deleted_alarm_count": 824,
+        "timings": {"discover_instances_ms": ..., "terminate_ms": ..., ...}
+    }
+    """
+    try:
+        # Parse input
+        if isinstance(event, str):
+            event = json.loads(event)
+
+        if event.get('mode') == 'cohort':
+            return teardown_cohort(
+                event.get('workshop', WORKSHOP_TAG),
+                event.get('alarm_prefix', 'workshop-')
+            )
+
+        username = event.get('username')
+        if not username:
+            return {
+                'success': False,
+                'error': 'Missing required field: username'
+            }
+
+        # Sanitize username
+        safe_username = ''.join(c for c in username if c.isalnum() or c in '-_').lower()
+
+        # Both disk and CPU alarms to delete
+        alarm_names = [
+            f"workshop-{safe_username}-disk-high",
+            f"workshop-{safe_username}-cpu-high"
+        ]
+
+        terminated_instances = []
+        deleted_alarms = []
+
+        # Find instances with the workshop-user tag
+        with metrics.phase('lookup'):
+            response = client('ec2').describe_instances(
+                Filters=[
+                    {'Name': 'tag:workshop-user', 'Values': [safe_username]},
+                    {'Name': 'instance-state-name', 'Values': ACTIVE_STATES}
+                ]
+            )
+
+        instance_ids = []
+        for reservation in response['Reservations']:
+            for instance in reservation['Instances']:
+                instance_ids.append(instance['InstanceId'])
+
+        # Terminate instances
+        if instance_ids:
+            print(f"Terminating instances: {instance_ids}")
+            client('ec2').terminate_instances(InstanceIds=instance_ids)
+            terminated_instances = instance_ids
+            if CHAOS_AGENT_ENABLED:
+                delete_agent_queues(instance_ids)
+
+        # Drop the username -> instance index entry so lookups stop resolving to it
+        forget_instance(safe_username)
+
+        # Delete CloudWatch alarms (both disk and CPU). Fleet alarms cover the
+        # whole cohort and stay until cohort teardown
+        if ALARM_MODE != 'fleet':
+            try:
+                alarms = client('cloudwatch').describe_alarms(AlarmNames=alarm_names)
+                existing_alarms = [a['AlarmName'] for a in alarms['MetricAlarms']]
+                if existing_alarms:
+                    client('cloudwatch').delete_alarms(AlarmNames=existing_alarms)
+                    deleted_alarms = existing_alarms
+                    print(f"Deleted alarms: {existing_alarms}")
+            except ClientError as e:
+                print(f"Error deleting alarms: {e}")
+
+        return {
+            'success': True,
+            'terminated_instances': terminated_instances,
+            'deleted_alarms': deleted_alarms,
+            'username': safe_username,
+            'message': f"Teardown complete. Terminated {len(terminated_instances)} instance(s)."
+        }
+
+    except ClientError as e:
+        print(f"AWS Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def teardown_cohort(workshop, alarm_prefix):
+    """
+    Tear down every instance tagged workshop=<workshop> (or workshop-pool=<workshop>
+    for unassigned warm pool instances, workshop-image-builder=<workshop> for an
+    unfinished image bake) and every alarm whose
+    name starts with alarm_prefix, paging through both and deleting in the
+    largest batches each API allows. Also disables the warm pool, so its
+    refill schedule doesn't launch new instances after the teardown.
+    """
+    timings = {}
+    started = time.monotonic()
+
+    # Stop the refill schedule relaunching the pool before looking for its
+    # instances, and drop the entries of the ones about to be terminated
+    pool_entries = disable_pool()
+
+    # Discover all instances in the cohort, including unassigned warm pool instances
+    instance_ids = []
+    seen = set()
+    usernames = []
+    paginator = client('ec2').get_paginator('describe_instances')
+    for tag_key in ['workshop', 'workshop-pool', 'workshop-image-builder']:
+        pages = paginator.paginate(
+            Filters=[
+                {'Name': f'tag:{tag_key}', 'Values': [workshop]},
+                {'Name': 'instance-state-name', 'Values': ACTIVE_STATES}
+            ]
+        )
+        for page in pages:
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    if instance['InstanceId'] in seen:
+                        continue
+                    seen.add(instance['InstanceId'])
+                    instance_ids.append(instance['InstanceId'])
+                    tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+                    if 'workshop-user' in tags:
+                        usernames.append(tags['workshop-user'])
+    mark = time.monotonic()
+    timings['discover_instances_ms'] = int((mark - started) * 1000)
+
+    # Terminate in batches
+    terminated_count = 0
+    errors = []
+    for start in range(0, len(instance_ids), TERMINATE_BATCH_SIZE):
+        batch = instance_ids[start:start + TERMINATE_BATCH_SIZE]
+        try:
+            client('ec2').terminate_instances(InstanceIds=batch)
+            terminated_count += len(batch)
+        except ClientError as e:
+            print(f"Error terminating batch of {len(batch)}: {e}")
+            errors.append(str(e))
+    print(f"Terminated {terminated_count} instance(s)")
+
+    forget_instances(usernames)
+    last, mark = mark, time.monotonic()
+    timings['terminate_ms'] = int((mark - last) * 1000)
+
+    if CHAOS_AGENT_ENABLED:
+        print(f"Deleted {delete_agent_queues(instance_ids)} chaos agent queue(s)")
+        last, mark = mark, time.monotonic()
+        timings['delete_queues_ms'] = int((mark - last) * 1000)
+
+    # Discover all workshop alarms
+    alarm_names = []
+    paginator = client('cloudwatch').get_paginator('describe_alarms')
+    for page in paginator.paginate(AlarmNamePrefix=alarm_prefix):
+        alarm_names.extend(a['AlarmName'] for a in page.get('MetricAlarms', []))
+    last, mark = mark, time.monotonic()
+    timings['discover_alarms_ms'] = int((mark - last) * 1000)
+
+    # Delete alarms in batches
+    deleted_alarm_count = 0
+    for start in range(0, len(alarm_names), DELETE_ALARMS_BATCH_SIZE):
+        batch = alarm_names[start:start + DELETE_ALARMS_BATCH_SIZE]
+        try:
+            client('cloudwatch').delete_alarms(AlarmNames=batch)
+            deleted_alarm_count += len(batch)
+        except ClientError as e:
+            print(f"Error deleting batch of {len(batch)} alarms: {e}")
+            errors.append(str(e))
+    print(f"Deleted {deleted_alarm_count} alarm(s)")
+    last, mark = mark, time.monotonic()
+    timings['delete_alarms_ms'] = int((mark - last) * 1000)
+    timings['total_ms'] = int((mark - started) * 1000)
+    for name, ms in timings.items():
+        if name != 'total_ms':
+            metrics.add_phase(name[:-len('_ms')], ms)
+
+    response = {
+        'success': not errors,
+        'workshop': workshop,
+        'terminated_count': terminated_count,
+        'deleted_alarm_count': deleted_alarm_count,
+        'deleted_pool_entries': pool_entries,
+        'timings': timings,
+        'message': (
+            f"Cohort teardown complete. Terminated {terminated_count} instance(s) "
+            f"and deleted {deleted_alarm_count} alarm(s)."
+        )
+    }
+    if errors:
+        response['errors'] = errors
+    return response
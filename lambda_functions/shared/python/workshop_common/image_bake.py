@@ -0,0 +1,181 @@
+import time
+
+from botocore.exceptions import ClientError
+
+from workshop_common.clients import client
+from workshop_common.launch import (
+    AGENT_CTL, AMI_ID, BAKED_AMI_PARAMETER, INSTALL_SCRIPT, START_AGENT, WORKSHOP_TAG, WRITE_AGENT_CONFIG,
+    launch_instances
+)
+from workshop_common.ssm_runner import run_command
+
+BUILDER_TAG = 'workshop-image-builder'
+
+# The builder runs the full install once. Starting the agent here enables its
+# service, so instances launched from the image start it on boot by themselves.
+BUILDER_USER_DATA = '#!/bin/bash\n' + INSTALL_SCRIPT + WRITE_AGENT_CONFIG + START_AGENT
+
+# Blocks until cloud-init (user data) has finished, then checks the install
+READY_COMMAND = (
+    'cloud-init status --wait > /dev/null; '
+    f'test -x {AGENT_CTL} && command -v stress-ng > /dev/null && echo BAKE_READY'
+)
+
+# Bound each readiness wait so a call returns well inside the Lambda timeout
+READY_MAX_WAIT_SECONDS = 60
+
+
+def bake_image(event, context=None):
+    """
+    Build the pre-baked workshop image in resumable stages.
+
+    1. No ids: launch a builder instance from AMI_ID with the full install
+       script. Returns stage "building" with builder_instance_id.
+    2. builder_instance_id: wait for the builder's user data to finish (over
+       SSM), then create_image. Returns stage "imaging" with image_id, or
+       "building" (with command_id) while the install is still running.
+    3. image_id: once the image is available, store its ID in the
+       BAKED_AMI_PARAMETER SSM parameter and terminate the builder.
+       Returns stage "complete".
+
+    Call again with the fields from each response until stage is "complete".
+    Provision switches to the baked image within BAKED_AMI_CACHE_TTL seconds.
+    """
+    if not BAKED_AMI_PARAMETER:
+        return {'success': False, 'error': 'Image baking is not configured (BAKED_AMI_PARAMETER unset)'}
+
+    builder_id = event.get('builder_instance_id')
+    image_id = event.get('image_id')
+
+    if image_id:
+        return _publish_image(image_id, builder_id)
+    if builder_id:
+        return _snapshot_builder(builder_id, event.get('command_id'), context)
+    return _launch_builder()
+
+
+def _launch_builder():
+    builder_tags = [
+        {'Key': 'Name', 'Value': BUILDER_TAG},
+        {'Key': BUILDER_TAG, 'Value': WORKSHOP_TAG}
+    ]
+    # The image is x86_64 whatever PROVISION_PROFILE is; arm64 profiles never use it
+    instances = launch_instances(1, [
+        {'ResourceType': 'instance', 'Tags': builder_tags},
+        {'ResourceType': 'volume', 'Tags': builder_tags}
+    ], image=(AMI_ID, BUILDER_USER_DATA, 'builder'), profile_name='standard')
+    builder_id = instances[0]['InstanceId']
+    print(f"Launched image builder {builder_id}")
+
+    return {
+        'success': True,
+        'stage': 'building',
+        'builder_instance_id': builder_id,
+        'message': 'Builder launched. Call again with builder_instance_id once it has booted.'
+    }
+
+
+def _snapshot_builder(builder_id, command_id, context):
+    building = {
+        'success': True,
+        'stage': 'building',
+        'builder_instance_id': builder_id
+    }
+
+    try:
+        result = run_command(
+            client('ssm'), builder_id, READY_COMMAND, context,
+            timeout_seconds=900,
+            max_wait_seconds=READY_MAX_WAIT_SECONDS,
+            command_id=command_id,
+            comment='workshop image bake readiness check'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidInstanceId':
+            raise
+        # The SSM agent has not registered yet
+        return {**building, 'message': 'Builder is not reachable over SSM yet. Call again shortly.'}
+
+    if result['resumable']:
+        return {
+            **building,
+            'command_id': result['command_id'],
+            'message': 'Builder is still installing. Call again with builder_instance_id and command_id.'
+        }
+
+    if result['status'] != 'Success' or 'BAKE_READY' not in result['stdout']:
+        return {
+            'success': False,
+            'stage': 'failed',
+            'builder_instance_id': builder_id,
+            'error': f"Builder install did not complete ({result['status']}): {result['stderr'] or result['stdout']}"
+        }
+
+    image_name = f"{BUILDER_TAG}-{int(time.time())}"
+    response = client('ec2').create_image(
+        InstanceId=builder_id,
+        Name=image_name,
+        Description='Workshop image with CloudWatch agent, stress-ng and agent config preinstalled',
+        TagSpecifications=[{
+            'ResourceType': 'image',
+            'Tags': [
+                {'Key': 'Name', 'Value': image_name},
+                {'Key': BUILDER_TAG, 'Value': WORKSHOP_TAG}
+            ]
+        }]
+    )
+    image_id = response['ImageId']
+    print(f"Creating image {image_id} from builder {builder_id}")
+
+    return {
+        'success': True,
+        'stage': 'imaging',
+        'builder_instance_id': builder_id,
+        'image_id': image_id,
+        'message': 'Image is being created. Call again with image_id and builder_instance_id.'
+    }
+
+
+def _publish_image(image_id, builder_id):
+    images = client('ec2').describe_images(ImageIds=[image_id])['Images']
+    state = images[0]['State'] if images else 'missing'
+
+    if state == 'pending':
+        return {
+            'success': True,
+            'stage': 'imaging',
+            'builder_instance_id': builder_id,
+            'image_id': image_id,
+            'message': 'Image is still being created. Call again shortly.'
+        }
+
+    if state == 'available':
+        client('ssm').put_parameter(
+            Name=BAKED_AMI_PARAMETER,
+            Value=image_id,
+            Type='String',
+            Overwrite=True
+        )
+        print(f"Published baked image {image_id} to {BAKED_AMI_PARAMETER}")
+
+    if builder_id:
+        try:
+            client('ec2').terminate_instances(InstanceIds=[builder_id])
+        except ClientError as e:
+            print(f"Error terminating builder {builder_id}: {e}")
+
+    if state != 'available':
+        return {
+            'success': False,
+            'stage': 'failed',
+            'image_id': image_id,
+            'error': f'Image is {state}'
+        }
+
+    return {
+        'success': True,
+        'stage': 'complete',
+        'image_id': image_id,
+        'parameter': BAKED_AMI_PARAMETER,
+        'message': f'Provision will launch from {image_id}'
+    }
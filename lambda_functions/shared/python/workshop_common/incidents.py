@@ -0,0 +1,253 @@
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.clients import client
+from workshop_common.launch import ALARM_MODE, WORKSHOP_TAG, fleet_alarm_name
+
+# Incident timeline store (hash key cohort, range key incident_key). Each
+# injection a scenario makes on a user's instance is one item keyed
+# "<incident ID>#<username>", stamped with when it was injected, when its
+# alarm fired, when a remediation was invoked and when that remediation
+# cleared it. "open#<username>#<kind>" items point at the user's open
+# incident of each kind, so a remediation called without an incident_id
+# still finds it. Unset, incident IDs are still generated and returned but
+# nothing is written.
+INCIDENT_TABLE = os.environ.get('INCIDENT_TABLE')
+
+# Scenario -> the kind of incident it injects or remediates. The kind names
+# the alarm that should detect it ("disk" or "cpu").
+INJECTIONS = {
+    'fill_disk': 'disk',
+    'corrupt_disk': 'disk',
+    'spike_cpu': 'cpu'
+}
+REMEDIATIONS = {
+    'reset_disk': 'disk',
+    'fix_corrupt_disk': 'disk',
+    'kill_and_restart': 'cpu'
+}
+
+# Comment on synchronous SSM commands, so a command in the SSM console or
+# CloudTrail leads back to its incident
+COMMENT_PREFIX = 'workshop-incident'
+
+# Incidents expire from the table (DynamoDB TTL)
+ITEM_TTL_SECONDS = 30 * 24 * 3600
+
+# Parallel writes when a bulk call touches many users' incidents
+RECORD_WORKERS = 10
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def incident_id_for(name, event):
+    """
+    The correlation ID for a scenario call: the event's "incident_id", or a new
+    one for a call that injects an incident. None for a remediation without
+    one (its user's open incident is looked up when it is recorded).
+    """
+    if event.get('incident_id'):
+        return str(event['incident_id'])
+    if name in INJECTIONS:
+        return uuid.uuid4().hex[:12]
+    return None
+
+
+def cohort_of(event):
+    return str(event.get('workshop') or WORKSHOP_TAG)
+
+
+def command_comment(incident_id):
+    return f"{COMMENT_PREFIX}:{incident_id}" if incident_id else None
+
+
+def alarm_name(kind, username):
+    """The alarm that should fire for an incident of this kind (see launch.create_alarms)."""
+    if ALARM_MODE == 'fleet':
+        return fleet_alarm_name(kind)
+    return f"workshop-{username}-{kind}-high"
+
+
+def track(name, incident_id, responses, cohort, responded_at=None):
+    """
+    Stamp a scenario's responses with the incident ID and record them on the
+    timeline. Injections that succeeded open an incident per user;
+    remediations record when they were invoked (responded_at, the start of
+    the call) and, if they cleared it, when it recovered.
+    """
+    responses = [r for r in responses if r.get('username') and not r.get('in_progress')]
+    for response in responses:
+        if incident_id:
+            response['incident_id'] = incident_id
+    if incident_id:
+        metrics.annotate('IncidentId', incident_id)
+    if not INCIDENT_TABLE or not (name in INJECTIONS or name in REMEDIATIONS):
+        return
+
+    def record(response):
+        try:
+            if name in INJECTIONS:
+                if response.get('success'):
+                    record_injection(incident_id, name, response, cohort)
+            else:
+                resolved = record_remediation(incident_id, name, response, cohort, responded_at or now())
+                if resolved:
+                    response['incident_id'] = resolved
+        except ClientError as e:
+            # The scenario itself worked; never fail it over the timeline
+            print(f"Could not record incident for {response['username']}: {e}")
+
+    if len(responses) == 1:
+        record(responses[0])
+        return
+    with ThreadPoolExecutor(max_workers=RECORD_WORKERS) as pool:
+        list(pool.map(metrics.bound(record), responses))
+
+
+def incident_key(incident_id, username):
+    return f"{incident_id}#{username}"
+
+
+def open_key(username, kind):
+    return f"open#{username}#{kind}"
+
+
+def record_injection(incident_id, name, response, cohort):
+    """Open an incident for the user and make it their open incident of its kind."""
+    username = response['username']
+    kind = INJECTIONS[name]
+    injected_at = now()
+    expires_at = str(int(time.time()) + ITEM_TTL_SECONDS)
+    client('dynamodb').put_item(
+        TableName=INCIDENT_TABLE,
+        Item={
+            'cohort': {'S': cohort},
+            'incident_key': {'S': incident_key(incident_id, username)},
+            'incident_id': {'S': incident_id},
+            'username': {'S': username},
+            'instance_id': {'S': response.get('instance_id') or ''},
+            'kind': {'S': kind},
+            'scenario': {'S': name},
+            'alarm_name': {'S': alarm_name(kind, username)},
+            'injected_at': {'S': injected_at},
+            'events': {'L': [timeline_event('injected', injected_at, name, response)]},
+            'expires_at': {'N': expires_at}
+        }
+    )
+    client('dynamodb').put_item(
+        TableName=INCIDENT_TABLE,
+        Item={
+            'cohort': {'S': cohort},
+            'incident_key': {'S': open_key(username, kind)},
+            'incident_id': {'S': incident_id},
+            'expires_at': {'N': expires_at}
+        }
+    )
+    metrics.count('IncidentsOpened')
+
+
+def record_remediation(incident_id, name, response, cohort, responded_at):
+    """
+    Record a remediation against the given incident, or the user's open one.
+    Fills in the detection time from the alarm's history if it is still
+    missing. Returns the incident ID recorded against, or None.
+    """
+    username = response['username']
+    kind = REMEDIATIONS[name]
+    if not incident_id:
+        pointer = client('dynamodb').get_item(
+            TableName=INCIDENT_TABLE,
+            Key={'cohort': {'S': cohort}, 'incident_key': {'S': open_key(username, kind)}}
+        ).get('Item')
+        if not pointer:
+            print(f"No open {kind} incident for {username}; not recorded")
+            return None
+        incident_id = pointer['incident_id']['S']
+
+    key = {'cohort': {'S': cohort}, 'incident_key': {'S': incident_key(incident_id, username)}}
+    item = client('dynamodb').get_item(TableName=INCIDENT_TABLE, Key=key).get('Item')
+    if not item:
+        print(f"Incident {incident_id} has no record for {username}; not recorded")
+        return None
+
+    updates = ['responded_at = if_not_exists(responded_at, :responded)', 'remediation = :remediation']
+    values = {':responded': {'S': responded_at}, ':remediation': {'S': name}}
+    events = [timeline_event('responded', responded_at, name, response)]
+
+    if 'detected_at' not in item:
+        detected_at = detection_time(item['alarm_name']['S'], item['injected_at']['S'])
+        if detected_at:
+            updates.append('detected_at = :detected')
+            values[':detected'] = {'S': detected_at}
+            events.insert(0, timeline_event('detected', detected_at, 'alarm', {}))
+
+    recovered = response.get('success') and response.get('recovered', True)
+    if recovered:
+        recovered_at = now()
+        updates.append('recovered_at = :recovered')
+        values[':recovered'] = {'S': recovered_at}
+        events.append(timeline_event('recovered', recovered_at, name, response))
+
+    updates.append('events = list_append(events, :events)')
+    values[':events'] = {'L': events}
+    client('dynamodb').update_item(
+        TableName=INCIDENT_TABLE,
+        Key=key,
+        UpdateExpression='SET ' + ', '.join(updates),
+        ExpressionAttributeValues=values
+    )
+    if recovered:
+        # Only close the pointer if it still points at this incident
+        try:
+            client('dynamodb').delete_item(
+                TableName=INCIDENT_TABLE,
+                Key={'cohort': {'S': cohort}, 'incident_key': {'S': open_key(username, kind)}},
+                ConditionExpression='incident_id = :id',
+                ExpressionAttributeValues={':id': {'S': incident_id}}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        metrics.count('IncidentsRecovered')
+    return incident_id
+
+
+def timeline_event(step, at, source, response):
+    event = {'step': {'S': step}, 'at': {'S': at}, 'source': {'S': source}}
+    if response.get('command_id'):
+        event['command_id'] = {'S': response['command_id']}
+    if response.get('via'):
+        event['via'] = {'S': response['via']}
+    return {'M': event}
+
+
+def detection_time(name, injected_at):
+    """When the alarm first went into ALARM after injected_at, from its state-change history, or None."""
+    try:
+        history = client('cloudwatch').describe_alarm_history(
+            AlarmName=name,
+            HistoryItemType='StateUpdate',
+            StartDate=datetime.fromisoformat(injected_at),
+            EndDate=datetime.now(timezone.utc),
+            ScanBy='TimestampAscending'
+        )['AlarmHistoryItems']
+    except ClientError as e:
+        print(f"Could not read the history of alarm {name}: {e}")
+        return None
+    for entry in history:
+        try:
+            state = json.loads(entry['HistoryData'])['newState']['stateValue']
+        except (KeyError, TypeError, ValueError):
+            continue
+        if state == 'ALARM':
+            return entry['Timestamp'].astimezone(timezone.utc).isoformat()
+    return None
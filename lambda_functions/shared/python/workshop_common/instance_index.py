@@ -0,0 +1,166 @@
+import os
+import time
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.clients import client
+
+# DynamoDB table mapping workshop-user -> instance ID, written by provision and
+# cleared by teardown. Without it every lookup falls back to describe_instances.
+INSTANCE_INDEX_TABLE = os.environ.get('INSTANCE_INDEX_TABLE')
+INSTANCE_CACHE_TTL = int(os.environ.get('INSTANCE_CACHE_TTL', '60'))
+
+# Per-container cache: {username: (instance_id, expires_at)}
+_cache = {}
+
+# Errors meaning the instance ID we used no longer points at a usable instance
+STALE_INSTANCE_ERRORS = [
+    'InvalidInstanceId',
+    'InvalidInstanceID.NotFound',
+    'InvalidInstanceID.Malformed',
+    'IncorrectInstanceState'
+]
+
+
+def lookup_instance_id(ec2, username, instance_id=None, refresh=False):
+    """
+    Resolve a sanitized username to its instance ID.
+
+    An explicit instance_id is returned as-is. Otherwise the in-process cache
+    is consulted, then the index table, then a describe_instances tag scan
+    (whose answer is written back to the index). refresh=True skips the cache
+    and the index. Returns None when the user has no running instance.
+    """
+    if instance_id:
+        return instance_id
+
+    now = time.time()
+    if not refresh:
+        cached = _cache.get(username)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        if INSTANCE_INDEX_TABLE:
+            try:
+                item = client('dynamodb').get_item(
+                    TableName=INSTANCE_INDEX_TABLE,
+                    Key={'username': {'S': username}},
+                    ProjectionExpression='instance_id'
+                ).get('Item')
+                if item:
+                    instance_id = item['instance_id']['S']
+                    _cache[username] = (instance_id, now + INSTANCE_CACHE_TTL)
+                    return instance_id
+            except ClientError as e:
+                print(f"Instance index lookup failed, falling back to EC2: {e}")
+
+    response = ec2.describe_instances(
+        Filters=[
+            {'Name': 'tag:workshop-user', 'Values': [username]},
+            {'Name': 'instance-state-name', 'Values': ['running']}
+        ]
+    )
+
+    for reservation in response['Reservations']:
+        for instance in reservation['Instances']:
+            instance_id = instance['InstanceId']
+            record_instance(username, instance_id)
+            return instance_id
+
+    forget_instance(username)
+    return None
+
+
+def record_instance(username, instance_id):
+    """Write a username -> instance ID entry to the cache and index."""
+    record_instances({username: instance_id})
+
+
+def record_instances(mapping):
+    """Write many username -> instance ID entries, 25 per BatchWriteItem call."""
+    expires_at = time.time() + INSTANCE_CACHE_TTL
+    for username, instance_id in mapping.items():
+        _cache[username] = (instance_id, expires_at)
+
+    if not INSTANCE_INDEX_TABLE:
+        return
+
+    now = str(int(time.time()))
+    requests = [
+        {'PutRequest': {'Item': {
+            'username': {'S': username},
+            'instance_id': {'S': instance_id},
+            'updated_at': {'N': now}
+        }}}
+        for username, instance_id in mapping.items()
+    ]
+    _batch_write(requests)
+
+
+def forget_instance(username):
+    """Remove a user's entry from the cache and index."""
+    forget_instances([username])
+
+
+def forget_instances(usernames):
+    """Remove many users' entries, 25 per BatchWriteItem call."""
+    for username in usernames:
+        _cache.pop(username, None)
+
+    if not INSTANCE_INDEX_TABLE:
+        return
+
+    requests = [
+        {'DeleteRequest': {'Key': {'username': {'S': username}}}}
+        for username in usernames
+    ]
+    _batch_write(requests)
+
+
+def _batch_write(requests):
+    try:
+        for start in range(0, len(requests), 25):
+            pending = {INSTANCE_INDEX_TABLE: requests[start:start + 25]}
+            # Retry unprocessed items a few times; the index is only an optimization
+            for _ in range(3):
+                response = client('dynamodb').batch_write_item(RequestItems=pending)
+                pending = response.get('UnprocessedItems')
+                if not pending:
+                    break
+                time.sleep(0.1)
+    except ClientError as e:
+        print(f"Instance index update failed: {e}")
+
+
+def is_stale_instance_error(error):
+    """True if a ClientError says the instance ID is gone or unusable."""
+    code = error.response.get('Error', {}).get('Code', '')
+    return code in STALE_INSTANCE_ERRORS
+
+
+def run_on_user_instance(ec2, username, action, instance_id=None):
+    """
+    Resolve the user's instance and call action(instance_id).
+
+    If the action fails because the resolved ID is stale, the entry is dropped
+    and the instance is looked up once more from EC2 before retrying.
+    Returns (instance_id, action result), or (None, None) if the user has no
+    running instance.
+    """
+    with metrics.phase('lookup'):
+        instance_id = lookup_instance_id(ec2, username, instance_id)
+    if not instance_id:
+        return None, None
+
+    try:
+        return instance_id, action(instance_id)
+    except ClientError as e:
+        if not is_stale_instance_error(e):
+            raise
+        print(f"Instance {instance_id} for {username} is stale ({e}); looking it up again")
+
+    with metrics.phase('lookup'):
+        fresh_id = lookup_instance_id(ec2, username, refresh=True)
+    if not fresh_id:
+        return None, None
+    return fresh_id, action(fresh_id)
@@ -0,0 +1,540 @@
+import json
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.chaos_runner import CHAOS_AGENT_ENABLED, chaos_agent_script
+from workshop_common.clients import client, retry_throttled
+
+# Environment variables from Terraform
+AMI_ID = os.environ.get('AMI_ID')
+AMI_ID_ARM64 = os.environ.get('AMI_ID_ARM64')
+SUBNET_ID = os.environ.get('SUBNET_ID')
+SECURITY_GROUP_ID = os.environ.get('SECURITY_GROUP_ID')
+INSTANCE_PROFILE_ARN = os.environ.get('INSTANCE_PROFILE_ARN')
+SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN')
+DISK_THRESHOLD = int(os.environ.get('DISK_THRESHOLD', '80'))
+ALARM_PERIOD = int(os.environ.get('ALARM_PERIOD', '10'))
+CPU_THRESHOLD = 80
+
+# "per_user" creates a disk and a CPU alarm for every instance. "fleet" instead
+# keeps one Metrics Insights alarm per metric for the whole cohort, grouped by
+# InstanceId, so provision and teardown make no per-user alarm calls. The
+# fleet_breaches action maps breaching instances back to users.
+ALARM_MODE = os.environ.get('ALARM_MODE', 'per_user')
+
+# Metrics Insights alarms evaluate whole minutes
+FLEET_ALARM_PERIOD = 60
+
+# Re-put the fleet alarms this often per container. In between, one
+# describe_alarms call checks they still exist, so they come back straight
+# away after a cohort teardown deleted them
+FLEET_ALARM_REFRESH_SECONDS = 300
+
+# Metric -> (Metrics Insights query returning one series per instance, threshold)
+FLEET_QUERIES = {
+    'disk': (
+        'SELECT MAX(disk_used_percent) FROM SCHEMA("Workshop", InstanceId, device, fstype, path) '
+        "WHERE path = '/' GROUP BY InstanceId ORDER BY MAX() DESC",
+        DISK_THRESHOLD
+    ),
+    'cpu': (
+        'SELECT AVG(cpu_usage_active) FROM SCHEMA("Workshop", InstanceId, cpu) '
+        "WHERE cpu = 'cpu-total' GROUP BY InstanceId ORDER BY AVG() DESC",
+        CPU_THRESHOLD
+    )
+}
+
+# When this container last put the fleet alarms
+_fleet_alarms_put_at = 0
+_fleet_lock = threading.Lock()
+
+WORKSHOP_TAG = 'devops-workshop'
+
+# Instance type, CPU credit mode and architecture for new instances. Types are
+# tried in order: a capacity error on one (or a short launch) moves on to the
+# next. Standard-credit instances crawl once spike_cpu has used up their
+# credits, SSM agent included, so CPU-heavy workshops want "unlimited".
+# Every type must be a Nitro type: the disk alarms expect an nvme root device.
+PROVISION_PROFILES = {
+    'standard': {
+        'instance_types': ['t3.micro', 't3a.micro', 't3.small'],
+        'cpu_credits': 'standard',
+        'architecture': 'x86_64'
+    },
+    'unlimited': {
+        'instance_types': ['t3.micro', 't3a.micro', 't3.small'],
+        'cpu_credits': 'unlimited',
+        'architecture': 'x86_64'
+    },
+    'arm64': {
+        'instance_types': ['t4g.micro', 't4g.small'],
+        'cpu_credits': 'unlimited',
+        'architecture': 'arm64'
+    },
+    'fixed': {
+        'instance_types': ['c6i.large', 'c5.large', 'm6i.large'],
+        'cpu_credits': None,
+        'architecture': 'x86_64'
+    }
+}
+PROVISION_PROFILE = os.environ.get('PROVISION_PROFILE', 'standard')
+if PROVISION_PROFILE not in PROVISION_PROFILES:
+    PROVISION_PROFILE = 'standard'
+
+# Tried before the profile's own types when set
+INSTANCE_TYPE = os.environ.get('INSTANCE_TYPE', '')
+
+# run_instances errors that mean "no room for this type here", not a bad request
+CAPACITY_ERRORS = {'InsufficientInstanceCapacity', 'Unsupported'}
+
+# Subnets new instances are spread over, ideally in several AZs. Each launch
+# goes to the subnet with the most free addresses, except that an AZ which
+# just ran out of capacity for an instance type is tried last for that type
+# for CAPACITY_PENALTY_SECONDS. Empty means SUBNET_ID alone.
+SUBNET_IDS = [s.strip() for s in os.environ.get('SUBNET_IDS', '').split(',') if s.strip()] or [SUBNET_ID]
+SUBNET_CACHE_SECONDS = 60
+CAPACITY_PENALTY_SECONDS = 300
+
+# run_instances error for a subnet with no free addresses left
+ADDRESS_ERRORS = {'InsufficientFreeAddressesInSubnet'}
+
+# Per-container placement state: ({subnet_id: {'az': ..., 'free': ...}},
+# expires_at), and (availability_zone, instance_type) -> last capacity failure
+_subnets = ({}, 0)
+_capacity_failures = {}
+_placement_lock = threading.Lock()
+
+# How fast a breach reaches the alarms. The agent's default flush interval is
+# 60 s, which dominates detection time however short the alarm period is.
+# "low_latency" samples every second, flushes every 5 s and alarms on a
+# 10 s high-resolution period's maximum for disk. Scenario handlers also
+# publish the disk usage they just measured (see telemetry).
+TELEMETRY_PRESETS = {
+    'standard': {
+        'collection_interval': 10,
+        'flush_interval': None,
+        'disk_statistic': 'Average'
+    },
+    'low_latency': {
+        'collection_interval': 1,
+        'flush_interval': 5,
+        'disk_statistic': 'Maximum'
+    }
+}
+TELEMETRY_MODE = os.environ.get('TELEMETRY_MODE', 'standard')
+TELEMETRY = TELEMETRY_PRESETS.get(TELEMETRY_MODE, TELEMETRY_PRESETS['standard'])
+
+# SSM parameter holding the ID of the pre-baked workshop image (see image_bake)
+BAKED_AMI_PARAMETER = os.environ.get('BAKED_AMI_PARAMETER')
+BAKED_AMI_CACHE_TTL = 300
+
+# Per-container cache of the baked image lookup: (image_id or None, expires_at)
+_baked_image = (None, 0)
+
+AGENT_CONFIG_PATH = '/opt/aws/amazon-cloudwatch-agent/etc/config.json'
+AGENT_CTL = '/opt/aws/amazon-cloudwatch-agent/bin/amazon-cloudwatch-agent-ctl'
+
+
+
+def agent_config(telemetry=TELEMETRY):
+    """
+    CloudWatch agent configuration. Intervals under 60 s make the agent
+    publish high-resolution metrics, which 10 s alarm periods require.
+    """
+    interval = telemetry['collection_interval']
+    metrics = {
+        'namespace': 'Workshop',
+        'metrics_collected': {
+            'cpu': {
+                'measurement': ['usage_active'],
+                'totalcpu': True,
+                'metrics_collection_interval': interval
+            },
+            'disk': {
+                'measurement': ['used_percent'],
+                'resources': ['/'],
+                'metrics_collection_interval': interval
+            }
+        },
+        'append_dimensions': {
+            'InstanceId': '${aws:InstanceId}'
+        }
+    }
+    if telemetry['flush_interval']:
+        metrics['force_flush_interval'] = telemetry['flush_interval']
+    return json.dumps({'metrics': metrics}, indent=2)
+
+
+# CloudWatch Agent configuration
+AGENT_CONFIG = agent_config()
+
+# Installs the agent and stress-ng (and boto3 for the chaos agent). Runs on
+# every boot of the stock AMI, and once on the image builder when baking.
+INSTALL_SCRIPT = 'yum install -y amazon-cloudwatch-agent stress-ng' + (' python3-boto3' if CHAOS_AGENT_ENABLED else '') + '\n'
+
+# Written on every boot, baked image included, so TELEMETRY_MODE changes apply
+# without rebaking
+WRITE_AGENT_CONFIG = f'''
+cat > {AGENT_CONFIG_PATH} << 'EOF'
+{AGENT_CONFIG}
+EOF
+'''
+
+START_AGENT = f'''
+{AGENT_CTL} -a fetch-config -m ec2 -s -c file:{AGENT_CONFIG_PATH}
+'''
+
+
+def boot_metric_script(boot_path):
+    """
+    Shell snippet publishing Workshop/boot_to_agent_seconds (seconds from
+    kernel boot until the agent is started) with a BootPath dimension. This
+    stops short of the agent loading its config and flushing; the full
+    boot-to-first-metric time, up to the first datapoint CloudWatch actually
+    received, is published by readiness (boot_to_first_metric_seconds).
+    """
+    return f'''
+TOKEN=$(curl -s -X PUT http://169.254.169.254/latest/api/token -H "X-aws-ec2-metadata-token-ttl-seconds: 60")
+REGION=$(curl -s -H "X-aws-ec2-metadata-token: $TOKEN" http://169.254.169.254/latest/meta-data/placement/region)
+UPTIME=$(cut -d' ' -f1 /proc/uptime)
+aws cloudwatch put-metric-data --region "$REGION" --namespace Workshop \\
+  --metric-name boot_to_agent_seconds --dimensions BootPath={boot_path} \\
+  --value "$UPTIME" --unit Seconds || true
+'''
+
+
+# Installed last, so it never delays the CloudWatch agent
+CHAOS_AGENT_SCRIPT = chaos_agent_script() if CHAOS_AGENT_ENABLED else ''
+
+# CloudWatch Agent user data script for the stock AMI
+USER_DATA = (
+    '#!/bin/bash\n' + INSTALL_SCRIPT + WRITE_AGENT_CONFIG + START_AGENT + boot_metric_script('script')
+    + CHAOS_AGENT_SCRIPT
+)
+
+# User data for the baked image: everything is installed, only configure and start the agent
+BAKED_USER_DATA = '#!/bin/bash\n' + WRITE_AGENT_CONFIG + START_AGENT + boot_metric_script('baked') + CHAOS_AGENT_SCRIPT
+
+
+def sanitize_username(username):
+    """Sanitize a username for use in resource names and tags."""
+    return ''.join(c for c in username if c.isalnum() or c in '-_').lower()
+
+
+def workshop_tags(safe_username, name):
+    """Tags applied to every instance and volume owned by a workshop user."""
+    return [
+        {'Key': 'Name', 'Value': name},
+        {'Key': 'workshop-user', 'Value': safe_username},
+        {'Key': 'workshop', 'Value': WORKSHOP_TAG}
+    ]
+
+
+def instance_types(profile_name=PROVISION_PROFILE):
+    """Instance types to try, in order, for a provisioning profile."""
+    types = PROVISION_PROFILES[profile_name]['instance_types']
+    if INSTANCE_TYPE and profile_name == PROVISION_PROFILE:
+        return [INSTANCE_TYPE] + [t for t in types if t != INSTANCE_TYPE]
+    return types
+
+
+def image_source(profile_name=PROVISION_PROFILE):
+    """
+    Pick the image and user data for new instances.
+
+    Returns (image_id, user_data, boot_path): the baked image with the short
+    user-data stub when BAKED_AMI_PARAMETER holds an image ID, otherwise the
+    stock AMI_ID with the full install script. The baked image is x86_64, so
+    arm64 profiles always boot AMI_ID_ARM64 with the full script.
+    """
+    if PROVISION_PROFILES[profile_name]['architecture'] == 'arm64':
+        if not AMI_ID_ARM64:
+            raise ValueError(f'Profile {profile_name} needs an arm64 image (AMI_ID_ARM64 unset)')
+        return AMI_ID_ARM64, USER_DATA, 'script'
+
+    global _baked_image
+    image_id, expires_at = _baked_image
+    if BAKED_AMI_PARAMETER and expires_at <= time.time():
+        image_id = None
+        try:
+            image_id = client('ssm').get_parameter(Name=BAKED_AMI_PARAMETER)['Parameter']['Value'].strip() or None
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ParameterNotFound':
+                print(f"Could not read baked image parameter, using stock AMI: {e}")
+        _baked_image = (image_id, time.time() + BAKED_AMI_CACHE_TTL)
+
+    if image_id:
+        return image_id, BAKED_USER_DATA, 'baked'
+    return AMI_ID, USER_DATA, 'script'
+
+
+def subnet_pool():
+    """
+    {subnet_id: {'az': ..., 'free': ...}} for SUBNET_IDS, with free addresses
+    re-read every SUBNET_CACHE_SECONDS. A single subnet is never described;
+    its AZ and free count are None.
+    """
+    global _subnets
+    with _placement_lock:
+        subnets, expires_at = _subnets
+        if expires_at > time.time():
+            return subnets
+        subnets = {subnet_id: {'az': None, 'free': None} for subnet_id in SUBNET_IDS}
+        if len(SUBNET_IDS) > 1:
+            try:
+                response = client('ec2').describe_subnets(SubnetIds=SUBNET_IDS)
+                for subnet in response['Subnets']:
+                    subnets[subnet['SubnetId']] = {
+                        'az': subnet['AvailabilityZone'],
+                        'free': subnet['AvailableIpAddressCount']
+                    }
+            except ClientError as e:
+                print(f"Could not describe subnets, placing in configured order: {e}")
+        _subnets = (subnets, time.time() + SUBNET_CACHE_SECONDS)
+        return subnets
+
+
+def placement_order(instance_type):
+    """SUBNET_IDS in the order to try for instance_type: healthy AZs first, then most free addresses."""
+    subnets = subnet_pool()
+    now = time.time()
+
+    def rank(subnet_id):
+        info = subnets[subnet_id]
+        failed_at = _capacity_failures.get((info['az'], instance_type), 0)
+        return (now - failed_at < CAPACITY_PENALTY_SECONDS, -(info['free'] or 0))
+
+    return sorted(subnets, key=rank)
+
+
+def launch_instances(count, tag_specifications, image=None, profile_name=PROVISION_PROFILE):
+    """
+    Launch up to `count` workshop instances with the given provisioning profile.
+
+    Each instance type of the profile is tried in every subnet of SUBNET_IDS
+    (see placement_order) before falling back to the next type. MinCount is 1
+    so EC2 launches as many as it can instead of failing the whole request
+    when capacity is short, and a launch never asks a subnet for more than
+    its free addresses; the rest go to the next subnet. A capacity error
+    moves on to a subnet in another AZ, an address error to the next subnet.
+    Callers must still check how many came back. The image comes from
+    image_source() unless an (image_id, user_data, boot_path) tuple is passed;
+    instances are tagged with the boot path, the profile and their placement.
+    """
+    profile = PROVISION_PROFILES[profile_name]
+    image_id, user_data, boot_path = image or image_source(profile_name)
+    launch_tags = [
+        {'Key': 'workshop-boot-path', 'Value': boot_path},
+        {'Key': 'workshop-profile', 'Value': profile_name}
+    ]
+    options = {}
+    if profile['cpu_credits']:
+        options['CreditSpecification'] = {'CpuCredits': profile['cpu_credits']}
+
+    instances = []
+    last_error = None
+    for instance_type in instance_types(profile_name):
+        failed_azs = set()
+        for subnet_id in placement_order(instance_type):
+            info = subnet_pool()[subnet_id]
+            # Capacity is per AZ; another subnet in the same AZ won't have any
+            if info['az'] is not None and info['az'] in failed_azs:
+                continue
+            if info['free'] == 0:
+                continue
+            wanted = count - len(instances)
+            if info['free'] is not None:
+                wanted = min(wanted, info['free'])
+
+            placement_tags = [{'Key': 'workshop-subnet', 'Value': subnet_id}]
+            if info['az']:
+                placement_tags.append({'Key': 'workshop-az', 'Value': info['az']})
+            try:
+                # A throttled attempt launches nothing, so it is safe to repeat
+                response = retry_throttled(
+                    client('ec2').run_instances,
+                    ImageId=image_id,
+                    InstanceType=instance_type,
+                    MinCount=1,
+                    MaxCount=wanted,
+                    SubnetId=subnet_id,
+                    SecurityGroupIds=[SECURITY_GROUP_ID],
+                    IamInstanceProfile={'Arn': INSTANCE_PROFILE_ARN},
+                    UserData=user_data,
+                    BlockDeviceMappings=[
+                        {
+                            'DeviceName': '/dev/xvda',
+                            'Ebs': {
+                                'VolumeSize': 30,
+                                'VolumeType': 'gp3',
+                                'DeleteOnTermination': True
+                            }
+                        }
+                    ],
+                    TagSpecifications=[
+                        dict(spec, Tags=spec['Tags'] + launch_tags + placement_tags)
+                        if spec['ResourceType'] == 'instance' else spec
+                        for spec in tag_specifications
+                    ],
+                    **options
+                )
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code in CAPACITY_ERRORS:
+                    print(f"No {instance_type} capacity in {subnet_id}, trying elsewhere: {e}")
+                    _record_capacity_failure(info['az'], instance_type)
+                    failed_azs.add(info['az'])
+                elif code in ADDRESS_ERRORS:
+                    print(f"No free addresses in {subnet_id}, trying the next subnet: {e}")
+                    info['free'] = 0
+                else:
+                    raise
+                metrics.count('CapacityFallbacks')
+                last_error = e
+                continue
+
+            launched = response['Instances']
+            instances.extend(launched)
+            if info['free'] is not None:
+                info['free'] = max(info['free'] - len(launched), 0)
+            if len(launched) < wanted and len(instances) < count:
+                # EC2 filled only part of the request: this AZ is short on capacity
+                _record_capacity_failure(info['az'], instance_type)
+                failed_azs.add(info['az'])
+            if len(instances) >= count:
+                return instances
+
+    if not instances:
+        if last_error:
+            raise last_error
+        raise ValueError(f"No free addresses left in subnets {', '.join(SUBNET_IDS)}")
+    return instances
+
+
+def _record_capacity_failure(availability_zone, instance_type):
+    with _placement_lock:
+        _capacity_failures[(availability_zone, instance_type)] = time.time()
+
+
+def instance_placement(instance):
+    """Where an instance landed, for provision responses."""
+    return {
+        'subnet_id': instance.get('SubnetId'),
+        'availability_zone': instance.get('Placement', {}).get('AvailabilityZone')
+    }
+
+
+def disk_dimensions(instance_id):
+    """Dimensions the CloudWatch agent publishes disk_used_percent under for the root volume."""
+    return [
+        {'Name': 'InstanceId', 'Value': instance_id},
+        {'Name': 'path', 'Value': '/'},
+        {'Name': 'device', 'Value': 'nvme0n1p1'},
+        {'Name': 'fstype', 'Value': 'xfs'}
+    ]
+
+
+def create_alarms(instance_id, safe_username):
+    """
+    Create the disk and CPU alarms for a user's instance. Returns the alarm names.
+
+    In fleet alarm mode nothing per-user is created; the cohort's fleet alarms
+    already cover the instance and their names are returned instead.
+    """
+    if ALARM_MODE == 'fleet':
+        return ensure_fleet_alarms()
+
+    alarm_name, cpu_alarm_name = user_alarm_names(safe_username)
+
+    # Create CloudWatch alarm for disk usage
+    client('cloudwatch').put_metric_alarm(
+        AlarmName=alarm_name,
+        AlarmDescription=f'Disk usage alert for workshop user {safe_username}',
+        ActionsEnabled=True,
+        AlarmActions=[SNS_TOPIC_ARN],
+        MetricName='disk_used_percent',
+        Namespace='Workshop',
+        Statistic=TELEMETRY['disk_statistic'],
+        Dimensions=disk_dimensions(instance_id),
+        Period=ALARM_PERIOD,
+        EvaluationPeriods=1,
+        DatapointsToAlarm=1,
+        Threshold=DISK_THRESHOLD,
+        ComparisonOperator='GreaterThanThreshold',
+        TreatMissingData='notBreaching'
+    )
+
+    # Create CloudWatch alarm for CPU usage
+    client('cloudwatch').put_metric_alarm(
+        AlarmName=cpu_alarm_name,
+        AlarmDescription=f'CPU usage alert for workshop user {safe_username}',
+        ActionsEnabled=True,
+        AlarmActions=[SNS_TOPIC_ARN],
+        MetricName='cpu_usage_active',
+        Namespace='Workshop',
+        Statistic='Average',
+        Dimensions=[
+            {'Name': 'InstanceId', 'Value': instance_id},
+            {'Name': 'cpu', 'Value': 'cpu-total'}
+        ],
+        Period=ALARM_PERIOD,
+        EvaluationPeriods=1,
+        DatapointsToAlarm=1,
+        Threshold=CPU_THRESHOLD,
+        ComparisonOperator='GreaterThanThreshold',
+        TreatMissingData='notBreaching'
+    )
+
+    return [alarm_name, cpu_alarm_name]
+
+
+def user_alarm_names(safe_username):
+    """The disk and CPU alarm names create_alarms uses for a user in per_user mode."""
+    return [f"workshop-{safe_username}-disk-high", f"workshop-{safe_username}-cpu-high"]
+
+
+def fleet_alarm_name(metric):
+    return f"workshop-fleet-{WORKSHOP_TAG}-{metric}-high"
+
+
+def ensure_fleet_alarms():
+    """
+    Put the cohort's Metrics Insights alarms, at most once per
+    FLEET_ALARM_REFRESH_SECONDS per container unless they are missing (e.g.
+    a cohort teardown deleted them). Returns their names.
+    """
+    global _fleet_alarms_put_at
+    names = [fleet_alarm_name(metric) for metric in FLEET_QUERIES]
+    with _fleet_lock:
+        if time.time() - _fleet_alarms_put_at <= FLEET_ALARM_REFRESH_SECONDS:
+            existing = client('cloudwatch').describe_alarms(AlarmNames=names, AlarmTypes=['MetricAlarm'])
+            if len(existing.get('MetricAlarms', [])) < len(names):
+                _fleet_alarms_put_at = 0
+        if time.time() - _fleet_alarms_put_at > FLEET_ALARM_REFRESH_SECONDS:
+            for metric, (query, threshold) in FLEET_QUERIES.items():
+                client('cloudwatch').put_metric_alarm(
+                    AlarmName=fleet_alarm_name(metric),
+                    AlarmDescription=(
+                        f'Fleet {metric} alert for {WORKSHOP_TAG}. '
+                        'Invoke the fleet_breaches action to find the instances and users.'
+                    ),
+                    ActionsEnabled=True,
+                    AlarmActions=[SNS_TOPIC_ARN],
+                    Metrics=[{
+                        'Id': metric,
+                        'Expression': query,
+                        'Period': FLEET_ALARM_PERIOD,
+                        'ReturnData': True
+                    }],
+                    EvaluationPeriods=1,
+                    DatapointsToAlarm=1,
+                    Threshold=threshold,
+                    ComparisonOperator='GreaterThanThreshold',
+                    TreatMissingData='notBreaching'
+                )
+            _fleet_alarms_put_at = time.time()
+    return names
@@ -0,0 +1,304 @@
+import os
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.clients import client
+from workshop_common.ssm_runner import has_time_for
+
+# Per-attendee action leases (hash key username; one instance per attendee).
+# Single-user scenario actions take the attendee's lease before touching the
+# instance, so fill_disk/reset_disk or corrupt_disk/fix_corrupt_disk never
+# race over the filler files, while different attendees run fully in
+# parallel. Callers queue with a ticket counter: next_ticket hands out
+# tickets, serving is the ticket whose turn it is, and holder is set while
+# that turn's action runs. Unset, actions are not serialized.
+LEASE_TABLE = os.environ.get('LEASE_TABLE')
+
+# How long a caller waits in the queue before returning "busy" with its
+# position. The wait also stops early enough to leave the action its
+# expected duration before the Lambda deadline (see acquire).
+LEASE_WAIT_SECONDS = float(os.environ.get('LEASE_WAIT_SECONDS', '30'))
+
+# A lease outlives its Lambda's deadline by this much, so a Lambda that dies
+# mid-action only blocks the attendee briefly
+LEASE_MARGIN_SECONDS = 30
+
+# A turn nobody claims (the waiter gave up or died) is skipped after this long
+TURN_GRACE_SECONDS = 10
+
+# Queue position polling
+FIRST_POLL_DELAY = 0.2
+POLL_BACKOFF = 1.5
+MAX_POLL_DELAY = 1.0
+
+# Expected action duration before any has been measured for an attendee
+DEFAULT_ACTION_SECONDS = 15
+
+# Lease items of attendees who stopped running actions expire (DynamoDB TTL)
+ITEM_TTL_SECONDS = 24 * 3600
+
+
+def acquire(username, action, context=None, resume_id=None, lease_seconds=120, reserve_seconds=0):
+    """
+    Take the attendee's lease, queueing behind earlier callers.
+
+    resume_id (a command_id the lease was handed over to) takes the lease
+    straight back when it still holds it. The lease runs until the Lambda
+    deadline (or lease_seconds without a context) plus LEASE_MARGIN_SECONDS.
+    Waiting stops once the Lambda's remaining time would no longer cover the
+    action: the attendee's measured average action time, or reserve_seconds
+    if that is longer. A queued caller then returns "busy" early rather than
+    start an action it can't finish.
+
+    Returns {"acquired": true, "holder": "...", "waited_seconds": 1.2, ...},
+    or {"acquired": false, "queue_position": 2, "expected_wait_seconds": 30,
+    "holder_action": "fill_disk"} when LEASE_WAIT_SECONDS ran out first.
+    """
+    lease = {'acquired': True, 'username': username, 'action': action, 'holder': None}
+    if not LEASE_TABLE:
+        return lease
+
+    key = {'username': {'S': username}}
+    started = time.monotonic()
+    if resume_id:
+        item = client('dynamodb').get_item(TableName=LEASE_TABLE, Key=key, ConsistentRead=True).get('Item', {})
+        if item.get('holder', {}).get('S') == resume_id:
+            extend(username, resume_id, lease_deadline(context, lease_seconds))
+            return claimed(lease, resume_id, item, started)
+
+    holder = uuid.uuid4().hex
+    ticket, item = take_ticket(key)
+    delay = FIRST_POLL_DELAY
+    # serving -> when this caller first saw that turn unclaimed
+    unclaimed_since = {}
+
+    while True:
+        now = time.time()
+        serving = int(item['serving']['N'])
+        if serving > ticket:
+            # Skipped while not polling (e.g. a long pause); queue again
+            ticket, item = take_ticket(key)
+            continue
+
+        if serving == ticket and 'holder' not in item:
+            try:
+                item = client('dynamodb').update_item(
+                    TableName=LEASE_TABLE,
+                    Key=key,
+                    UpdateExpression=(
+                        'SET holder = :holder, holder_action = :action, acquired_at = :now, lease_expires_at = :expires'
+                    ),
+                    ConditionExpression='serving = :ticket AND attribute_not_exists(holder)',
+                    ExpressionAttributeValues={
+                        ':holder': {'S': holder},
+                        ':action': {'S': action},
+                        ':now': {'N': str(now)},
+                        ':expires': {'N': str(lease_deadline(context, lease_seconds))},
+                        ':ticket': {'N': str(ticket)}
+                    },
+                    ReturnValues='ALL_NEW'
+                )['Attributes']
+                return claimed(lease, holder, item, started)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        elif serving < ticket:
+            if 'holder' not in item:
+                unclaimed_since.setdefault(serving, now)
+            if stale_turn(item, now, unclaimed_since):
+                skip_turn(key, serving, now)
+
+        reserve = max(average_seconds(item), reserve_seconds)
+        if not has_time_for(delay, started, context, LEASE_WAIT_SECONDS, reserve):
+            break
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, MAX_POLL_DELAY)
+        metrics.count('LeaseWaits')
+        item = client('dynamodb').get_item(TableName=LEASE_TABLE, Key=key, ConsistentRead=True)['Item']
+
+    # Give the turn up so nobody waits TURN_GRACE_SECONDS for it
+    client('dynamodb').update_item(
+        TableName=LEASE_TABLE,
+        Key=key,
+        UpdateExpression='ADD abandoned :ticket',
+        ExpressionAttributeValues={':ticket': {'NS': [str(ticket)]}}
+    )
+    metrics.add_phase('lease', (time.monotonic() - started) * 1000)
+    position = ticket - int(item['serving']['N'])
+    return {
+        **lease,
+        'acquired': False,
+        'queue_position': position,
+        'expected_wait_seconds': expected_wait(item, position),
+        'holder_action': item.get('holder_action', {}).get('S')
+    }
+
+
+def take_ticket(key):
+    """Join the attendee's queue. Returns (ticket, item)."""
+    item = client('dynamodb').update_item(
+        TableName=LEASE_TABLE,
+        Key=key,
+        UpdateExpression=(
+            'SET serving = if_not_exists(serving, :zero), expires_at = :expires ADD next_ticket :one'
+        ),
+        ExpressionAttributeValues={
+            ':zero': {'N': '0'},
+            ':one': {'N': '1'},
+            ':expires': {'N': str(int(time.time()) + ITEM_TTL_SECONDS)}
+        },
+        ReturnValues='ALL_NEW'
+    )['Attributes']
+    return int(item['next_ticket']['N']) - 1, item
+
+
+def stale_turn(item, now, unclaimed_since):
+    """
+    True if the current turn's holder died, or its waiter gave up or has left
+    it unclaimed for TURN_GRACE_SECONDS (timed by this caller, so a turn
+    that only just started is never skipped).
+    """
+    if 'holder' in item:
+        return float(item.get('lease_expires_at', {}).get('N', 'inf')) < now
+    serving = int(item['serving']['N'])
+    abandoned = {int(t) for t in item.get('abandoned', {}).get('NS', [])}
+    return serving in abandoned or unclaimed_since[serving] < now - TURN_GRACE_SECONDS
+
+
+def skip_turn(key, serving, now):
+    """Move the queue past a stale turn. Losing the race to another waiter is fine."""
+    try:
+        client('dynamodb').update_item(
+            TableName=LEASE_TABLE,
+            Key=key,
+            UpdateExpression=(
+                'SET serving = :next '
+                'REMOVE holder, holder_action, acquired_at, lease_expires_at DELETE abandoned :serving_set'
+            ),
+            ConditionExpression=(
+                'serving = :serving AND (attribute_not_exists(holder) OR lease_expires_at < :now)'
+            ),
+            ExpressionAttributeValues={
+                ':next': {'N': str(serving + 1)},
+                ':serving': {'N': str(serving)},
+                ':serving_set': {'NS': [str(serving)]},
+                ':now': {'N': str(now)}
+            }
+        )
+        print(f"Skipped stale turn {serving} for {key['username']['S']}")
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def claimed(lease, holder, item, started):
+    """The acquired lease, with what release() needs to update the average action time."""
+    waited = time.monotonic() - started
+    metrics.add_phase('lease', waited * 1000)
+    return {
+        **lease,
+        'holder': holder,
+        'acquired_at': float(item['acquired_at']['N']),
+        'average_seconds': float(item['average_seconds']['N']) if 'average_seconds' in item else None,
+        'waited_seconds': round(waited, 1)
+    }
+
+
+def lease_deadline(context, lease_seconds):
+    if context is not None:
+        lease_seconds = context.get_remaining_time_in_millis() / 1000
+    return time.time() + lease_seconds + LEASE_MARGIN_SECONDS
+
+
+def extend(username, holder, expires_at, new_holder=None):
+    client('dynamodb').update_item(
+        TableName=LEASE_TABLE,
+        Key={'username': {'S': username}},
+        UpdateExpression='SET holder = :new_holder, lease_expires_at = :expires',
+        ConditionExpression='holder = :holder',
+        ExpressionAttributeValues={
+            ':holder': {'S': holder},
+            ':new_holder': {'S': new_holder or holder},
+            ':expires': {'N': str(expires_at)}
+        }
+    )
+
+
+def hand_over(lease, command_id, timeout_seconds):
+    """
+    Keep the lease past this call for a command still running on the
+    instance: the command ID holds it until the command's own timeout, and a
+    resume with that command_id (or the completion handler) releases it.
+    """
+    if not LEASE_TABLE or not lease.get('holder'):
+        return
+    try:
+        extend(lease['username'], lease['holder'], time.time() + timeout_seconds + LEASE_MARGIN_SECONDS, command_id)
+        lease['holder'] = command_id
+        lease['handed_over'] = True
+    except ClientError as e:
+        print(f"Could not hand lease for {lease['username']} over to command {command_id}: {e}")
+
+
+def release(lease):
+    """Release a lease taken by acquire(), unless it was handed over to a command."""
+    if not LEASE_TABLE or not lease.get('holder') or lease.get('handed_over'):
+        return
+    held = time.time() - lease['acquired_at']
+    average = lease.get('average_seconds')
+    release_holder(lease['username'], lease['holder'], held if average is None else 0.7 * average + 0.3 * held)
+
+
+def release_holder(username, holder, average_seconds=None):
+    """End the turn of `holder`, if it still holds the attendee's lease, letting the next caller in."""
+    if not LEASE_TABLE:
+        return
+    values = {':holder': {'S': holder}, ':one': {'N': '1'}}
+    update = 'SET serving = serving + :one'
+    if average_seconds is not None:
+        update += ', average_seconds = :average'
+        values[':average'] = {'N': str(round(average_seconds, 1))}
+    try:
+        client('dynamodb').update_item(
+            TableName=LEASE_TABLE,
+            Key={'username': {'S': username}},
+            UpdateExpression=update + ' REMOVE holder, holder_action, acquired_at, lease_expires_at',
+            ConditionExpression='holder = :holder',
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        # Expired and taken over by the next caller; nothing to release
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(f"Could not release lease for {username}: {e}")
+
+
+def average_seconds(item):
+    """The attendee's measured average action time, or DEFAULT_ACTION_SECONDS before one was measured."""
+    return float(item['average_seconds']['N']) if 'average_seconds' in item else DEFAULT_ACTION_SECONDS
+
+
+def expected_wait(item, position):
+    """Seconds until a caller `position` turns back would get the lease, from the measured average."""
+    average = average_seconds(item)
+    current = 0
+    if 'acquired_at' in item:
+        current = max(average - (time.time() - float(item['acquired_at']['N'])), 0)
+    return round(current + max(position - 1, 0) * average)
+
+
+def busy_response(lease):
+    """Handler response for a caller that did not get the attendee's lease in time."""
+    return {
+        'success': False,
+        'busy': True,
+        'username': lease['username'],
+        'queue_position': lease['queue_position'],
+        'expected_wait_seconds': lease['expected_wait_seconds'],
+        'error': (
+            f"Another action ({lease['holder_action'] or 'queued'}) is running for {lease['username']}; "
+            f"queue position {lease['queue_position']}, about {lease['expected_wait_seconds']} s. Call again."
+        )
+    }
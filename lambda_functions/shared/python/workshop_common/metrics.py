@@ -0,0 +1,252 @@
+import functools
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# One CloudWatch Embedded Metric Format (EMF) record is printed per handler
+# invocation. Lambda ships stdout to CloudWatch Logs, which extracts the
+# metrics from the record, so there is no metrics pipeline and no extra API
+# call. The full record (per-operation API calls, outcome, username) also
+# stays queryable with Logs Insights.
+NAMESPACE = 'Workshop'
+DIMENSIONS = [['Action', 'Cohort']]
+WORKSHOP_TAG = 'devops-workshop'
+
+# EMF accepts at most 100 values per metric in one record
+MAX_VALUES = 100
+
+# The invocation being recorded, per thread (see bound() for worker threads)
+_local = threading.local()
+
+
+class Invocation:
+    """Everything measured during one handler invocation."""
+
+    def __init__(self, action, cohort, properties):
+        self.action = action
+        self.cohort = cohort
+        self.properties = properties
+        self.phases = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.api_calls = defaultdict(lambda: {'count': 0, 'ms': 0.0, 'retries': 0, 'errors': 0})
+        self.api_latencies = []
+        self.lock = threading.Lock()
+
+    def add_phase(self, name, ms):
+        with self.lock:
+            self.phases[name] += ms
+
+    def add_count(self, name, value):
+        with self.lock:
+            self.counts[name] += value
+
+    def add_api_call(self, operation, ms, retries=0, error=False):
+        with self.lock:
+            call = self.api_calls[operation]
+            call['count'] += 1
+            call['ms'] += ms
+            call['retries'] += retries
+            call['errors'] += int(error)
+            self.api_latencies.append(round(ms, 1))
+
+
+def current():
+    """The invocation being recorded on this thread, or None."""
+    return getattr(_local, 'invocation', None)
+
+
+@contextmanager
+def phase(name):
+    """Time a block and add it to the current invocation as <Name>Ms."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        invocation = current()
+        if invocation is not None:
+            invocation.add_phase(name, (time.monotonic() - started) * 1000)
+
+
+def add_phase(name, ms):
+    """Add an already-measured duration to the current invocation."""
+    invocation = current()
+    if invocation is not None:
+        invocation.add_phase(name, ms)
+
+
+def count(name, value=1):
+    """Add to a counter metric (e.g. PollIterations) on the current invocation."""
+    invocation = current()
+    if invocation is not None:
+        invocation.add_count(name, value)
+
+
+def annotate(name, value):
+    """Add a property (e.g. IncidentId) to the current invocation's record."""
+    invocation = current()
+    if invocation is not None:
+        invocation.properties[name] = value
+
+
+def bound(fn):
+    """Wrap fn so it records into this thread's invocation when run on a worker thread."""
+    invocation = current()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = current()
+        _local.invocation = invocation
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.invocation = previous
+
+    return wrapper
+
+
+def invoke(action, event, call):
+    """
+    Run call() as one recorded invocation of `action` and print its EMF record.
+
+    Nested invocations (a handler reached through the dispatcher, say) are
+    recorded by the outermost one only.
+    """
+    if current() is not None:
+        return call()
+
+    if isinstance(event, str):
+        try:
+            event = json.loads(event)
+        except ValueError:
+            event = {}
+    if not isinstance(event, dict):
+        event = {}
+
+    invocation = Invocation(action, str(event.get('workshop') or WORKSHOP_TAG), {
+        'Mode': event.get('mode') or ('bulk' if event.get('usernames') is not None or event.get('all') else 'single'),
+        'Username': event.get('username'),
+        'IncidentId': event.get('incident_id')
+    })
+    _local.invocation = invocation
+    started = time.monotonic()
+    response = None
+    try:
+        response = call()
+        return response
+    finally:
+        invocation.add_phase('total', (time.monotonic() - started) * 1000)
+        _local.invocation = None
+        try:
+            print(json.dumps(emf_record(invocation, response)))
+        except Exception as e:
+            # Never fail an invocation over its telemetry
+            print(f"Could not emit metrics: {e}")
+
+
+def instrumented(action):
+    """Decorator recording a lambda_handler(event, context) as `action`."""
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            return invoke(action, event, lambda: handler(event, context))
+
+        return wrapper
+
+    return decorator
+
+
+def outcome(response):
+    if not isinstance(response, dict):
+        return 'exception'
+    if response.get('in_progress'):
+        return 'in_progress'
+    return 'success' if response.get('success') else 'failure'
+
+
+def emf_record(invocation, response):
+    """Build the EMF log record for a finished invocation."""
+    result = outcome(response)
+    values = {
+        f"{name.title().replace('_', '')}Ms": round(ms, 1)
+        for name, ms in invocation.phases.items()
+    }
+    values.update(invocation.counts)
+    values.update({
+        'Invocations': 1,
+        'Failures': int(result in ('failure', 'exception')),
+        'ApiCalls': sum(c['count'] for c in invocation.api_calls.values()),
+        'ApiRetries': sum(c['retries'] for c in invocation.api_calls.values()),
+        'ApiErrors': sum(c['errors'] for c in invocation.api_calls.values())
+    })
+    if invocation.api_latencies:
+        values['ApiCallMs'] = invocation.api_latencies[:MAX_VALUES]
+
+    return {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': DIMENSIONS,
+                'Metrics': [
+                    {'Name': name, 'Unit': metric_unit(name)}
+                    for name in sorted(values)
+                ]
+            }]
+        },
+        'Action': invocation.action,
+        'Cohort': invocation.cohort,
+        **values,
+        'Outcome': result,
+        **{k: v for k, v in invocation.properties.items() if v is not None},
+        'ApiCallsByOperation': {
+            operation: {**call, 'ms': round(call['ms'], 1)}
+            for operation, call in sorted(invocation.api_calls.items())
+        }
+    }
+
+
+def metric_unit(name):
+    return 'Milliseconds' if name.endswith('Ms') else 'Count'
+
+
+def instrument_client(aws_client):
+    """Record every API call made through a boto3 client via botocore's event hooks."""
+    events = getattr(getattr(aws_client, 'meta', None), 'events', None)
+    if events is None:
+        # Not a botocore client (e.g. the load simulator's fakes)
+        return
+    # First, so the start time is set even when another before-call handler answers the call
+    events.register_first('before-call', _before_call)
+    events.register('after-call', _after_call)
+    events.register('after-call-error', _after_call_error)
+
+
+def _before_call(model, context, **kwargs):
+    # after-call-error is not passed the operation model, so keep it with the request
+    context['workshop_model'] = model
+    context['workshop_started'] = time.monotonic()
+
+
+def _after_call(model, http_response, parsed, context, **kwargs):
+    _record_call(
+        model, context,
+        retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+        error=http_response is not None and http_response.status_code >= 300
+    )
+
+
+def _after_call_error(context, **kwargs):
+    # Raised before a response was parsed (connection errors, retries exhausted)
+    _record_call(context.get('workshop_model'), context, error=True)
+
+
+def _record_call(model, context, retries=0, error=False):
+    invocation = current()
+    started = context.get('workshop_started')
+    if invocation is None or started is None or model is None:
+        return
+    operation = f"{model.service_model.service_name}.{model.name}"
+    invocation.add_api_call(operation, (time.monotonic() - started) * 1000, retries, error)
@@ -0,0 +1,234 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+from workshop_common.clients import client
+from workshop_common.launch import TELEMETRY, disk_dimensions
+from workshop_common.ssm_runner import has_time_for, run_command
+
+# Stages an instance goes through before scenarios work on it, in order. A
+# stage is only checked once the one before it is ready.
+STAGES = ['ec2_running', 'ssm_online', 'user_data_done', 'first_datapoint']
+
+# Default bound on one readiness call; call again to keep waiting
+READY_MAX_WAIT_SECONDS = 120
+
+# Between checks of a stage that is not ready yet
+FIRST_CHECK_DELAY = 2
+CHECK_BACKOFF = 1.5
+MAX_CHECK_DELAY = 10
+
+# Blocks on the instance until cloud-init (user data) has finished or the
+# {seconds} budget runs out, then prints its status ("status: done",
+# "status: running" or "status: error")
+USER_DATA_COMMAND = 'timeout {seconds} cloud-init status --wait > /dev/null; cloud-init status'
+
+# High-resolution datapoints (the agent's collection interval is under 60 s)
+# are only kept this long; older instances are looked up by the minute
+HIGH_RESOLUTION_RETENTION = timedelta(hours=3)
+
+# Boot-to-first-metric is published for an instance whose first datapoint is
+# at most this old, once per container, so a readiness call long after boot
+# doesn't count it again
+BOOT_METRIC_MAX_AGE = timedelta(minutes=15)
+_boot_metric_recorded = set()
+
+
+def check_readiness(instance_id, context=None, max_wait_seconds=READY_MAX_WAIT_SECONDS):
+    """
+    Wait until the instance is ready for scenarios, or out of time.
+
+    Checks, in order: EC2 state running, the SSM agent online
+    (describe_instance_information), user data finished (cloud-init status
+    over SSM) and a first disk_used_percent datapoint in CloudWatch. Returns
+    as soon as all four pass.
+
+    Returns: {
+        "ready": false,
+        "lagging": "user_data_done",  # first stage not ready, null when ready
+        "stages": {
+            "ec2_running": {"status": "ready", "seconds_after_launch": 14.0},
+            "ssm_online": {"status": "ready", "seconds_after_launch": 41.2},
+            "user_data_done": {"status": "waiting", "detail": "status: running"},
+            "first_datapoint": {"status": "not_checked"}
+        },
+        "waited_seconds": 60.3
+    }
+    A stage's status is "ready", "waiting", "failed" (the instance stopped,
+    or cloud-init reported an error) or "not_checked".
+    """
+    started = time.monotonic()
+    stages = {name: {'status': 'not_checked'} for name in STAGES}
+    instance = {}
+    delay = FIRST_CHECK_DELAY
+
+    while True:
+        advance(instance_id, stages, instance, started, context, max_wait_seconds)
+        lagging = next((name for name in STAGES if stages[name]['status'] != 'ready'), None)
+        if lagging is None or stages[lagging]['status'] == 'failed':
+            break
+        if not has_time_for(delay, started, context, max_wait_seconds):
+            break
+        metrics.count('PollIterations')
+        time.sleep(delay)
+        delay = min(delay * CHECK_BACKOFF, MAX_CHECK_DELAY)
+
+    metrics.add_phase('ready', (time.monotonic() - started) * 1000)
+    if stages['first_datapoint']['status'] == 'ready':
+        record_boot_to_first_metric(instance_id, instance, stages['first_datapoint'])
+    return {
+        'ready': lagging is None,
+        'lagging': lagging,
+        'stages': stages,
+        'waited_seconds': round(time.monotonic() - started, 1)
+    }
+
+
+def advance(instance_id, stages, instance, started, context, max_wait_seconds):
+    """
+    Check the stages in order, stopping at the first one not ready. Fills
+    `instance` with its launch time, boot path and first datapoint time.
+    """
+    for name in STAGES:
+        if stages[name]['status'] == 'ready':
+            continue
+        launched_at = instance.get('launched_at')
+
+        if name == 'ec2_running':
+            state, launched_at, instance['boot_path'] = instance_state(instance_id)
+            instance['launched_at'] = launched_at
+            if state == 'running':
+                stages[name] = ready_at(launched_at, datetime.now(timezone.utc))
+            elif state == 'pending':
+                stages[name] = {'status': 'waiting', 'detail': state}
+            else:
+                stages[name] = {'status': 'failed', 'detail': f'Instance is {state or "missing"}'}
+
+        elif name == 'ssm_online':
+            ping = ssm_ping(instance_id)
+            if ping == 'Online':
+                stages[name] = ready_at(launched_at, datetime.now(timezone.utc))
+            else:
+                stages[name] = {'status': 'waiting', 'detail': ping or 'not registered'}
+
+        elif name == 'user_data_done':
+            stages[name] = user_data_stage(instance_id, launched_at, started, context, max_wait_seconds)
+
+        elif name == 'first_datapoint':
+            first = first_datapoint(instance_id, launched_at)
+            if first:
+                instance['first_datapoint_at'] = first
+                stages[name] = ready_at(launched_at, first)
+            else:
+                stages[name] = {'status': 'waiting', 'detail': 'no disk_used_percent datapoint yet'}
+
+        if stages[name]['status'] != 'ready':
+            break
+
+
+def ready_at(launched_at, at):
+    stage = {'status': 'ready'}
+    if launched_at:
+        stage['seconds_after_launch'] = round(max((at - launched_at).total_seconds(), 0), 1)
+    return stage
+
+
+def instance_state(instance_id):
+    """(state name, launch time, workshop-boot-path tag) of the instance, or Nones if it is gone."""
+    response = client('ec2').describe_instances(InstanceIds=[instance_id])
+    for reservation in response['Reservations']:
+        for instance in reservation['Instances']:
+            tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+            return instance['State']['Name'], instance.get('LaunchTime'), tags.get('workshop-boot-path')
+    return None, None, None
+
+
+def ssm_ping(instance_id):
+    """The SSM agent's PingStatus ("Online", "ConnectionLost", ...), or None before it registers."""
+    response = client('ssm').describe_instance_information(
+        Filters=[{'Key': 'InstanceIds', 'Values': [instance_id]}]
+    )
+    for info in response['InstanceInformationList']:
+        return info.get('PingStatus')
+    return None
+
+
+def user_data_stage(instance_id, launched_at, started, context, max_wait_seconds):
+    """Wait on cloud-init over SSM, for at most the rest of this call's budget."""
+    remaining = max_wait_seconds - (time.monotonic() - started) if max_wait_seconds is not None else 60
+    if context is not None:
+        remaining = min(remaining, context.get_remaining_time_in_millis() / 1000 - 10)
+    seconds = max(int(remaining) - 5, 1)
+    result = run_command(
+        client('ssm'), instance_id, USER_DATA_COMMAND.format(seconds=seconds), context,
+        timeout_seconds=seconds + 30, max_wait_seconds=seconds + 5
+    )
+    output = result['stdout'].strip()
+    if 'status: done' in output:
+        return ready_at(launched_at, datetime.now(timezone.utc))
+    if 'status: error' in output:
+        return {'status': 'failed', 'detail': output}
+    return {'status': 'waiting', 'detail': output or f"cloud-init check {result['status']}"}
+
+
+def first_datapoint(instance_id, launched_at):
+    """
+    Timestamp of the first disk_used_percent datapoint since launch, or None.
+    Read at the agent's collection interval while high-resolution data is
+    still kept, so it is accurate to the interval rather than the minute.
+    """
+    end = datetime.now(timezone.utc)
+    # Whole minutes, so the minute the instance launched in is included
+    start = (launched_at or end).replace(second=0, microsecond=0)
+    period = 60
+    if TELEMETRY['collection_interval'] < 60 and end - start < HIGH_RESOLUTION_RETENTION:
+        period = TELEMETRY['collection_interval']
+    result = client('cloudwatch').get_metric_data(
+        MetricDataQueries=[{
+            'Id': 'disk',
+            'MetricStat': {
+                'Metric': {
+                    'Namespace': 'Workshop',
+                    'MetricName': 'disk_used_percent',
+                    'Dimensions': disk_dimensions(instance_id)
+                },
+                'Period': period,
+                'Stat': 'Maximum'
+            }
+        }],
+        StartTime=start,
+        EndTime=end,
+        ScanBy='TimestampAscending'
+    )['MetricDataResults'][0]
+    return result['Timestamps'][0] if result['Timestamps'] else None
+
+
+def record_boot_to_first_metric(instance_id, instance, stage):
+    """
+    Publish Workshop/boot_to_first_metric_seconds (launch until the first
+    disk_used_percent datapoint CloudWatch received) with a BootPath
+    dimension. Only for datapoints under BOOT_METRIC_MAX_AGE old, and once
+    per instance per container. Best effort.
+    """
+    first = instance.get('first_datapoint_at')
+    if (
+        'seconds_after_launch' not in stage or not instance.get('boot_path') or first is None
+        or instance_id in _boot_metric_recorded
+        or datetime.now(timezone.utc) - first > BOOT_METRIC_MAX_AGE
+    ):
+        return
+    try:
+        client('cloudwatch').put_metric_data(
+            Namespace='Workshop',
+            MetricData=[{
+                'MetricName': 'boot_to_first_metric_seconds',
+                'Dimensions': [{'Name': 'BootPath', 'Value': instance['boot_path']}],
+                'Value': stage['seconds_after_launch'],
+                'Unit': 'Seconds'
+            }]
+        )
+        _boot_metric_recorded.add(instance_id)
+    except ClientError as e:
+        print(f"Could not publish boot_to_first_metric_seconds for {instance_id}: {e}")
@@ -0,0 +1,413 @@
+import json
+import os
+import re
+from botocore.exceptions import ClientError
+
+from workshop_common import incidents, leases, metrics
+from workshop_common.chaos_runner import CHAOS_AGENT_ENABLED, is_agent_command, run_agent_command
+from workshop_common.clients import client
+from workshop_common.commands import (
+    CORRUPT_DISK_COMMAND, FILL_DISK_COMMAND, FIX_CORRUPT_DISK_COMMAND, KILL_COMMAND, RESET_DISK_COMMAND,
+    SPIKE_CPU_COMMAND
+)
+from workshop_common.fanout import run_bulk
+from workshop_common.instance_index import run_on_user_instance
+from workshop_common.ssm_runner import COMMAND_TOPIC_ARN, run_command, send_command, still_running_response
+from workshop_common.telemetry import publishing_disk_status
+
+# Comment on commands sent with "wait": false. The completion handler reads it
+# back from get_command_invocation to know which scenario finished, for whom,
+# and for which incident and cohort.
+ASYNC_COMMENT_PREFIX = 'workshop-async'
+
+# SSM keeps at most this many characters of a command's comment
+MAX_COMMENT_CHARS = 100
+
+
+def command_failed(result, instance_id, username):
+    """Response for a command that did not finish with Success."""
+    return {
+        'success': False,
+        'instance_id': instance_id,
+        'username': username,
+        'command_id': result['command_id'],
+        'timings': result['timings'],
+        'error': f"Command {result['status']}: {result['stderr'] or result['stdout']}"
+    }
+
+
+def succeeded(message, include_disk_status=True):
+    """Build an interpret() that reports `message` on Success and the error otherwise."""
+
+    def interpret(result, instance_id, username):
+        if result['status'] != 'Success':
+            return command_failed(result, instance_id, username)
+        response = {
+            'success': True,
+            'instance_id': instance_id,
+            'username': username,
+            'command_id': result['command_id'],
+            'timings': result['timings'],
+            'message': message
+        }
+        if include_disk_status:
+            response['disk_status'] = result['stdout']
+        return response
+
+    return interpret
+
+
+KILL_SAMPLE = re.compile(r'^cpu_busy_percent=(\d+)\s*^stress_ng_running=(\d+)', re.MULTILINE)
+
+# CPU busy percentage under which the kill counts as recovered
+CPU_RECOVERED_PERCENT = int(os.environ.get('CPU_RECOVERED_PERCENT', '50'))
+
+
+def interpret_reset_disk(result, instance_id, username):
+    """reset_disk result, escalating when the filler file is immutable."""
+    output = result['stdout']
+    error_output = result['stderr']
+
+    # Check if output contains permission error (immutable file), whether or not the command failed
+    combined_output = output + (error_output or '')
+    if 'Operation not permitted' in combined_output or 'cannot remove' in combined_output:
+        return {
+            'success': False,
+            'instance_id': instance_id,
+            'username': username,
+            'error': 'Cannot delete immutable file - Operation not permitted',
+            'requires_escalation': True,
+            'disk_status': output,
+            'command_id': result['command_id'],
+            'timings': result['timings'],
+            'suggested_action': "Manual intervention required: run 'sudo chattr -i /var/tmp/filler_corrupt.dat' then delete the file"
+        }
+
+    if result['status'] == 'Success':
+        return {
+            'success': True,
+            'instance_id': instance_id,
+            'username': username,
+            'disk_status': output,
+            'command_id': result['command_id'],
+            'timings': result['timings'],
+            'message': 'Disk reset successfully'
+        }
+
+    return command_failed(result, instance_id, username)
+
+
+def parse_kill_sample(stdout):
+    """(cpu_busy_percent, stress-ng processes left) from KILL_COMMAND output, or (None, None)."""
+    match = KILL_SAMPLE.search(stdout or '')
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+
+def interpret_kill(result, instance_id, username):
+    """
+    kill_and_restart result for the kill step. "recovered" says whether the
+    on-instance sample after the kill shows the load gone; the handler
+    escalates to a reboot when it is false.
+    """
+    if result['status'] != 'Success':
+        print(f"Kill command failed on {instance_id}: {result['stderr']}")
+    busy, survivors = parse_kill_sample(result['stdout']) if result['status'] == 'Success' else (None, None)
+    return {
+        'success': True,
+        'instance_id': instance_id,
+        'username': username,
+        'actions': ['killed stress-ng'] if result['status'] == 'Success' else [],
+        'cpu_busy_percent': busy,
+        'recovered': busy is not None and busy < CPU_RECOVERED_PERCENT and survivors == 0,
+        'timings': result['timings']
+    }
+
+
+# Scenario registry: the SSM command each action runs, its poll budget, and
+# interpret(result, instance_id, username) turning a command result into the
+# action's response. timeout_seconds is the SSM execution timeout;
+# max_wait_seconds (None = until the Lambda deadline) bounds polling. The disk
+# scenarios publish the usage they report straight to the disk alarm's metric
+# in low_latency telemetry mode.
+SCENARIOS = {
+    'fill_disk': {
+        'command': FILL_DISK_COMMAND,
+        'timeout_seconds': 60,
+        'max_wait_seconds': None,
+        'interpret': publishing_disk_status(succeeded('Disk filled successfully'))
+    },
+    'reset_disk': {
+        'command': RESET_DISK_COMMAND,
+        'timeout_seconds': 60,
+        'max_wait_seconds': None,
+        'interpret': publishing_disk_status(interpret_reset_disk)
+    },
+    'corrupt_disk': {
+        'command': CORRUPT_DISK_COMMAND,
+        'timeout_seconds': 60,
+        'max_wait_seconds': None,
+        'interpret': publishing_disk_status(succeeded(
+            'Disk corrupted with immutable file. Automated reset will fail - requires manual intervention.'
+        ))
+    },
+    'fix_corrupt_disk': {
+        'command': FIX_CORRUPT_DISK_COMMAND,
+        'timeout_seconds': 60,
+        'max_wait_seconds': None,
+        'interpret': publishing_disk_status(succeeded(
+            'Corrupt disk fixed. Immutable flag removed and files deleted.'
+        ))
+    },
+    'spike_cpu': {
+        'command': SPIKE_CPU_COMMAND,
+        'timeout_seconds': 60,
+        # The command backgrounds stress-ng and returns at once
+        'max_wait_seconds': 30,
+        'interpret': succeeded('CPU stress started - running for 30 minutes', include_disk_status=False)
+    },
+    'kill_and_restart': {
+        'command': KILL_COMMAND,
+        # Bound the wait so there is always time left to reboot. The command
+        # itself takes about five seconds (settle and sample)
+        'timeout_seconds': 30,
+        'max_wait_seconds': 30,
+        'interpret': interpret_kill
+    }
+}
+
+
+def run_scenario(name, event, context):
+    """
+    Run a registered scenario for one user or in bulk.
+
+    Input: {"username": "user123"}
+    Optional: "instance_id": "i-xxx" skips the username -> instance lookup
+    Resume: {"username": "user123", "command_id": "..."} keeps waiting on a command
+            that was still running when a previous call ran out of time
+    Event-driven: {"username": "user123", "wait": false} returns as soon as the
+            command is sent; the interpret() response is posted to the n8n
+            callback when it finishes (see dispatch_scenario)
+    Bulk: {"usernames": ["user1", "user2"]} or {"all": true}, plus optional
+          "max_concurrency", "max_errors" and "command_ids" (to resume);
+          returns {"results": {username: output}, "summary": {...}}
+    Incidents: "incident_id" correlates an injection (fill_disk, corrupt_disk,
+            spike_cpu; generated when not given) with the alarm it trips and
+            the remediation that clears it (reset_disk, fix_corrupt_disk,
+            kill_and_restart; defaulting to the user's open incident). It is
+            stamped into the SSM command comment and, with INCIDENT_TABLE set,
+            recorded on the incident timeline (see incidents.py)
+    Leases: with LEASE_TABLE set, single-user calls for the same attendee run
+            one at a time (different attendees stay parallel). A call that
+            waits LEASE_WAIT_SECONDS without its turn returns
+            {"success": false, "busy": true, "queue_position": 2,
+             "expected_wait_seconds": 30, ...}; see leases.py
+    Output: the scenario's interpret() response, plus "via": "agent" or "ssm"
+            (see run_scenario_command) and "incident_id"
+    """
+    return metrics.invoke(name, event, lambda: _run_scenario(name, event, context))
+
+
+def _run_scenario(name, event, context):
+    scenario = SCENARIOS[name]
+    try:
+        # Parse input
+        if isinstance(event, str):
+            event = json.loads(event)
+
+        incident_id = incidents.incident_id_for(name, event)
+        started_at = incidents.now()
+
+        # Bulk mode: one tag-targeted SSM command for many users
+        if event.get('usernames') is not None or event.get('all'):
+            response = run_bulk(
+                client('ec2'), client('ssm'), event, scenario['command'], scenario['interpret'], context,
+                timeout_seconds=scenario['timeout_seconds'],
+                max_wait_seconds=scenario['max_wait_seconds'],
+                comment=incidents.command_comment(incident_id)
+            )
+            incidents.track(
+                name, incident_id, response.get('results', {}).values(), incidents.cohort_of(event), started_at
+            )
+            return response
+
+        username = event.get('username')
+        if not username:
+            return {
+                'success': False,
+                'error': 'Missing required field: username'
+            }
+
+        # Sanitize username
+        safe_username = ''.join(c for c in username if c.isalnum() or c in '-_').lower()
+
+        if not event.get('wait', True):
+            return dispatch_scenario(
+                name, safe_username, instance_id=event.get('instance_id'), incident_id=incident_id, context=context,
+                cohort=incidents.cohort_of(event)
+            )
+
+        # One action at a time per attendee (see leases.py)
+        lease = leases.acquire(safe_username, name, context, resume_id=event.get('command_id'))
+        if not lease['acquired']:
+            return leases.busy_response(lease)
+        try:
+            # Find running instance for this user and run the command on it
+            instance_id, result = run_on_user_instance(
+                client('ec2'), safe_username,
+                lambda iid: run_scenario_command(
+                    name, iid, context, command_id=event.get('command_id'),
+                    comment=incidents.command_comment(incident_id)
+                ),
+                instance_id=event.get('instance_id')
+            )
+
+            if not instance_id:
+                return {
+                    'success': False,
+                    'error': f'No running instance found for user: {safe_username}'
+                }
+
+            if result['resumable']:
+                # The command keeps the lease until it finishes or is resumed
+                leases.hand_over(lease, result['command_id'], scenario['timeout_seconds'])
+                response = still_running_response(result, instance_id, safe_username)
+                if incident_id:
+                    response['incident_id'] = incident_id
+                return response
+
+            response = {**scenario['interpret'](result, instance_id, safe_username), 'via': result.get('via', 'ssm')}
+            incidents.track(name, incident_id, [response], incidents.cohort_of(event), started_at)
+            return response
+        finally:
+            leases.release(lease)
+
+    except ClientError as e:
+        print(f"AWS Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+
+def run_scenario_command(name, instance_id, context=None, command_id=None, comment=None):
+    """
+    Run (or resume) a scenario's command on one instance with its poll budget.
+
+    With the chaos agent enabled the command goes to the instance's agent
+    when it is healthy ("via": "agent" in the result), and to SSM otherwise.
+    """
+    scenario = SCENARIOS[name]
+    if CHAOS_AGENT_ENABLED and (command_id is None or is_agent_command(command_id)):
+        result = run_agent_command(
+            instance_id, name, context,
+            timeout_seconds=scenario['timeout_seconds'],
+            max_wait_seconds=scenario['max_wait_seconds'],
+            command_id=command_id
+        )
+        if result is not None:
+            return result
+        metrics.count('AgentFallbacks')
+    return run_command(
+        client('ssm'), instance_id, scenario['command'], context,
+        timeout_seconds=scenario['timeout_seconds'],
+        max_wait_seconds=scenario['max_wait_seconds'],
+        command_id=command_id,
+        comment=comment
+    )
+
+
+def dispatch_scenario(name, safe_username, instance_id=None, incident_id=None, context=None, cohort=None):
+    """
+    Send a scenario's command with completion notifications and return at once.
+
+    SSM publishes the final status to COMMAND_TOPIC_ARN; the command_complete
+    handler then applies the scenario's interpret() and posts the response to
+    the n8n callback, so no Lambda sits polling while the command runs. The
+    attendee's lease passes to the command and command_complete releases it.
+
+    Output: {
+        "success": true,
+        "status": "dispatched",
+        "instance_id": "i-xxx",
+        "username": "user123",
+        "command_id": "..."
+    }
+    """
+    if not COMMAND_TOPIC_ARN:
+        return {
+            'success': False,
+            'error': 'Event-driven mode is not configured (COMMAND_TOPIC_ARN unset)'
+        }
+
+    # command_complete reads the cohort back from the comment, so it must not be cut off
+    comment = async_comment(name, safe_username, incident_id, cohort)
+    if len(comment) > MAX_COMMENT_CHARS:
+        return {
+            'success': False,
+            'error': f'Username or workshop too long for an event-driven command comment: {comment}'
+        }
+
+    scenario = SCENARIOS[name]
+    lease = leases.acquire(safe_username, name, context)
+    if not lease['acquired']:
+        return leases.busy_response(lease)
+    try:
+        instance_id, command_id = run_on_user_instance(
+            client('ec2'), safe_username,
+            lambda iid: send_command(
+                client('ssm'), iid, scenario['command'],
+                timeout_seconds=scenario['timeout_seconds'],
+                comment=comment,
+                notify=True
+            ),
+            instance_id=instance_id
+        )
+
+        if not instance_id:
+            return {
+                'success': False,
+                'error': f'No running instance found for user: {safe_username}'
+            }
+
+        leases.hand_over(lease, command_id, scenario['timeout_seconds'])
+    finally:
+        leases.release(lease)
+
+    return {
+        'success': True,
+        'status': 'dispatched',
+        'instance_id': instance_id,
+        'username': safe_username,
+        'command_id': command_id,
+        **({'incident_id': incident_id} if incident_id else {}),
+        'message': 'Command sent. The result will be posted to the n8n callback when it finishes.'
+    }
+
+
+def async_comment(name, safe_username, incident_id=None, cohort=None):
+    comment = f"{ASYNC_COMMENT_PREFIX}:{name}:{safe_username}"
+    if cohort and cohort != incidents.WORKSHOP_TAG:
+        return f"{comment}:{incident_id or ''}:{cohort}"
+    return f"{comment}:{incident_id}" if incident_id else comment
+
+
+def parse_async_comment(comment):
+    """
+    (scenario name, username, incident ID or None, cohort) from an
+    event-driven command's comment, or None. The cohort is only written when
+    it isn't the default one.
+    """
+    parts = (comment or '').split(':', 4)
+    if len(parts) < 3 or parts[0] != ASYNC_COMMENT_PREFIX or parts[1] not in SCENARIOS:
+        return None
+    incident_id = parts[3] if len(parts) >= 4 and parts[3] else None
+    cohort = parts[4] if len(parts) == 5 and parts[4] else incidents.WORKSHOP_TAG
+    return parts[1], parts[2], incident_id, cohort
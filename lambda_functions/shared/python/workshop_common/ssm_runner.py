@@ -0,0 +1,171 @@
+import os
+import time
+from botocore.exceptions import ClientError
+
+from workshop_common import metrics
+
+TERMINAL_STATUSES = ['Success', 'Failed', 'Cancelled', 'TimedOut']
+
+# Poll quickly at first so fast commands (pkill, rm) return in well under a
+# second, then back off towards MAX_POLL_DELAY for long-running ones
+FIRST_POLL_DELAY = 0.2
+POLL_BACKOFF = 1.6
+MAX_POLL_DELAY = 2.0
+
+# Stop polling this long before the Lambda deadline so there is time to
+# build and return a resumable response
+DEADLINE_MARGIN_MS = 3000
+
+# SNS topic SSM reports command completion to, and the role it assumes to
+# publish there (see handlers/command_complete.py)
+COMMAND_TOPIC_ARN = os.environ.get('COMMAND_TOPIC_ARN')
+COMMAND_NOTIFY_ROLE_ARN = os.environ.get('COMMAND_NOTIFY_ROLE_ARN')
+NOTIFY_STATUSES = ['Success', 'Failed', 'Cancelled', 'TimedOut']
+
+
+def run_command(ssm, instance_id, command, context=None, timeout_seconds=60,
+                max_wait_seconds=None, command_id=None, comment=None):
+    """
+    Run a shell command on an instance with AWS-RunShellScript and wait for it.
+
+    Polling starts after FIRST_POLL_DELAY and backs off geometrically. It stops
+    early when the Lambda's remaining time (from context) or max_wait_seconds
+    runs out. In that case the result has resumable=True, and passing its
+    command_id back in resumes polling instead of sending the command again.
+
+    Returns: {
+        "status": "Success" | "Failed" | "Cancelled" | "TimedOut" | "InProgress" | ...,
+        "resumable": false,
+        "command_id": "...",
+        "stdout": "...",
+        "stderr": "...",
+        "polls": 3,
+        "timings": {"dispatch_ms": 120, "poll_ms": 640, "total_ms": 760}
+    }
+    """
+    started = time.monotonic()
+
+    if command_id:
+        print(f"Resuming SSM command {command_id} on instance {instance_id}")
+    else:
+        command_id = send_command(ssm, instance_id, command, timeout_seconds, comment)
+
+    dispatched = time.monotonic()
+    result = poll_invocation(ssm, command_id, instance_id, context, max_wait_seconds)
+    finished = time.monotonic()
+
+    result['timings'] = {
+        'dispatch_ms': int((dispatched - started) * 1000),
+        'poll_ms': int((finished - dispatched) * 1000),
+        'total_ms': int((finished - started) * 1000)
+    }
+    metrics.add_phase('dispatch', (dispatched - started) * 1000)
+    metrics.add_phase('poll', (finished - dispatched) * 1000)
+    metrics.count('PollIterations', result['polls'])
+    return result
+
+
+def send_command(ssm, instance_id, command, timeout_seconds=60, comment=None, notify=False):
+    """
+    Send a shell command to one instance with AWS-RunShellScript; returns the command ID.
+
+    notify=True has SSM publish the invocation's final status to
+    COMMAND_TOPIC_ARN, so nothing needs to poll for it.
+    """
+    print(f"Sending SSM command to instance {instance_id}: {command}")
+    params = {
+        'InstanceIds': [instance_id],
+        'DocumentName': 'AWS-RunShellScript',
+        'Parameters': {'commands': [command]},
+        'TimeoutSeconds': timeout_seconds
+    }
+    if comment:
+        params['Comment'] = comment[:100]
+    if notify:
+        params['ServiceRoleArn'] = COMMAND_NOTIFY_ROLE_ARN
+        params['NotificationConfig'] = {
+            'NotificationArn': COMMAND_TOPIC_ARN,
+            'NotificationEvents': NOTIFY_STATUSES,
+            'NotificationType': 'Invocation'
+        }
+    ssm_response = ssm.send_command(**params)
+    return ssm_response['Command']['CommandId']
+
+
+def poll_invocation(ssm, command_id, instance_id, context=None, max_wait_seconds=None):
+    """Poll get_command_invocation with adaptive backoff until terminal or out of time."""
+    started = time.monotonic()
+    delay = FIRST_POLL_DELAY
+    polls = 0
+    status = 'Pending'
+
+    while True:
+        if not has_time_for(delay, started, context, max_wait_seconds):
+            print(f"Out of time after {polls} poll(s); command {command_id} is {status}")
+            return {
+                'status': status,
+                'resumable': True,
+                'command_id': command_id,
+                'stdout': '',
+                'stderr': '',
+                'polls': polls
+            }
+
+        time.sleep(delay)
+        delay = min(delay * POLL_BACKOFF, MAX_POLL_DELAY)
+        polls += 1
+
+        try:
+            result = ssm.get_command_invocation(
+                CommandId=command_id,
+                InstanceId=instance_id
+            )
+        except ClientError as e:
+            # The invocation is not visible for a moment after send_command
+            if 'InvocationDoesNotExist' in str(e):
+                continue
+            raise
+
+        status = result['Status']
+        print(f"Command status: {status}")
+
+        if status in TERMINAL_STATUSES:
+            return {
+                'status': status,
+                'resumable': False,
+                'command_id': command_id,
+                'stdout': result.get('StandardOutputContent', ''),
+                'stderr': result.get('StandardErrorContent', ''),
+                'polls': polls
+            }
+
+
+def has_time_for(delay, started, context, max_wait_seconds, reserve_seconds=0):
+    """
+    True if waiting `delay` more seconds stays within max_wait_seconds of
+    `started` and leaves DEADLINE_MARGIN_MS, plus reserve_seconds for work
+    still to come after the wait, before the Lambda deadline.
+    """
+    if max_wait_seconds is not None and time.monotonic() - started + delay > max_wait_seconds:
+        return False
+    if context is not None:
+        remaining_ms = context.get_remaining_time_in_millis()
+        if remaining_ms - (delay + reserve_seconds) * 1000 < DEADLINE_MARGIN_MS:
+            return False
+    return True
+
+
+def still_running_response(result, instance_id, username):
+    """Handler response for a command that outlived this invocation's time budget."""
+    return {
+        'success': False,
+        'in_progress': True,
+        'instance_id': instance_id,
+        'username': username,
+        'command_id': result['command_id'],
+        'timings': result['timings'],
+        'message': (
+            f"Command still running, command_id={result['command_id']}. "
+            "Call again with this command_id to resume waiting."
+        )
+    }
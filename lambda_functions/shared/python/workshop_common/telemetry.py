@@ -0,0 +1,55 @@
+import re
+
+from botocore.exceptions import ClientError
+
+from workshop_common.clients import client
+from workshop_common.launch import TELEMETRY_MODE, disk_dimensions
+
+# Use% column of `df -h /`, e.g. "/dev/nvme0n1p1   30G   26G  4.1G  87% /"
+DF_USE_PERCENT = re.compile(r'\s(\d{1,3})%\s+/\s*$', re.MULTILINE)
+
+
+def disk_used_percent(df_output):
+    """Root filesystem usage from `df -h /` output, or None if it can't be parsed."""
+    match = DF_USE_PERCENT.search(df_output or '')
+    return float(match.group(1)) if match else None
+
+
+def publish_disk_datapoint(instance_id, df_output):
+    """
+    Publish the disk usage a scenario just measured as a high-resolution
+    disk_used_percent datapoint, under the dimensions the agent and the disk
+    alarm use. The alarm then sees the change without waiting for the agent's
+    next flush. Only in low_latency telemetry mode; failures are logged and
+    never fail the scenario.
+    """
+    if TELEMETRY_MODE != 'low_latency':
+        return
+    percent = disk_used_percent(df_output)
+    if percent is None:
+        return
+    try:
+        client('cloudwatch').put_metric_data(
+            Namespace='Workshop',
+            MetricData=[{
+                'MetricName': 'disk_used_percent',
+                'Dimensions': disk_dimensions(instance_id),
+                'Value': percent,
+                'Unit': 'Percent',
+                'StorageResolution': 1
+            }]
+        )
+    except ClientError as e:
+        print(f"Could not publish disk datapoint for {instance_id}: {e}")
+
+
+def publishing_disk_status(interpret):
+    """Wrap a scenario's interpret() to publish the disk_status it reports."""
+
+    def wrapper(result, instance_id, username):
+        response = interpret(result, instance_id, username)
+        if response.get('disk_status'):
+            publish_disk_datapoint(instance_id, response['disk_status'])
+        return response
+
+    return wrapper
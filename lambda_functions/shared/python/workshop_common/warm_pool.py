@@ -0,0 +1,403 @@
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+from workshop_common.clients import client
+from workshop_common.instance_index import record_instance
+from workshop_common.launch import (
+    create_alarms, disk_dimensions, instance_placement, launch_instances, workshop_tags, WORKSHOP_TAG
+)
+
+# DynamoDB table tracking pool instances: {instance_id, status, launched_at}
+# where status is "warming" (booting) or "available" (agent reporting metrics)
+WARM_POOL_TABLE = os.environ.get('WARM_POOL_TABLE')
+WARM_POOL_SIZE = int(os.environ.get('WARM_POOL_SIZE', '0'))
+
+# Cap launches per refill so a single refill stays well inside the Lambda timeout
+WARM_POOL_MAX_LAUNCH = int(os.environ.get('WARM_POOL_MAX_LAUNCH', '20'))
+
+# Pool instances that never start reporting metrics are replaced after this long
+WARM_POOL_WARMING_TIMEOUT = 900
+
+# Unassigned pool instances carry this tag instead of "workshop", so bulk
+# scenario commands targeting tag:workshop never hit them
+POOL_TAG = 'workshop-pool'
+
+REFILL_LOCK_ID = '#refill-lock'
+REFILL_LOCK_SECONDS = 120
+
+# Written by cohort teardown so the refill schedule doesn't relaunch the pool
+# after end-of-day cleanup; a refill with "enable": true removes it
+DISABLED_ID = '#disabled'
+
+# batch_write_item takes up to 25 requests
+DELETE_BATCH_SIZE = 25
+
+
+def claim_instance(safe_username):
+    """
+    Claim an available pool instance for a user.
+
+    The claim is a conditional DynamoDB update (status available -> claimed),
+    so concurrent provisions can never take the same instance. The winner
+    re-tags the instance for the user, creates its alarms and indexes it.
+    Returns {"instance_id", "public_ip", "alarm_names"} or None if the pool is empty.
+    """
+    if not WARM_POOL_TABLE:
+        return None
+
+    candidates = [item for item in _pool_items() if item['status'] == 'available']
+    # Spread concurrent claimers over different candidates to reduce conflicts
+    random.shuffle(candidates)
+
+    for item in candidates:
+        instance_id = item['instance_id']
+        try:
+            client('dynamodb').update_item(
+                TableName=WARM_POOL_TABLE,
+                Key={'instance_id': {'S': instance_id}},
+                UpdateExpression='SET #status = :claimed, username = :username, claimed_at = :now',
+                ConditionExpression='#status = :available',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':claimed': {'S': 'claimed'},
+                    ':available': {'S': 'available'},
+                    ':username': {'S': safe_username},
+                    ':now': {'N': str(int(time.time()))}
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                continue
+            raise
+
+        print(f"Claimed pool instance {instance_id} for {safe_username}")
+        try:
+            claimed = _assign(instance_id, safe_username)
+        except ClientError as e:
+            print(f"Error assigning pool instance {instance_id}: {e}")
+            claimed = None
+
+        _delete_item(instance_id)
+        if claimed:
+            return claimed
+
+        # The instance died or could not be re-tagged; don't leave it running
+        try:
+            client('ec2').terminate_instances(InstanceIds=[instance_id])
+        except ClientError as e:
+            print(f"Error terminating pool instance {instance_id}: {e}")
+
+    return None
+
+
+def _assign(instance_id, safe_username):
+    response = client('ec2').describe_instances(InstanceIds=[instance_id])
+    instance = response['Reservations'][0]['Instances'][0]
+    if instance['State']['Name'] != 'running':
+        print(f"Pool instance {instance_id} is {instance['State']['Name']}")
+        return None
+
+    instance_name = f"workshop-{safe_username}"
+    client('ec2').create_tags(Resources=[instance_id], Tags=workshop_tags(safe_username, instance_name))
+    volume_ids = [m['Ebs']['VolumeId'] for m in instance.get('BlockDeviceMappings', []) if 'Ebs' in m]
+    if volume_ids:
+        client('ec2').create_tags(Resources=volume_ids, Tags=workshop_tags(safe_username, f"{instance_name}-volume"))
+    # No longer a pool instance: pool accounting and teardown filter on this tag
+    client('ec2').delete_tags(Resources=[instance_id, *volume_ids], Tags=[{'Key': POOL_TAG}])
+
+    alarm_names = create_alarms(instance_id, safe_username)
+    record_instance(safe_username, instance_id)
+
+    tags = {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+    return {
+        'instance_id': instance_id,
+        'public_ip': instance.get('PublicIpAddress', 'No public IP assigned'),
+        'profile': tags.get('workshop-profile'),
+        'instance_type': instance.get('InstanceType'),
+        **instance_placement(instance),
+        'alarm_names': alarm_names
+    }
+
+
+def trigger_refill(context):
+    """
+    Ask this function to refill the pool asynchronously after a claim. The
+    payload names the action so it also works when invoked via the dispatcher.
+    """
+    if not WARM_POOL_TABLE or context is None:
+        return
+    try:
+        client('lambda').invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps({'action': 'provision', 'mode': 'pool_refill'})
+        )
+    except ClientError as e:
+        # The scheduled refill will catch up
+        print(f"Could not trigger pool refill: {e}")
+
+
+def refill_pool(context=None, enable=False):
+    """
+    Bring the pool back to WARM_POOL_SIZE.
+
+    Promotes warming instances that have started reporting disk metrics to
+    available, drops entries whose instance has gone away, replaces instances
+    stuck warming, and launches enough new instances to cover the deficit.
+    Launches nothing while the pool is disabled (see disable_pool) unless
+    `enable` turns it back on.
+    """
+    if not WARM_POOL_TABLE:
+        return {'success': False, 'error': 'Warm pool is not configured (WARM_POOL_TABLE unset)'}
+
+    if enable:
+        _delete_item(DISABLED_ID)
+        print("Warm pool enabled")
+
+    if not _acquire_refill_lock():
+        return {'success': True, 'message': 'Another refill is already running'}
+
+    try:
+        items = _pool_items()
+        states = _instance_states([item['instance_id'] for item in items])
+        now = int(time.time())
+
+        warming = []
+        live = []
+        removed = 0
+        for item in items:
+            instance_id = item['instance_id']
+            if states.get(instance_id) not in ('pending', 'running'):
+                _delete_item(instance_id)
+                removed += 1
+            elif item['status'] == 'warming' and now - item['launched_at'] > WARM_POOL_WARMING_TIMEOUT:
+                print(f"Pool instance {instance_id} never became ready; replacing it")
+                client('ec2').terminate_instances(InstanceIds=[instance_id])
+                _delete_item(instance_id)
+                removed += 1
+            else:
+                live.append(item)
+                if item['status'] == 'warming':
+                    warming.append(instance_id)
+
+        promoted = 0
+        for instance_id in _reporting_metrics(warming):
+            try:
+                client('dynamodb').update_item(
+                    TableName=WARM_POOL_TABLE,
+                    Key={'instance_id': {'S': instance_id}},
+                    UpdateExpression='SET #status = :available',
+                    ConditionExpression='#status = :warming',
+                    ExpressionAttributeNames={'#status': 'status'},
+                    ExpressionAttributeValues={
+                        ':available': {'S': 'available'},
+                        ':warming': {'S': 'warming'}
+                    }
+                )
+                promoted += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+
+        deficit = min(max(WARM_POOL_SIZE - len(live), 0), WARM_POOL_MAX_LAUNCH)
+        launched = []
+        # Checked right before launching, so a teardown that disabled the
+        # pool while this refill was running still stops it
+        disabled = bool(deficit) and _is_disabled()
+        if disabled:
+            print("Warm pool is disabled; not launching")
+        elif deficit:
+            pool_tags = [
+                {'Key': 'Name', 'Value': 'workshop-pool'},
+                {'Key': POOL_TAG, 'Value': WORKSHOP_TAG}
+            ]
+            instances = launch_instances(deficit, [
+                {'ResourceType': 'instance', 'Tags': pool_tags},
+                {'ResourceType': 'volume', 'Tags': pool_tags}
+            ])
+            launched = [i['InstanceId'] for i in instances]
+            for instance_id in launched:
+                client('dynamodb').put_item(
+                    TableName=WARM_POOL_TABLE,
+                    Item={
+                        'instance_id': {'S': instance_id},
+                        'status': {'S': 'warming'},
+                        'launched_at': {'N': str(now)}
+                    }
+                )
+            print(f"Launched {len(launched)} pool instance(s): {launched}")
+
+        available = sum(1 for item in live if item['status'] == 'available') + promoted
+        return {
+            'success': True,
+            'target_size': WARM_POOL_SIZE,
+            'available': available,
+            'warming': len(live) - available + len(launched),
+            'promoted': promoted,
+            'launched': launched,
+            'removed': removed,
+            'disabled': disabled,
+            'message': (
+                'Warm pool is disabled by cohort teardown; refill with "enable": true to turn it back on'
+                if disabled else f"Warm pool has {available} available of {WARM_POOL_SIZE} target"
+            )
+        }
+    finally:
+        _release_refill_lock()
+
+
+def disable_pool():
+    """
+    Stop refills from launching and drop every pool entry (cohort teardown
+    terminates the instances). Returns the number of entries deleted.
+    """
+    if not WARM_POOL_TABLE:
+        return 0
+
+    client('dynamodb').put_item(
+        TableName=WARM_POOL_TABLE,
+        Item={'instance_id': {'S': DISABLED_ID}, 'disabled_at': {'N': str(int(time.time()))}}
+    )
+    keys = []
+    paginator = client('dynamodb').get_paginator('scan')
+    for page in paginator.paginate(TableName=WARM_POOL_TABLE, ProjectionExpression='instance_id'):
+        keys.extend(
+            item['instance_id']['S'] for item in page['Items']
+            if item['instance_id']['S'] not in (DISABLED_ID, REFILL_LOCK_ID)
+        )
+
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        requests = [
+            {'DeleteRequest': {'Key': {'instance_id': {'S': instance_id}}}}
+            for instance_id in keys[start:start + DELETE_BATCH_SIZE]
+        ]
+        while requests:
+            response = client('dynamodb').batch_write_item(RequestItems={WARM_POOL_TABLE: requests})
+            requests = response.get('UnprocessedItems', {}).get(WARM_POOL_TABLE, [])
+    print(f"Warm pool disabled; deleted {len(keys)} pool entr{'y' if len(keys) == 1 else 'ies'}")
+    return len(keys)
+
+
+def _is_disabled():
+    item = client('dynamodb').get_item(
+        TableName=WARM_POOL_TABLE, Key={'instance_id': {'S': DISABLED_ID}}, ConsistentRead=True
+    )
+    return 'Item' in item
+
+
+def _pool_items():
+    items = []
+    paginator = client('dynamodb').get_paginator('scan')
+    pages = paginator.paginate(
+        TableName=WARM_POOL_TABLE,
+        FilterExpression='#status IN (:warming, :available)',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={
+            ':warming': {'S': 'warming'},
+            ':available': {'S': 'available'}
+        }
+    )
+    for page in pages:
+        for item in page['Items']:
+            items.append({
+                'instance_id': item['instance_id']['S'],
+                'status': item['status']['S'],
+                'launched_at': int(item.get('launched_at', {}).get('N', '0'))
+            })
+    return items
+
+
+def _instance_states(instance_ids):
+    states = {}
+    for start in range(0, len(instance_ids), 1000):
+        try:
+            response = client('ec2').describe_instances(InstanceIds=instance_ids[start:start + 1000])
+        except ClientError as e:
+            # One unknown ID fails the whole call; fall back to one at a time
+            if 'InvalidInstanceID' not in str(e):
+                raise
+            for instance_id in instance_ids[start:start + 1000]:
+                states.update(_instance_states_one(instance_id))
+            continue
+        for reservation in response['Reservations']:
+            for instance in reservation['Instances']:
+                states[instance['InstanceId']] = instance['State']['Name']
+    return states
+
+
+def _instance_states_one(instance_id):
+    try:
+        response = client('ec2').describe_instances(InstanceIds=[instance_id])
+    except ClientError:
+        return {}
+    return {
+        instance['InstanceId']: instance['State']['Name']
+        for reservation in response['Reservations']
+        for instance in reservation['Instances']
+    }
+
+
+def _reporting_metrics(instance_ids):
+    """Return the instances that published disk_used_percent in the last 5 minutes."""
+    reporting = []
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(minutes=5)
+    # get_metric_data takes up to 500 queries per request
+    for offset in range(0, len(instance_ids), 500):
+        batch = instance_ids[offset:offset + 500]
+        queries = [
+            {
+                'Id': f'm{n}',
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'Workshop',
+                        'MetricName': 'disk_used_percent',
+                        'Dimensions': disk_dimensions(instance_id)
+                    },
+                    'Period': 60,
+                    'Stat': 'Maximum'
+                },
+                'ReturnData': True
+            }
+            for n, instance_id in enumerate(batch)
+        ]
+        response = client('cloudwatch').get_metric_data(MetricDataQueries=queries, StartTime=start, EndTime=end)
+        for result in response['MetricDataResults']:
+            if result['Values']:
+                reporting.append(batch[int(result['Id'][1:])])
+    return reporting
+
+
+def _delete_item(instance_id):
+    client('dynamodb').delete_item(TableName=WARM_POOL_TABLE, Key={'instance_id': {'S': instance_id}})
+
+
+def _acquire_refill_lock():
+    now = int(time.time())
+    try:
+        client('dynamodb').put_item(
+            TableName=WARM_POOL_TABLE,
+            Item={
+                'instance_id': {'S': REFILL_LOCK_ID},
+                'expires_at': {'N': str(now + REFILL_LOCK_SECONDS)}
+            },
+            ConditionExpression='attribute_not_exists(instance_id) OR expires_at < :now',
+            ExpressionAttributeValues={':now': {'N': str(now)}}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+
+def _release_refill_lock():
+    try:
+        _delete_item(REFILL_LOCK_ID)
+    except ClientError as e:
+        print(f"Error releasing refill lock: {e}")
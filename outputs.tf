@@ -87,6 +87,26 @@ output "lambda_fix_corrupt_disk_name" {
   value       = aws_lambda_function.fix_corrupt_disk.function_name
 }
 
+output "lambda_dispatcher_arn" {
+  description = "ARN of the dispatcher Lambda function (routes on the action field)"
+  value       = aws_lambda_function.dispatcher.arn
+}
+
+output "lambda_dispatcher_name" {
+  description = "Name of the dispatcher Lambda function"
+  value       = aws_lambda_function.dispatcher.function_name
+}
+
+output "lambda_command_complete_name" {
+  description = "Name of the Lambda function that posts event-driven SSM command results to n8n"
+  value       = aws_lambda_function.command_complete.function_name
+}
+
+output "command_events_topic_arn" {
+  description = "SNS topic SSM notifies when an event-driven command finishes"
+  value       = aws_sns_topic.command_events.arn
+}
+
 output "security_group_id" {
   description = "Security group ID for workshop EC2 instances"
   value       = aws_security_group.workshop.id
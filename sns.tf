@@ -32,3 +32,32 @@ resource "aws_sns_topic_policy" "workshop_alerts" {
     ]
   })
 }
+
+# -----------------------------------------------------------------------------
+# SNS Topic for SSM Command Completion
+# Commands sent with "wait": false notify this topic when they finish; the
+# command_complete Lambda interprets them and posts the result to n8n
+# -----------------------------------------------------------------------------
+
+resource "aws_sns_topic" "command_events" {
+  name = "${var.project_name}-command-events"
+
+  tags = {
+    Name    = "${var.project_name}-command-events"
+    Project = var.project_name
+  }
+}
+
+resource "aws_sns_topic_subscription" "command_complete" {
+  topic_arn = aws_sns_topic.command_events.arn
+  protocol  = "lambda"
+  endpoint  = aws_lambda_function.command_complete.arn
+}
+
+resource "aws_lambda_permission" "command_complete" {
+  statement_id  = "AllowCommandEventsTopic"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.command_complete.function_name
+  principal     = "sns.amazonaws.com"
+  source_arn    = aws_sns_topic.command_events.arn
+}
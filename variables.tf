@@ -25,10 +25,33 @@ variable "subnet_id" {
   type        = string
 }
 
+variable "subnet_ids" {
+  description = "Public subnets, ideally in several AZs, to spread instances over by free addresses and capacity (empty = subnet_id only)"
+  type        = list(string)
+  default     = []
+}
+
+variable "provision_profile" {
+  description = "Default provisioning profile: standard (t3 burstable, standard credits), unlimited (t3, unlimited credits), arm64 (t4g, unlimited credits) or fixed (non-burstable c6i/c5/m6i)"
+  type        = string
+  default     = "standard"
+
+  validation {
+    condition     = contains(["standard", "unlimited", "arm64", "fixed"], var.provision_profile)
+    error_message = "provision_profile must be \"standard\", \"unlimited\", \"arm64\" or \"fixed\"."
+  }
+}
+
 variable "instance_type" {
-  description = "EC2 instance type"
+  description = "EC2 instance type tried before the default profile's own fallback list (empty = the profile's list only)"
   type        = string
-  default     = "t3.micro"
+  default     = ""
+}
+
+variable "ami_id_arm64" {
+  description = "Amazon Linux 2023 arm64 AMI ID, required for the arm64 profile (empty = arm64 disabled)"
+  type        = string
+  default     = ""
 }
 
 variable "disk_threshold_percent" {
@@ -42,3 +65,43 @@ variable "alarm_period_seconds" {
   type        = number
   default     = 10
 }
+
+variable "telemetry_mode" {
+  description = "standard (10 s collection, agent's default 60 s flush) or low_latency (1 s collection, 5 s flush, scenario handlers publish disk usage directly)"
+  type        = string
+  default     = "standard"
+
+  validation {
+    condition     = contains(["standard", "low_latency"], var.telemetry_mode)
+    error_message = "telemetry_mode must be \"standard\" or \"low_latency\"."
+  }
+}
+
+variable "alarm_mode" {
+  description = "per_user (a disk and a CPU alarm per instance) or fleet (one Metrics Insights alarm per metric for the whole cohort, 60 s periods)"
+  type        = string
+  default     = "per_user"
+
+  validation {
+    condition     = contains(["per_user", "fleet"], var.alarm_mode)
+    error_message = "alarm_mode must be \"per_user\" or \"fleet\"."
+  }
+}
+
+variable "n8n_callback_url" {
+  description = "n8n webhook URL that receives the results of event-driven SSM commands (empty = log only)"
+  type        = string
+  default     = ""
+}
+
+variable "warm_pool_size" {
+  description = "Number of pre-booted, agent-ready instances to keep ready for provision (0 disables the pool)"
+  type        = number
+  default     = 0
+}
+
+variable "chaos_agent" {
+  description = "Install the chaos agent on new instances and send scenarios to it over SQS instead of SSM while it is healthy"
+  type        = bool
+  default     = false
+}